@@ -8,21 +8,46 @@
 
 import os
 import sys
+import copy
 import platform
+import threading
 import pkg_resources
 from setuptools.extension import Extension as DistutilsExtension
 from setuptools.command.build_ext import build_ext as _build_ext
 import distutils.sysconfig
+import distutils.log
+import distutils.errors
+from distutils.dep_util import newer_group
 
 from pkg_resources import resource_filename
 
 from .pkgconfig import pkgconfig
 from .boost import boost
-from .utils import uniq, uniq_paths, find_executable, find_library
-from .cmake import CMakeListsGenerator
+from .utils import uniq, uniq_paths, find_executable, find_program, find_library, \
+    probe_environment, probe_statistics
+from .cmake import CMakeListsGenerator, CMakeSuperbuildGenerator, CMakeBuildError, supports_jobserver, is_ninja, SUPERBUILD_NAME, GENERATORS, cached_generator, clean_build_directory, configure_stamp, is_configured, set_configured
+from .cache import ObjectCache
+from .depends import DependencyDatabase, DATABASE_NAME
+from . import scheduler
+from . import unity
+from . import pgo
+from . import lto
+from . import isa
+from . import telemetry
+from .telemetry import build_telemetry
+from .includes import IncludeAnalyzer, REPORT_NAME as INCLUDES_REPORT
+from .pch import PrecompiledHeaders, DIRECTORY_NAME as PCH_DIRECTORY
 
 __version__ = pkg_resources.require(__name__)[0].version
 
+_version_comparisons = {
+    '>': lambda p, v: p > v,
+    '>=': lambda p, v: p >= v,
+    '<': lambda p, v: p < v,
+    '<=': lambda p, v: p <= v,
+    '==': lambda p, v: p == v,
+    }
+
 def check_packages(packages):
   """Checks if the requirements for the given packages are satisfied.
 
@@ -39,44 +64,70 @@ def check_packages(packages):
   number. Comparisons are done using :py:mod:`distutils.version.LooseVersion`.
   You can use other comparators such as ``<``, ``<=``, ``>=`` or ``==``. If no
   version number is given, then we only require that the package is installed.
+
+  All packages are resolved at once, in parallel threads, and the problems
+  found for all of them are reported together in a single error.
   """
 
   from re import split
 
-  used = set()
-  retval = []
-
+  requirements = []
   for requirement in uniq(packages):
 
     splitreq = split(r'\s*(?P<cmp>[<>=]+)\s*', requirement)
 
-    if len(splitreq) not in (1, 3):
+    if len(splitreq) not in (1, 3) or (len(splitreq) == 3 and splitreq[1] not in _version_comparisons):
 
-      raise RuntimeError("cannot parse requirement `%s'", requirement)
+      raise RuntimeError("cannot parse requirement `%s'" % requirement)
+
+    requirements.append(splitreq)
+
+  # resolves all packages in parallel
+  def _resolve(name):
+    try:
+      return pkgconfig(name)
+    except RuntimeError as e:
+      return e
+
+  names = uniq([k[0] for k in requirements])
+  if len(names) > 1:
+    import multiprocessing.pool
+    pool = multiprocessing.pool.ThreadPool(len(names))
+    try:
+      resolved = dict(zip(names, pool.map(_resolve, names)))
+    finally:
+      pool.close()
+      pool.join()
+  else:
+    resolved = dict((name, _resolve(name)) for name in names)
+
+  used = set()
+  retval = []
+  errors = []
+
+  for splitreq in requirements:
 
-    p = pkgconfig(splitreq[0])
+    p = resolved[splitreq[0]]
+
+    if isinstance(p, Exception):
+      errors.append(str(p))
+      continue
 
     if len(splitreq) == 3: # package + version number
 
-      if splitreq[1] == '>':
-        assert p > splitreq[2], "%s version is not > `%s'" % (p.name, splitreq[2])
-      elif splitreq[1] == '>=':
-        assert p >= splitreq[2], "%s version is not >= `%s'" % (p.name, splitreq[2])
-      elif splitreq[1] == '<':
-        assert p < splitreq[2], "%s version is not < `%s'" % (p, splitreq[2])
-      elif splitreq[1] == '<=':
-        assert p <= splitreq[2], "%s version is not <= `%s'" % (p, splitreq[2])
-      elif splitreq[1] == '==':
-        assert p <= splitreq[2], "%s version is not == `%s'" % (p, splitreq[2])
-      else:
-        raise RuntimeError("cannot parse requirement `%s'", requirement)
+      if not _version_comparisons[splitreq[1]](p, splitreq[2]):
+        errors.append("%s version is not %s `%s'" % (p.name, splitreq[1], splitreq[2]))
+        continue
 
     retval.append(p)
 
     if p.name in used:
-      raise RuntimeError("package `%s' had already been requested - cannot (currently) handle recurring requirements")
+      errors.append("package `%s' had already been requested - cannot (currently) handle recurring requirements" % p.name)
     used.add(p.name)
 
+  if errors:
+    raise RuntimeError("unsatisfied package requirements:\n  " + "\n  ".join(uniq(errors)))
+
   return retval
 
 def generate_self_macros(extname, version):
@@ -170,9 +221,143 @@ def normalize_requirements(requirements):
   return leftovers
 
 
+_manifest_name = 'bob_extension.json'
+
+def _package_directory(package):
+  """Returns the directory of the given package without importing it, or
+  ``None`` if it cannot be located this way (e.g., on Python 2)"""
+
+  try:
+    from importlib.util import find_spec
+  except ImportError:
+    return None
+
+  try:
+    spec = find_spec(package)
+  except (ImportError, ValueError):
+    return None
+
+  if spec is None or not spec.origin or not spec.has_location:
+    return None
+  return os.path.dirname(spec.origin)
+
+def _read_manifest(location):
+  """Reads the manifest written by :py:class:`build_ext` into the given
+  package directory, or returns ``None`` if there is none"""
+
+  import json
+  try:
+    with open(os.path.join(location, _manifest_name)) as f:
+      return json.load(f)
+  except (IOError, OSError, ValueError):
+    return None
+
+def _defines_function(filename, name):
+  """Checks, without importing it, if the given Python file defines or
+  imports a top-level function with the given name; returns ``True`` if the
+  file cannot be parsed"""
+
+  import ast
+  try:
+    with open(filename) as f:
+      tree = ast.parse(f.read(), filename)
+  except (IOError, OSError, SyntaxError, ValueError):
+    return True
+
+  for node in tree.body:
+    if isinstance(node, ast.FunctionDef) and node.name == name: return True
+    if isinstance(node, (ast.Import, ast.ImportFrom)) and any((k.asname or k.name) == name for k in node.names): return True
+    if isinstance(node, ast.Assign) and any(isinstance(k, ast.Name) and k.id == name for k in node.targets): return True
+  return False
+
+# Prints the include directories returned by get_include_directories() of a
+# package, and the directories of the top-level packages imported by it
+_include_directories_script = """
+import sys, json, importlib
+sys.path.insert(0, sys.argv[1])
+package = importlib.import_module(sys.argv[2])
+modules = dict((k, list(m.__path__)) for k, m in list(sys.modules.items()) if '.' not in k and getattr(m, '__path__', None))
+json.dump({'file': package.__file__, 'include_directories': list(package.get_include_directories()), 'modules': modules}, sys.stdout)
+"""
+
+def _relocatable_directory(directory, modules):
+  """Describes the given directory relative to the directory of one of the
+  given top-level ``modules``, or to :py:data:`sys.prefix`, so that it can be
+  found again when the package or the environment was moved"""
+
+  directory = os.path.normpath(directory)
+  matches = [(len(k), name, k) for name, locations in modules.items() for k in locations if directory == k or directory.startswith(os.path.join(k, ''))]
+  if matches:
+    _, name, location = max(matches)
+    return {'module': name, 'path': os.path.relpath(directory, location)}
+  if directory.startswith(os.path.join(sys.prefix, '')):
+    return {'prefix': os.path.relpath(directory, sys.prefix)}
+  return {'path': directory}
+
+def _resolve_directory(entry):
+  """Returns the directory described by :py:func:`_relocatable_directory`,
+  or ``None`` if it does not exist; modules are located with
+  :py:func:`importlib.util.find_spec`, without importing them"""
+
+  if 'module' in entry:
+    try:
+      from importlib.util import find_spec
+      spec = find_spec(entry['module'])
+    except (ImportError, ValueError):
+      return None
+    locations = spec.submodule_search_locations if spec is not None else None
+    candidates = [os.path.join(k, entry['path']) for k in (locations or [])]
+  elif 'prefix' in entry:
+    candidates = [os.path.join(sys.prefix, entry['prefix'])]
+  else:
+    candidates = [entry['path']]
+  for candidate in candidates:
+    if os.path.isdir(candidate): return candidate
+  return None
+
+def _include_directories(package, root):
+  """Calls ``get_include_directories()`` of the given package, imported from
+  the given directory in a separate process, and returns its results in the
+  form of :py:func:`_relocatable_directory`, or ``None`` if the package
+  cannot be imported from there"""
+
+  import json
+  import subprocess
+  try:
+    with open(os.devnull, 'w') as devnull:
+      output = subprocess.check_output([sys.executable, '-c', _include_directories_script, root, package], stderr=devnull)
+    result = json.loads(output.decode('utf8'))
+  except (OSError, subprocess.CalledProcessError, ValueError):
+    return None
+
+  # the package must not have been found elsewhere, e.g., an older installed version
+  if not os.path.realpath(result['file']).startswith(os.path.join(os.path.realpath(root), '')):
+    return None
+  return [_relocatable_directory(k, result['modules']) for k in result['include_directories']]
+
+def _manifest_include_directories(manifest):
+  """Returns the include directories outside of the package that are
+  recorded in its manifest, or ``None`` if the package needs to be imported
+  to get them"""
+
+  if not manifest.get('get_include_directories', True): return []
+  if manifest.get('include_directories') is None: return None
+  directories = [_resolve_directory(k) for k in manifest['include_directories']]
+  return None if None in directories else directories
+
 def get_bob_libraries(bob_packages):
   """Returns a list of include directories, libraries and library directories
-  for the given bob libraries."""
+  for the given bob libraries.
+
+  Packages are located with :py:func:`importlib.util.find_spec` and their
+  libraries are read from the ``bob_extension.json`` manifest that
+  :py:class:`build_ext` writes next to their extensions. The manifest also
+  keeps the results of their ``get_include_directories()`` function, relative
+  to the modules (e.g., NumPy) or the environment they are in, since these
+  may have been located in a temporary environment when the package was
+  built. Packages are only imported if they have no manifest, or if the
+  recorded directories cannot be found anymore.
+  """
   includes = []
   libraries = []
   library_directories = []
@@ -181,6 +366,19 @@ def get_bob_libraries(bob_packages):
     # TODO: need to handle versions?
     bob_packages = normalize_requirements([k.strip().lower() for k in bob_packages])
     for package in bob_packages:
+      lib_name = package.replace('.', '_')
+      location = _package_directory(package)
+      manifest = _read_manifest(location) if location is not None else None
+      external = _manifest_include_directories(manifest) if manifest is not None else None
+
+      if external is not None:
+        includes.append(os.path.join(location, 'include'))
+        includes.extend(external)
+        if lib_name in manifest['libraries']:
+          libraries.append(lib_name)
+          library_directories.append(location)
+        continue
+
       import importlib
       pkg = importlib.import_module(package)
       location = os.path.dirname(pkg.__file__)
@@ -189,7 +387,6 @@ def get_bob_libraries(bob_packages):
       if hasattr(pkg, 'get_include_directories'):
         includes.extend(pkg.get_include_directories())
 
-      lib_name = package.replace('.', '_')
       libs = find_library(lib_name, prefixes=[location])
       # add the FIRST lib that we found, if any
       if len(libs):
@@ -199,6 +396,131 @@ def get_bob_libraries(bob_packages):
   return includes, libraries, library_directories
 
 
+class _Resolution:
+  """The result of a resolution of :py:class:`ResolutionContext`, which
+  becomes available once ``done`` is set"""
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.failed = False
+    self.result = None
+
+
+class ResolutionContext:
+  """Resolves the dependencies shared by all extensions built in one process
+
+  Every :py:class:`Extension` and :py:class:`Library` looks up its
+  ``bob_packages``, Boost requirements and pkg-config ``packages`` through the
+  module-wide :py:data:`resolution_context`. Identical specifications are
+  resolved only once and the results are reused by all other extensions of
+  the same ``setup.py``. Results are also keyed on the environment returned by
+  :py:func:`bob.extension.utils.probe_environment`, so that changing, e.g.,
+  ``BOB_PREFIX_PATH`` or ``PKG_CONFIG_PATH`` triggers a new resolution.
+
+  The number of lookups that were resolved and reused is kept in the
+  attributes ``misses`` and ``hits``, while the work done to resolve them is
+  counted by :py:data:`bob.extension.utils.probe_statistics`. The time taken
+  by each resolution is recorded by
+  :py:data:`bob.extension.telemetry.build_telemetry`.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.clear()
+
+  def clear(self):
+    """Forgets about all resolved dependencies"""
+    with self._lock:
+      self._results = {}
+      self.hits = 0
+      self.misses = 0
+
+  def _memoize(self, key, function, *args):
+    """Returns the memoized result of ``function(*args)`` for the given key
+
+    The lock is only held to look up and insert results, so that different
+    keys are resolved concurrently. Threads asking for a key that is being
+    resolved wait for that resolution; if it fails, they resolve it again.
+    """
+
+    key = key + (probe_environment(),)
+    with self._lock:
+      pending = self._results.get(key)
+      if pending is None:
+        pending = self._results[key] = _Resolution()
+        resolving = True
+      else:
+        resolving = False
+
+    if not resolving:
+      pending.done.wait()
+      if pending.failed:
+        return self._memoize(key[:-1], function, *args)
+      with self._lock: self.hits += 1
+      return pending.result
+
+    # the record is named after the kind of lookup and what it looks for, not the rest of the key (e.g., PATH)
+    requested = key[1]
+    if isinstance(requested, tuple): requested = ' '.join(requested)
+    name = '%s %s' % (key[0], requested) if requested else key[0]
+    try:
+      with build_telemetry.measure('resolve', name):
+        pending.result = function(*args)
+    except BaseException:
+      # a failed search can be repeated
+      with self._lock:
+        if self._results.get(key) is pending: del self._results[key]
+      pending.failed = True
+      raise
+    finally:
+      pending.done.set()
+    with self._lock: self.misses += 1
+    return pending.result
+
+  def bob_libraries(self, bob_packages):
+    """Returns the result of :py:func:`get_bob_libraries` for the given packages"""
+
+    key = ('bob_libraries', None if bob_packages is None else tuple(bob_packages))
+    return tuple(list(k) for k in self._memoize(key, get_bob_libraries, bob_packages))
+
+  def boost(self, requirement):
+    """Returns the :py:class:`bob.extension.boost` object for the given version
+    requirement"""
+
+    return self._memoize(('boost', requirement), boost, requirement)
+
+  def boost_libraries(self, requirement, modules):
+    """Returns the library directories and libraries for the given Boost
+    modules, see :py:meth:`bob.extension.boost.libconfig`"""
+
+    key = ('boost_libraries', requirement, tuple(modules))
+    libconfig = lambda: self.boost(requirement).libconfig(modules)
+    return tuple(list(k) for k in self._memoize(key, libconfig))
+
+  def packages(self, requirements):
+    """Returns the result of :py:func:`check_packages` for the given
+    requirements"""
+
+    key = ('packages', tuple(requirements))
+    return list(self._memoize(key, check_packages, requirements))
+
+  def executable(self, name):
+    """Returns the result of :py:func:`bob.extension.utils.find_executable`
+    for the given program name"""
+
+    return list(self._memoize(('executable', name), find_executable, name))
+
+  def program(self, name):
+    """Returns the result of :py:func:`bob.extension.utils.find_program` for
+    the given program name"""
+
+    return list(self._memoize(('program', name, os.environ.get('PATH')), find_program, name))
+
+
+#: The dependency resolution shared by all extensions of this process
+resolution_context = ResolutionContext()
+
+
 def get_full_libname(name, path=None, version=None):
   """Generates the name of the library from the given name, path and version."""
   libname = 'lib' + name.replace('.', '_')
@@ -229,18 +551,111 @@ def load_bob_library(name, _file_):
     The ``__file__`` member of the ``__init__.py`` file in which the library is loaded.
   """
 
-  full_libname = get_full_libname(name, os.path.dirname(_file_))
+  directory = os.path.dirname(_file_)
+  full_libname = get_full_libname(name, directory)
+  # the variant for the best micro-architecture level, if built (see bob.extension.isa)
+  for level in isa.supported_levels():
+    variant = get_full_libname(isa.variant_name(name, level), directory)
+    if os.path.exists(variant):
+      full_libname = variant
+      break
   import ctypes
   ctypes.cdll.LoadLibrary(full_libname)
 
 
-class Extension(DistutilsExtension):
+def load_bob_extension(name, _file_):
+  """Imports the python extension with the given name, and returns it.
+  If the extension was built for several micro-architecture levels (see :py:mod:`bob.extension.isa`), the variant for the best level that this CPU supports is imported.
+  Use it in the ``__init__.py`` of the package, e.g., ``load_bob_extension('bob.core._library', __file__)``, before ``from ._library import *``.
+
+  Keyword parameters
+
+  name : string
+    The full name of the extension, e.g. ``bob.core._library``
+
+  _file_ : string
+    The ``__file__`` member of the ``__init__.py`` file of the package containing the extension.
+  """
+
+  import importlib
+  if name in sys.modules:
+    return sys.modules[name]
+
+  if sys.version_info[0] >= 3:
+    import importlib.machinery
+    suffixes = importlib.machinery.EXTENSION_SUFFIXES
+  else:
+    import imp
+    suffixes = [k[0] for k in imp.get_suffixes() if k[2] == imp.C_EXTENSION]
+
+  directory = os.path.dirname(_file_)
+  basename = name.split('.')[-1]
+  for level in isa.supported_levels():
+    for suffix in suffixes:
+      filename = os.path.join(directory, isa.variant_name(basename, level) + suffix)
+      if not os.path.exists(filename): continue
+      # the variant initializes the module under the original name
+      if sys.version_info[0] >= 3:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location(name, filename)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        return module
+      else:
+        return imp.load_dynamic(name, filename)
+
+  return importlib.import_module(name)
+
+
+def _configured_attribute(attribute):
+  """Returns a property of :py:class:`Extension` that is only available after
+  :py:meth:`Extension.configure` was called, which is done on first access
+
+  Values assigned before the configuration took place are used as user input
+  to the configuration, in the same way as the constructor parameters.
+  """
+
+  private = '_' + attribute
+
+  def _get(self):
+    self.configure()
+    return getattr(self, private)
+
+  def _set(self, value):
+    if self.__dict__.get('_configured') is False:
+      self._user_kwargs[attribute] = value
+    setattr(self, private, value)
+
+  return property(_get, _set)
+
+
+class Extension(DistutilsExtension, object):
   """Extension building with pkg-config packages.
 
   See the documentation for :py:class:`distutils.extension.Extension` for more
   details on input parameters.
+
+  The dependencies of the extension are only searched for when one of the
+  compilation parameters (such as ``include_dirs`` or ``libraries``) is
+  accessed for the first time, which usually happens inside
+  :py:class:`build_ext`. Commands that do not compile code (like ``egg_info``
+  or ``sdist``) never pay for the discovery of ``packages``, Boost or
+  ``bob_packages``.
   """
 
+  include_dirs = _configured_attribute('include_dirs')
+  define_macros = _configured_attribute('define_macros')
+  libraries = _configured_attribute('libraries')
+  library_dirs = _configured_attribute('library_dirs')
+  runtime_library_dirs = _configured_attribute('runtime_library_dirs')
+  extra_compile_args = _configured_attribute('extra_compile_args')
+  extra_link_args = _configured_attribute('extra_link_args')
+  pkg_includes = _configured_attribute('pkg_includes')
+  pkg_libraries = _configured_attribute('pkg_libraries')
+  pkg_library_directories = _configured_attribute('pkg_library_directories')
+  pkg_macros = _configured_attribute('pkg_macros')
+
   def __init__(self, name, sources, **kwargs):
     """Initialize the extension with parameters.
 
@@ -267,6 +682,30 @@ class Extension(DistutilsExtension):
       A list of include directories that are not in one of our packages,
       and which should be included with the -isystem compiler option
 
+    unity : bool or float
+      Compiles the sources merged into a few unity (jumbo) batch files, so
+      that the headers they share are parsed only once per batch. ``True``
+      creates one batch per parallel job, and a number gives the batches per
+      job; see :py:func:`bob.extension.unity.batches_per_core`. Unity builds
+      of extensions are disabled by default; only :py:class:`Library`'s use
+      the ``BOB_BUILD_UNITY`` environment variable.
+
+    precompiled_header : string
+      A header (relative to the ``setup.py``) that is included into every C++
+      source with ``-include`` and precompiled once per set of compiler
+      options, see :py:class:`bob.extension.pch.PrecompiledHeaders`. It
+      should contain the heavy includes shared by all sources, such as
+      ``Python.h``, ``bob.blitz/cppapi.h`` or
+      ``bob.extension/documentation.h``.
+
+    isa : bool or [string]
+      Builds the extension once for each of the given x86-64
+      micro-architecture levels (such as ``['v1', 'v3', 'v4']``), or for the
+      levels in the ``BOB_BUILD_ISA`` environment variable if ``True``. The
+      lowest level keeps the name of the extension, and the others are named
+      ``<name>_<level>``; import it with :py:func:`load_bob_extension` to
+      select the best one for the CPU. See :py:mod:`bob.extension.isa`.
+
     """
 
     packages = []
@@ -279,7 +718,7 @@ class Extension(DistutilsExtension):
       del kwargs['packages']
 
     # uniformize packages
-    packages = normalize_requirements([k.strip().lower() for k in packages])
+    self._packages = normalize_requirements([k.strip().lower() for k in packages])
 
     # check if we have bob libraries to link against
     if 'bob_packages' in kwargs:
@@ -288,42 +727,106 @@ class Extension(DistutilsExtension):
     else:
       self.bob_packages = None
 
-    bob_includes, bob_libraries, bob_library_dirs = get_bob_libraries(self.bob_packages)
-
     # system include directories
     if 'system_include_dirs' in kwargs:
-      system_includes = kwargs['system_include_dirs']
+      self._system_include_dirs = kwargs['system_include_dirs']
       del kwargs['system_include_dirs']
     else:
-      system_includes = []
-
-    # Boost requires a special treatment
-    boost_req = ''
-    for i, pkg in enumerate(packages):
-      if pkg.startswith('boost'):
-        boost_req = pkg
-        del packages[i]
+      self._system_include_dirs = []
 
     # We still look for the keyword 'boost_modules'
-    boost_modules = []
+    self._boost_modules = []
     if 'boost_modules' in kwargs:
       if isinstance(kwargs['boost_modules'], str):
-        boost_modules.append(kwargs['boost_modules'])
+        self._boost_modules.append(kwargs['boost_modules'])
       else:
-        boost_modules.extend(kwargs['boost_modules'])
+        self._boost_modules.extend(kwargs['boost_modules'])
       del kwargs['boost_modules']
 
-    if boost_modules and not boost_req: boost_req = 'boost >= 1.0'
+    # unity (jumbo) builds
+    self.unity = None
+    if 'unity' in kwargs:
+      self.unity = kwargs['unity']
+      del kwargs['unity']
+
+    # precompiled header
+    self.precompiled_header = None
+    if 'precompiled_header' in kwargs:
+      self.precompiled_header = kwargs['precompiled_header']
+      del kwargs['precompiled_header']
+
+    # variants for several micro-architecture levels
+    self.isa = None
+    if 'isa' in kwargs:
+      self.isa = kwargs['isa']
+      del kwargs['isa']
+    # the level of this variant, and the name of the extension it is a variant of
+    self.isa_level = None
+    self.isa_name = None
+    self._isa_variants = None
 
     # Was a version parameter given?
-    version = None
+    self._version = None
     if 'version' in kwargs:
-      version = kwargs['version']
+      self._version = kwargs['version']
       del kwargs['version']
 
+    # Make sure the language is correctly set to C++
+    kwargs['language'] = 'c++'
+
+    # Run the constructor for the base class
+    self._configured = None
+    DistutilsExtension.__init__(self, name, sources, **kwargs)
+
+    # keep the user parameters, which are merged with ours in configure()
+    self._user_kwargs = dict((k, v) for k, v in kwargs.items() if isinstance(getattr(Extension, k, None), property))
+    self._configured = False
+
+  def configure(self):
+    """Searches for all dependencies and sets the compilation parameters
+
+    This method is called automatically on first access to any of the
+    compilation parameters of this extension. It looks up the pkg-config
+    ``packages``, Boost and the ``bob_packages`` and merges their include
+    directories, libraries and macros with the ones given by the user.
+    """
+
+    if self._configured is not False: return
+    # set before the search, as the properties used below call configure()
+    self._configured = True
+    try:
+      self._configure()
+    except:
+      self._configured = False
+      raise
+
+  def _configure(self):
+    """Implements :py:meth:`configure`, which guards it against recursion"""
+
+    name = self.name
+    version = self._version
+    packages = list(self._packages)
+    kwargs = dict(self._user_kwargs)
+
+    bob_includes, bob_libraries, bob_library_dirs = resolution_context.bob_libraries(self.bob_packages)
+
+    system_includes = list(self._system_include_dirs)
+
+    # Boost requires a special treatment
+    boost_req = ''
+    for i, pkg in enumerate(packages):
+      if pkg.startswith('boost'):
+        boost_req = pkg
+        del packages[i]
+
+    boost_modules = self._boost_modules
+
+    if boost_modules and not boost_req: boost_req = 'boost >= 1.0'
+
     # Mixing
     parameters = {
-        'define_macros': generate_self_macros(name, version),
+        # variants are imported under the name of the original extension
+        'define_macros': generate_self_macros(self.isa_name or name, version),
         'extra_compile_args': ['-std=c++0x'], #synonym for c++11?
         'extra_link_args': [],
         'library_dirs': [],
@@ -343,7 +846,8 @@ class Extension(DistutilsExtension):
     # Updates for boost
     if boost_req:
 
-      boost_pkg = boost(boost_req.replace('boost', '').strip())
+      boost_version = boost_req.replace('boost', '').strip()
+      boost_pkg = resolution_context.boost(boost_version)
 
       # Adds macros
       parameters['define_macros'] += boost_pkg.macros()
@@ -355,14 +859,14 @@ class Extension(DistutilsExtension):
 
       # Adds specific boost libraries requested by the user
       if boost_modules:
-        boost_libdirs, boost_libraries = boost_pkg.libconfig(boost_modules)
+        boost_libdirs, boost_libraries = resolution_context.boost_libraries(boost_version, boost_modules)
         parameters['library_dirs'].extend(boost_libdirs)
         self.pkg_library_directories.extend(boost_libdirs)
         parameters['libraries'].extend(boost_libraries)
         self.pkg_libraries.extend(boost_libraries)
 
     # Checks all other pkg-config requirements
-    pkgs = check_packages(packages)
+    pkgs = resolution_context.packages(packages)
 
     for pkg in pkgs:
 
@@ -426,9 +930,6 @@ class Extension(DistutilsExtension):
     # Stream-line '-isystem' includes
     kwargs['extra_compile_args'] = reorganize_isystem(kwargs['extra_compile_args'])
 
-    # Make sure the language is correctly set to C++
-    kwargs['language'] = 'c++'
-
     # On Linux, set the runtime path
     if platform.system() == 'Linux':
       kwargs.setdefault('runtime_library_dirs', [])
@@ -441,14 +942,38 @@ class Extension(DistutilsExtension):
     # Uniq'fy library directories
     kwargs['library_dirs'] = uniq_paths(kwargs['library_dirs'])
 
-    # Run the constructor for the base class
-    DistutilsExtension.__init__(self, name, sources, **kwargs)
+    # Sets the final parameters
+    for key, value in kwargs.items():
+      setattr(self, '_' + key, value)
+
+  def isa_variants(self):
+    """Returns the variants of this extension for the micro-architecture levels given by its ``isa`` parameter, see :py:mod:`bob.extension.isa`
+
+    This extension is built for the lowest level, and one variant for each higher level.
+    The variants are created only once, and they are configured separately.
+    """
+
+    if self._isa_variants is None:
+      levels = isa.levels(self.isa)
+      self.isa_level = levels[0] if levels else None
+      self._isa_variants = [self._isa_variant(level) for level in levels[1:]]
+    return self._isa_variants
+
+  def _isa_variant(self, level):
+    """Returns a copy of this extension for the given micro-architecture level"""
+
+    variant = copy.deepcopy(self)
+    variant.name = isa.variant_name(self.name, level)
+    variant.isa_level = level
+    variant.isa_name = self.name
+    variant._isa_variants = []
+    return variant
 
 
 class Library (Extension):
   """A class to compile a pure C++ code library used within and outside an extension using CMake."""
 
-  def __init__(self, name, sources, version, bob_packages = [], packages = [], boost_modules=[], include_dirs = [], system_include_dirs = [], libraries = [], library_dirs = [], define_macros = []):
+  def __init__(self, name, sources, version, bob_packages = [], packages = [], boost_modules=[], include_dirs = [], system_include_dirs = [], libraries = [], library_dirs = [], define_macros = [], unity = None, precompiled_header = None, isa = None):
     """Initializes a pure C++ library that will be compiled with CMake.
 
     By default, the include directory of this package is automatically added to the ``include_dirs``.
@@ -504,6 +1029,18 @@ class Library (Extension):
 
     define_macros : [(string, string)]
       An additional list of preprocessor definitions that is not covered by ``packages``
+
+    unity : bool or float
+      Compiles the sources merged into unity batches, see :py:class:`Extension`.
+      By default, the ``BOB_BUILD_UNITY`` environment variable is used.
+
+    precompiled_header : string
+      A header that is included into every C++ source and precompiled, see :py:class:`Extension`.
+      It is precompiled with ``target_precompile_headers``, if CMake is at least version 3.16.
+
+    isa : bool or [string]
+      Builds the library once for each of the given x86-64 micro-architecture levels, see :py:class:`Extension`.
+      The variant for the best level is loaded by :py:func:`load_bob_library`.
     """
     name_split = name.split('.')
     if len(name_split) <= 1:
@@ -515,25 +1052,61 @@ class Library (Extension):
     self.c_version = version
     self.c_self_include_directory = os.path.join(self.c_package_directory, self.c_sub_directory, 'include')
     self.c_include_directories = [self.c_self_include_directory] + include_dirs
-    self.c_system_include_directories = system_include_dirs
+    self.c_system_include_directories = system_include_dirs[:]
     self.c_libraries = libraries[:]
     self.c_library_directories = library_dirs[:]
     self.c_define_macros = define_macros[:]
+    # additional options, e.g., for profile-guided optimization
+    self.c_compile_flags = []
+    self.c_link_flags = []
+    self.c_cmake_options = []
+    # the SONAME of ISA variants is the one of the original library
+    self.c_soname = None
+    # files that all objects depend on, e.g., the profiles of a PGO build
+    self.c_depends = []
+    self.c_bob_packages = bob_packages
+
+    # call base class constructor, i.e., to handle the packages
+    Extension.__init__(self, name, sources, packages=packages, boost_modules=boost_modules, unity=unity, precompiled_header=precompiled_header, isa=isa)
+
+  def configure(self):
+    """Searches for all dependencies of this library and for CMake
+
+    This method is called automatically before the library is compiled, or on
+    first access to any of the compilation parameters of this library. See
+    :py:meth:`Extension.configure`.
+    """
+
+    if self._configured is not False: return
+
+    # search for everything first, so that a failed search can be repeated
+    bob_includes, bob_libraries, bob_library_dirs = resolution_context.bob_libraries(self.c_bob_packages)
+
+    # find the cmake executable
+    cmake = resolution_context.executable("cmake")
+    if not cmake:
+      raise OSError("The Library class needs CMake version >= 2.8 to be installed, but CMake cannot be found")
+
+    # select the CMake generator: Ninja, if available, or Makefiles
+    generator = os.environ.get('BOB_CMAKE_GENERATOR')
+    if generator is None:
+      generator = 'Ninja' if resolution_context.program(GENERATORS['Ninja']) else 'Unix Makefiles'
+    if generator not in GENERATORS:
+      raise ValueError("The CMake generator `%s' selected by BOB_CMAKE_GENERATOR is not supported; use one of %s" % (generator, ", ".join("`%s'" % g for g in sorted(GENERATORS))))
+    build_tool = resolution_context.program(GENERATORS[generator])
+    if not build_tool:
+      raise OSError("The CMake generator `%s' needs `%s' to be installed, but it cannot be found" % (generator, GENERATORS[generator]))
+
+    Extension.configure(self)
 
     # add includes and libs for bob packages as the PREFERRED path (i.e., in front)
-    bob_includes, bob_libraries, bob_library_dirs = get_bob_libraries(bob_packages)
     self.c_include_directories = bob_includes + self.c_include_directories
     self.c_libraries = bob_libraries + self.c_libraries
     self.c_library_directories = bob_library_dirs + self.c_library_directories
 
-    # find the cmake executable
-    cmake = find_executable("cmake")
-    if not cmake:
-      raise OSError("The Library class needs CMake version >= 2.8 to be installed, but CMake cannot be found")
     self.c_cmake = cmake[0]
-
-    # call base class constructor, i.e., to handle the packages
-    Extension.__init__(self, name, sources, packages=packages, boost_modules=boost_modules)
+    self.c_generator = generator
+    self.c_build_tool = build_tool[0]
 
     # add the include directories for the packages as well
     self.c_system_include_directories.extend(self.pkg_includes)
@@ -542,17 +1115,67 @@ class Library (Extension):
     self.c_define_macros.extend(self.pkg_macros)
 
 
-  def compile(self, build_directory, compiler = None, stdout=None):
+  def _isa_variant(self, level):
+    """Returns a copy of this library for the given micro-architecture level, which is loaded instead of this library"""
+
+    variant = Extension._isa_variant(self, level)
+    variant.c_name = isa.variant_name(self.c_name, level)
+    if platform.system() == 'Linux':
+      variant.c_soname = get_full_libname(self.c_name)
+    return variant
+
+
+  def get_compiler(self):
+    """Returns the C++ compiler that CMake uses for this library, i.e., the one given in the ``CXX`` environment variable, or ``c++``"""
+    compiler = os.environ.get('CXX', '').split()
+    return compiler[0] if compiler else 'c++'
+
+
+  def get_target_directory(self, build_directory):
+    """Returns the directory, where :py:meth:`compile` will put the library when building in the given ``build_directory``"""
+    return os.path.join(os.path.realpath(build_directory), self.c_sub_directory)
+
+
+  def compile(self, build_directory, compiler = None, stdout=None, jobs = None, verbose = False):
     """This function will automatically create a CMakeLists.txt file in the ``package_directory`` including the required information.
     Afterwards, the library is built using CMake in the given ``build_directory``.
+    The CMakeLists.txt file is only rewritten when its contents change, and CMake is only run when the build directory is not yet configured for the same inputs; ``make`` then rebuilds what is out of date.
     The build type is automatically taken from the debug option in the buildout.cfg.
     To change the compiler, use the ``compiler`` parameter.
+    The library is built with ``ninja`` if it is installed, and with ``make`` otherwise; set the ``BOB_CMAKE_GENERATOR`` environment variable to ``Ninja`` or ``Unix Makefiles`` to select the CMake generator explicitly.
+    The parallel ``make`` (or ``ninja``) jobs take the tokens of the given :py:class:`bob.extension.scheduler.TokenPool` ``jobs``, or their number is taken from the ``BOB_BUILD_PARALLEL`` environment variable.
+    ``ninja`` only prints the commands it runs when ``verbose`` is set.
     """
-    self.c_target_directory = os.path.join(os.path.realpath(build_directory), self.c_sub_directory)
+    self.configure()
+    # generate CMakeLists.txt makefile
+    generator = self.cmake_lists_generator(build_directory, jobs)
+
+    # compile our stuff in a different directory
+    final_build_dir = os.path.join(os.path.dirname(os.path.realpath(build_directory)), 'build_cmake', self.c_name)
+    if not os.path.exists(final_build_dir):
+      os.makedirs(final_build_dir)
+    generator.generate(self.c_package_directory, final_build_dir)
+
+    try:
+      self.run_cmake(final_build_dir, compiler, stdout, jobs, verbose)
+    except CMakeBuildError:
+      if not generator.unity_batches: raise
+      # sources that cannot be compiled together are compiled separately
+      distutils.log.warn("building the unity batches of '%s' failed; compiling its sources separately", self.name)
+      generator.unity_batches = None
+      generator.generate(self.c_package_directory, final_build_dir)
+      self.run_cmake(final_build_dir, compiler, stdout, jobs, verbose)
+
+
+  def cmake_lists_generator(self, build_directory, jobs = None):
+    """Returns the :py:class:`CMakeListsGenerator` for this library, which will be put into the :py:meth:`get_target_directory` of the given ``build_directory``.
+    The number of unity batches, if enabled, depends on the number of parallel ``jobs`` (a :py:class:`bob.extension.scheduler.TokenPool`, by default all available cores).
+    """
+    self.configure()
+    self.c_target_directory = self.get_target_directory(build_directory)
     if not os.path.exists(self.c_target_directory):
       os.makedirs(self.c_target_directory)
-    # generate CMakeLists.txt makefile
-    generator = CMakeListsGenerator(
+    return CMakeListsGenerator(
       name = self.c_name,
       sources = self.c_sources,
       target_directory = self.c_target_directory,
@@ -561,30 +1184,78 @@ class Library (Extension):
       system_include_directories = uniq_paths(self.c_system_include_directories),
       libraries = uniq(self.c_libraries),
       library_directories = uniq_paths(self.c_library_directories),
-      macros = uniq(self.c_define_macros)
+      macros = uniq(self.c_define_macros),
+      unity_batches = unity.batch_count(self.unity, jobs.jobs if jobs is not None else scheduler.available_cpus()),
+      precompiled_header = os.path.join(self.c_package_directory, self.precompiled_header) if self.precompiled_header else None,
+      compile_flags = self.c_compile_flags,
+      link_flags = self.c_link_flags,
+      soname = self.c_soname,
+      depends = self.c_depends
     )
 
-    # compile our stuff in a different directory
-    final_build_dir = os.path.join(os.path.dirname(os.path.realpath(build_directory)), 'build_cmake', self.c_name)
-    if not os.path.exists(final_build_dir):
-      os.makedirs(final_build_dir)
-    generator.generate(self.c_package_directory, final_build_dir)
 
-    # compile in the build directory
-    import subprocess
+  def run_cmake(self, cmake_directory, compiler = None, stdout=None, jobs = None, verbose = False):
+    """Configures the given directory containing a generated CMakeLists.txt file with the CMake of this library, if needed, and builds it.
+    See :py:meth:`compile` for the parameters.
+    The time of both steps is recorded by :py:data:`bob.extension.telemetry.build_telemetry`, and with ``ninja``, also the time of each compilation and link step.
+    """
+    import time
     env = {'VERBOSE' : '1'}
     env.update(os.environ)
     if compiler is not None:
       env['CXX'] = compiler
-    # configure cmake
-    command = [self.c_cmake, final_build_dir]
-    if subprocess.call(command, cwd=final_build_dir, env=env, stdout=stdout) != 0:
-      raise OSError("Could not generate makefiles with CMake")
-    # run make
-    make_call = ['make']
-    if  "BOB_BUILD_PARALLEL" in os.environ: make_call += ['-j%s' % os.environ["BOB_BUILD_PARALLEL"]]
-    if subprocess.call(make_call, cwd=final_build_dir, env=env, stdout=stdout) != 0:
-      raise OSError("CMake compilation stopped with an error; stopping ...")
+    # configure cmake, unless the build directory is already configured for the same inputs
+    command = [self.c_cmake, '-G', self.c_generator, '-DCMAKE_MAKE_PROGRAM=%s' % self.c_build_tool] + self.c_cmake_options + [cmake_directory]
+    stamp = configure_stamp(cmake_directory, command, env)
+    if not is_configured(cmake_directory, stamp):
+      set_configured(cmake_directory, None)
+      # CMake refuses to reconfigure a build directory with another generator
+      if cached_generator(cmake_directory) not in (None, self.c_generator):
+        clean_build_directory(cmake_directory)
+      # the compiler checks of CMake count as one job
+      token = jobs.acquire(float('inf')) if jobs is not None else None
+      start = time.time()
+      try:
+        status, rss = telemetry.run(command, cwd=cmake_directory, env=env, stdout=stdout)
+      finally:
+        if jobs is not None: jobs.release(token)
+      build_telemetry.record('cmake-configure', self.c_name, start, time.time(), rss, self.name)
+      if status != 0:
+        raise OSError("Could not generate makefiles with CMake")
+      set_configured(cmake_directory, stamp)
+    # run make or ninja, which decides what is out of date
+    make_call = [self.c_build_tool]
+    kwargs = {}
+    if self.c_generator == 'Ninja' and verbose:
+      make_call += ['-v']
+    tokens = []
+    if jobs is not None:
+      # the build tool takes its jobs from the jobserver shared with the extensions; it runs its first job on the token it holds itself
+      shared = jobs.jobserver is not None and supports_jobserver(self.c_build_tool, jobs.jobserver)
+      # ... otherwise, it runs as many jobs as it holds tokens: one it waits for, as the Library's are needed by all extensions, and those that are free right away
+      tokens = jobs.acquire_many(1 if shared else jobs.jobs, float('inf'))
+      args, fds, jobs_env = jobs.make_arguments(shared, is_ninja(self.c_build_tool), len(tokens))
+      make_call += args
+      env.update(jobs_env)
+      if fds and sys.version_info[0] >= 3: kwargs['pass_fds'] = fds
+    elif "BOB_BUILD_PARALLEL" in os.environ: make_call += ['-j%s' % os.environ["BOB_BUILD_PARALLEL"]]
+    ninja_log = os.path.join(cmake_directory, '.ninja_log')
+    offset = os.path.getsize(ninja_log) if os.path.exists(ninja_log) else 0
+    start = time.time()
+    try:
+      status, rss = telemetry.run(make_call, cwd=cmake_directory, env=env, stdout=stdout, **kwargs)
+    finally:
+      for token in tokens: jobs.release(token)
+    build_telemetry.record('cmake-build', self.c_name, start, time.time(), rss, self.name)
+    # the steps that ninja ran, e.g., 'CMakeFiles/<target>.dir/<source>.o'
+    for output, begin, end in telemetry.ninja_records(ninja_log, offset, start):
+      if output.endswith('.o'):
+        name = output[:-2].split('.dir', 1)[-1] if '.dir/' in output else output
+        build_telemetry.record('compile', name, begin, end, extension=self.name)
+      else:
+        build_telemetry.record('link', output, begin, end, extension=self.name)
+    if status != 0:
+      raise CMakeBuildError("CMake compilation stopped with an error; stopping ...")
 
 
 class build_ext(_build_ext):
@@ -594,6 +1265,28 @@ class build_ext(_build_ext):
   information.
   """
 
+  user_options = _build_ext.user_options + [
+      ('no-pipeline', None, "build all Library's before compiling the other extensions"),
+      ('superbuild', None, "build all Library's in a single CMake project"),
+      ('pgo=', None, "profile-guided optimization phase: 'generate' (instrumented build) or 'use' (optimized build)"),
+      ('lto', None, "enable link-time optimization"),
+      ('analyze-includes', None, "report the compile time spent in the headers included by each source"),
+      ]
+  boolean_options = _build_ext.boolean_options + ['no-pipeline', 'superbuild', 'lto', 'analyze-includes']
+
+  if not any(option[0] == 'parallel=' for option in _build_ext.user_options):
+    user_options.append(('parallel=', 'j', "number of parallel build jobs"))
+
+  def initialize_options(self):
+    _build_ext.initialize_options(self)
+    self.no_pipeline = False
+    self.superbuild = False
+    self.pgo = None
+    self.lto = None
+    self.analyze_includes = False
+    if not hasattr(self, 'parallel'):
+      self.parallel = None
+
   def finalize_options(self):
     # check if the "BOB_BUILD_DIRECTORY" environment variable is set
     env = os.environ
@@ -602,22 +1295,121 @@ class build_ext(_build_ext):
       if 'develop' in sys.argv:
         self.build_temp = os.path.join(env['BOB_BUILD_DIRECTORY'], 'build_temp')
         self.build_lib = os.path.join(env['BOB_BUILD_DIRECTORY'], 'build_lib')
+
+    # the variants of extensions for several micro-architecture levels are extensions of their own
+    if self.distribution.ext_modules:
+      extensions = []
+      for ext in self.distribution.ext_modules:
+        if getattr(ext, 'isa_name', None) is not None: continue
+        extensions.append(ext)
+        if isinstance(ext, Extension): extensions.extend(ext.isa_variants())
+      self.distribution.ext_modules = extensions
     _build_ext.finalize_options(self)
 
+    # by default, use BOB_BUILD_PARALLEL, the jobs of a parent make or all available cores
+    if self.parallel is None or self.parallel is True or self.parallel == 0:
+      self.parallel = env.get('BOB_BUILD_PARALLEL') or scheduler.parent_jobs() or scheduler.available_cpus()
+    try:
+      self.parallel = int(self.parallel)
+    except ValueError:
+      raise distutils.errors.DistutilsOptionError("parallel should be an integer")
+
+    # the profile-guided optimization phase
+    if self.pgo is None:
+      self.pgo = env.get('BOB_BUILD_PGO') or None
+    if self.pgo is not None and self.pgo not in pgo.PHASES:
+      raise distutils.errors.DistutilsOptionError("pgo should be one of %s" % ", ".join(pgo.PHASES))
+
+    # link-time optimization, or BOB_BUILD_LTO
+    self.lto = lto.is_enabled(self.lto)
+
   def run(self):
     """Iterates through the list of Extension packages and reorders them, so that the Library's come first
     """
     # here, we simply re-order the extensions such that we get the Library first
     self.extensions = [ext for ext in self.extensions if isinstance(ext, Library)] + [ext for ext in self.extensions if not isinstance(ext, Library)]
     # call the base class function
-    return _build_ext.run(self)
-
-
-  def build_extension(self, ext):
-    """Builds the given extension.
-
-    When the extension is of type Library, it compiles the library with CMake, otherwise the default compilation mechanism is used.
-    Afterwards, it adds the according library, and the include and library directories of the Library's, so that other Extensions can find the newly generated lib.
+    self.object_cache = None
+    self.include_analyzer = None
+    self.jobs = None
+    try:
+      retval = _build_ext.run(self)
+
+      if self.object_cache is not None:
+        self.object_cache.cleanup()
+        self.announce("object cache: %d hits, %d misses" % (self.object_cache.hits, self.object_cache.misses), level=distutils.log.INFO)
+
+      # describes the packages for get_bob_libraries(), so they are not imported
+      self.write_manifests()
+
+      # reports how much work the dependency resolution took
+      statistics = probe_statistics.snapshot()
+      self.announce("dependency resolution: %d lookups (%d reused), %d subprocesses, %d stat calls" % (
+        resolution_context.misses + resolution_context.hits, resolution_context.hits,
+        statistics['subprocesses'], statistics['stats']), level=distutils.log.INFO)
+
+      # reports where the time of the build went
+      self.write_telemetry()
+      if self.include_analyzer is not None:
+        self.write_include_report()
+    finally:
+      # the jobserver shared with make or ninja, if this build created it
+      if self.jobs is not None and self.jobs.jobserver is not None:
+        self.jobs.jobserver.close()
+    return retval
+
+
+  def write_include_report(self):
+    """Measures the parse time of the headers included by the sources (see :py:mod:`bob.extension.includes`), writes the report into ``build_temp`` and announces the most expensive headers"""
+
+    self.announce("measuring the parse time of the included headers", level=distutils.log.INFO)
+    times = self.include_analyzer.header_times(self.jobs)
+    filename = os.path.join(self.build_temp, INCLUDES_REPORT)
+    report = self.include_analyzer.save(filename, times)
+
+    info = lambda message: self.announce(message, level=distutils.log.INFO)
+    info("include analysis of %d sources, written to %s" % (len(report['translation_units']), filename))
+    info("most expensive headers (parse time x sources including them):")
+    for k in [k for k in report['headers'] if k['time'] is not None][:10]:
+      info("  %7.2fs = %5.2fs x %3d  %s%s" % (k['total'], k['time'], k['count'], k['header'], " [%s]" % k['suggestion'] if k['suggestion'] else ""))
+
+
+  def write_telemetry(self):
+    """Writes the report of :py:data:`bob.extension.telemetry.build_telemetry` into ``build_temp``, and announces the slowest translation units and the critical path of the build"""
+
+    if not build_telemetry.records: return
+    filename = os.path.join(self.build_temp, telemetry.REPORT_NAME)
+    report = build_telemetry.save(filename, self.distribution.get_name(), self.distribution.get_version())
+    build_telemetry.clear()
+
+    info = lambda message: self.announce(message, level=distutils.log.INFO)
+    info("build telemetry: %.1fs, written to %s" % (report['duration'], filename))
+    totals = telemetry.totals(report)
+    info("time per phase: %s" % ", ".join("%s %.1fs" % (k, totals[k]) for k in telemetry.PHASES if k in totals and k != 'extension'))
+    slowest = telemetry.slowest(report, 5)
+    if slowest:
+      info("slowest translation units:")
+      for k in slowest:
+        info("  %7.2fs %s%s" % (k['duration'], k['name'], " (%d MiB)" % (k['peak_rss'] // 1024) if k['peak_rss'] else ""))
+    path = telemetry.critical_path(report)
+    info("critical path: %.1fs in %d steps" % (sum(k['duration'] for k in path), len(path)))
+    for k in path[-5:]:
+      info("  %7.2fs %s %s" % (k['duration'], k['phase'], k['name']))
+
+
+  def build_extensions(self):
+    """Builds all extensions, taking object files from the :py:class:`bob.extension.cache.ObjectCache`, if ``BOB_BUILD_CACHE`` is set.
+
+    The headers of extensions with a ``precompiled_header`` are precompiled in ``build_temp``, see :py:class:`bob.extension.pch.PrecompiledHeaders`.
+    The headers included by each object are recorded in a :py:class:`bob.extension.depends.DependencyDatabase` inside ``build_temp``.
+    In later builds, only the objects whose sources or headers changed are compiled again.
+
+    Extensions are built concurrently: each :py:class:`Library` is built after the previous one, and all other extensions are compiled at the same time.
+    Only their link step waits for the Library's to be finished, see :py:meth:`get_libraries`.
+    With ``--no-pipeline``, the other extensions are only compiled after all Library's are finished.
+    With ``--superbuild``, all Library's are built by a single CMake project, see :py:meth:`build_superbuild`.
+    All compilations and link steps share up to ``--parallel`` jobs.
+    With ``--analyze-includes``, all extensions are linked again and each source is parsed once more to record the headers it includes, see :py:meth:`write_include_report`.
     """
 
     # HACK: remove the "-Wstrict-prototypes" option keyword
@@ -628,28 +1420,425 @@ class build_ext(_build_ext):
     if "-Wno-strict-aliasing" not in self.compiler.compiler_so:
       self.compiler.compiler_so.append("-Wno-strict-aliasing")
 
+    # installed first, so that the other hooks see the original header
+    self.precompiled_headers = None
+    if self.compiler.compiler_type == 'unix':
+      self.precompiled_headers = PrecompiledHeaders(os.path.join(self.build_temp, PCH_DIRECTORY))
+      self.precompiled_headers.install(self.compiler)
+
+    # objects compiled with profiles depend on them, which the object cache does not know
+    self.object_cache = ObjectCache.from_environment() if self.pgo is None else None
+    if self.object_cache is not None:
+      self.object_cache.install(self.compiler)
+
+    self.dependencies = None
+    if self.compiler.compiler_type == 'unix':
+      self.dependencies = DependencyDatabase(os.path.join(self.build_temp, DATABASE_NAME))
+      self.dependencies.install(self.compiler, self.force)
+
+    # each source is parsed again to find out what its headers cost; up-to-date extensions are built (and analyzed) as well
+    if self.analyze_includes and self.compiler.compiler_type == 'unix':
+      self.include_analyzer = IncludeAnalyzer(os.path.join(self.build_temp, 'includes'))
+      self.include_analyzer.install(self.compiler)
+      self.force = True
+
+    # the time and memory of each compilation and link step
+    build_telemetry.install(self.compiler)
+
+    # the objects of each extension are compiled in parallel, sharing the jobserver of a parent make, or of this build with make or ninja building the Library's
+    jobserver = scheduler.JobServer.from_environment()
+    if jobserver is None and os.name == 'posix' and self.parallel > 1 and any(isinstance(ext, Library) for ext in self.extensions):
+      jobserver = scheduler.JobServer.create(self.parallel)
+    self.jobs = scheduler.TokenPool(self.parallel, jobserver)
+    # ... the longest first, and only as many at a time as the memory allows, both known from earlier builds
+    self.history = scheduler.JobHistory(os.path.join(self.build_temp, scheduler.HISTORY_NAME), build_telemetry.usage)
+    self.memory = None
+    budget = scheduler.memory_budget()
+    if budget is not None and self.parallel > 1:
+      self.memory = scheduler.MemoryBudget(budget, self.history)
+      self.announce("memory budget for parallel compilations: %d MiB" % (budget // 1024**2), level=distutils.log.INFO)
+    scheduler.install(self.compiler, self.jobs, self.history, self.memory)
+
+    # dependencies are resolved before building, and not concurrently
+    self.check_extensions_list(self.extensions)
+    for ext in self.extensions:
+      if isinstance(ext, Extension): ext.configure()
+
+    if self.pgo is not None:
+      self.add_pgo_flags()
+    if self.lto:
+      self.add_lto_flags()
+    # the instruction set extensions of the micro-architecture levels
+    for ext in self.extensions:
+      if getattr(ext, 'isa_level', None) is not None:
+        self._add_flags(isa.flags(ext.isa_level), [], [ext])
+
+    # Library's are built in order, and before all other extensions
+    libraries = [ext for ext in self.extensions if isinstance(ext, Library)]
+    # extensions sharing sources write the same object files, so they are built in order as well
+    objects = {}
+    previous = {}
+    for ext in self.extensions:
+      if isinstance(ext, Library): continue
+      for obj in self.compiler.object_filenames(ext.sources, output_dir=self.get_object_directory(ext)):
+        if obj in objects: previous.setdefault(ext.name, []).append(objects[obj])
+        objects[obj] = ext
+    def _requires(ext):
+      if isinstance(ext, Library): return libraries[:libraries.index(ext)][-1:]
+      return (libraries if self.no_pipeline else []) + previous.get(ext.name, [])
+    # extensions expected to compile longest are started first; Library's before all, since others link against them
+    def _priority(ext):
+      if isinstance(ext, Library): return float('inf')
+      objects = self.compiler.object_filenames(ext.sources, output_dir=self.get_object_directory(ext))
+      return sum(self.history.duration(os.path.normpath(obj), scheduler.source_size(src)) for src, obj in zip(ext.sources, objects))
+
+    # the Library's to wait for before linking
+    self._libraries = [(ext, threading.Event()) for ext in libraries]
+    self._failed_libraries = set()
+    if not self.no_pipeline:
+      for ext in libraries:
+        self._add_library(ext, ext.get_target_directory(self.build_lib))
+
+    try:
+      # waiting extensions do not hold any jobs, so each gets its own thread
+      scheduler.run_graph(self._build_extension, self.extensions, _requires, len(self.extensions), _priority)
+    except Exception as e:
+      errors = getattr(e, 'errors', [])
+      for ext, error in (errors if len(errors) > 1 else []):
+        self.announce("error: building '%s' failed: %s" % (ext.name, error), level=distutils.log.ERROR)
+      raise
+    finally:
+      if self.dependencies is not None:
+        self.dependencies.save()
+      self.history.save()
+      if self.memory is not None and self.memory.held_back:
+        self.announce("%d compilations were held back to stay within the memory budget" % self.memory.held_back, level=distutils.log.INFO)
+
+
+  def add_pgo_flags(self):
+    """Adds the options of the ``--pgo`` phase to all extensions and :py:class:`Library`'s, see :py:mod:`bob.extension.pgo`.
+
+    Profiles are stored in the :py:func:`bob.extension.pgo.profile_directory` of this package and version.
+    Profiles of earlier instrumented builds are removed when building with ``--pgo=generate``.
+    The options depend on the compiler, which for :py:class:`Library`'s is the one of CMake, see :py:meth:`Library.get_compiler`.
+    With ``--pgo=use``, all objects depend on the profiles, so that they are compiled again when the profiles change.
+    """
+
+    directory = pgo.profile_directory(self.distribution.get_name(), self.distribution.get_version())
+    if self.pgo == 'generate':
+      pgo.clear_profiles(directory)
+    self.announce("%s profiles in %s" % ("recording" if self.pgo == 'generate' else "using", directory), level=distutils.log.INFO)
+
+    # GCC and Clang need different options; Library's are compiled by the compiler of CMake
+    toolchains = {}
+    for ext in self.extensions:
+      executable = ext.get_compiler() if isinstance(ext, Library) else self.compiler.compiler_so[0]
+      toolchains.setdefault(executable, []).append(ext)
+
+    for executable, extensions in toolchains.items():
+      self._add_flags(*pgo.flags(self.pgo, directory, executable), extensions=extensions)
+      if self.pgo != 'use': continue
+      # objects are compiled again when the profiles change
+      profiles = pgo.profiles(directory, executable)
+      for ext in extensions:
+        if isinstance(ext, Library):
+          ext.c_depends = ext.c_depends + profiles
+        else:
+          ext.depends = (ext.depends or []) + profiles
+          if self.dependencies is not None: self.dependencies.common = profiles
+
+
+  def add_lto_flags(self):
+    """Adds the options for link-time optimization to all extensions and :py:class:`Library`'s, see :py:mod:`bob.extension.lto`.
+
+    Each link step runs up to ``--parallel`` LTO jobs.
+    The ``ar`` and ``ranlib`` tools with the linker plugin of the compiler, e.g., ``gcc-ar``, are used to create static libraries, both by this command and by CMake.
+    """
+
+    executable = self.compiler.compiler_so[0]
+    self._add_flags(*lto.flags(executable, self.parallel))
+
+    tools = lto.archiver(executable)
+    if tools is None:
+      self.warn("could not find the archiver of `%s' for link-time optimization; static libraries may not be optimized" % executable)
+      return
+    ar, ranlib = tools
+    if getattr(self.compiler, 'archiver', None):
+      self.compiler.archiver = [ar] + self.compiler.archiver[1:]
+    if getattr(self.compiler, 'ranlib', None):
+      self.compiler.ranlib = [ranlib] + self.compiler.ranlib[1:]
+    for ext in self.extensions:
+      if isinstance(ext, Library):
+        ext.c_cmake_options = ext.c_cmake_options + ['-DCMAKE_AR=%s' % ar, '-DCMAKE_RANLIB=%s' % ranlib]
+
+
+  def _add_flags(self, compile_args, link_args, extensions=None):
+    """Adds the given compiler and linker options to the given (by default, all) extensions and :py:class:`Library`'s"""
+
+    for ext in self.extensions if extensions is None else extensions:
+      if isinstance(ext, Library):
+        ext.c_compile_flags = ext.c_compile_flags + compile_args
+        ext.c_link_flags = ext.c_link_flags + link_args
+      else:
+        ext.extra_compile_args = (ext.extra_compile_args or []) + compile_args
+        ext.extra_link_args = (ext.extra_link_args or []) + link_args
+
+
+  def _build_extension(self, ext):
+    """Builds the given extension, ignoring errors of optional extensions"""
+
+    with build_telemetry.measure('extension', ext.name, ext.name):
+      if hasattr(self, '_filter_build_errors'):
+        with self._filter_build_errors(ext):
+          self.build_extension(ext)
+      else:
+        self.build_extension(ext)
+
+
+  def get_manifests(self):
+    """Returns the manifest file of each package that contains extensions"""
+
+    directories = uniq([os.path.dirname(self.get_ext_fullpath(ext.name)) for ext in self.extensions])
+    return [os.path.join(k, _manifest_name) for k in directories]
+
+
+  def get_outputs(self):
+    return _build_ext.get_outputs(self) + self.get_manifests()
+
+
+  def write_manifests(self):
+    """Writes a ``bob_extension.json`` manifest into each package that contains extensions
+
+    The manifest lists the :py:class:`Library`'s of the package, whether the package defines a ``get_include_directories()`` function and, if so, the directories it returns.
+    It is read by :py:func:`get_bob_libraries`, so that packages depending on this one do not need to import it.
+    To call the function, the package is imported from the built files in a separate process; if this fails, the directories are not recorded, and dependent packages import it instead.
+    The directories are stored relative to the modules or the environment they are in, so that the manifest stays valid when the package is installed or moved elsewhere.
+    """
+    import json
+
+    manifests = {}
+    packages = {}
+    for ext in self.extensions:
+      filename = os.path.join(os.path.dirname(self.get_ext_fullpath(ext.name)), _manifest_name)
+      # the include directories outside of the package are only known to the package itself
+      source = os.path.join(*(ext.name.split('.')[:-1] + ['__init__.py'])) if '.' in ext.name else None
+      manifest = manifests.setdefault(filename, {'libraries': [],
+          'get_include_directories': source is None or not os.path.exists(source) or _defines_function(source, 'get_include_directories')})
+      if source is not None: packages[filename] = ext.name.rsplit('.', 1)[0]
+
+      if isinstance(ext, Library) and ext.isa_name is None:
+        manifest['libraries'].append(ext.c_name)
+
+    for filename, manifest in manifests.items():
+      manifest['libraries'] = uniq(manifest['libraries'])
+      if manifest['get_include_directories'] and filename in packages:
+        package = packages[filename]
+        root = os.path.dirname(filename)
+        for k in package.split('.'): root = os.path.dirname(root)
+        directories = _include_directories(package, root or os.curdir)
+        if directories is not None: manifest['include_directories'] = directories
+      contents = json.dumps(manifest, indent=2, sort_keys=True)
+
+      # only touches the file if its contents change
+      if os.path.exists(filename):
+        with open(filename) as f:
+          if f.read() == contents: continue
+      self.announce("writing %s" % filename, level=distutils.log.INFO)
+      with open(filename, 'w') as f:
+        f.write(contents)
+
+
+  def build_extension(self, ext):
+    """Builds the given extension.
+
+    When the extension is of type Library, it compiles the library with CMake, otherwise the default compilation mechanism is used.
+    Afterwards, it adds the according library, and the include and library directories of the Library's, so that other Extensions can find the newly generated lib.
+    """
+
     # check if it is our type of extension
     if isinstance(ext, Library):
       # TODO: get compiler and add it to the compiler
       # TODO: get the debug status and add the build_type parameter
       # build libraries using the provided functions
       # compile
-      ext.compile(self.build_lib)
-      libs = [ext.c_name]
-      lib_dirs = [ext.c_target_directory]
-      include_dirs = [ext.c_self_include_directory]
-
-      # set the DEFAULT library path and include path for all other extensions
-      for other_ext in self.extensions:
-        if other_ext != ext:
-          other_ext.libraries = libs + (other_ext.libraries if other_ext.libraries else [])
-          other_ext.library_dirs = lib_dirs + (other_ext.library_dirs if other_ext.library_dirs else [])
-          other_ext.include_dirs = include_dirs + (other_ext.include_dirs if other_ext.include_dirs else [])
+      registered = [k for k, v in getattr(self, '_libraries', [])]
+      libraries = registered if ext in registered else [ext]
+      if self.superbuild:
+        # all Library's are built together with the first one
+        if ext is not libraries[0]: return
+        built = libraries
+      else:
+        built = [ext]
+
+      try:
+        if self.superbuild:
+          self.build_superbuild(built)
+        else:
+          ext.compile(self.build_lib, jobs=self.jobs, verbose=self.verbose > 1)
+      except:
+        # the following Library's are skipped, so they cannot be linked against either
+        self._finish_libraries(libraries[libraries.index(ext):], failed=True)
+        raise
+      self._finish_libraries(built)
+
+      if self.no_pipeline or ext not in registered:
+        for library in built:
+          self._add_library(library, library.c_target_directory)
+    else:
+      sources = ext.sources
+      batches = self._unity_batches(ext)
+      try:
+        try:
+          self._build_sources(ext, sources if batches is None else batches[0])
+        except distutils.errors.CompileError as e:
+          if not batches or not batches[1]: raise
+          # the sources of failed batches (e.g., defining the same symbols) are compiled separately
+          failed = [obj for obj, error in getattr(e, 'errors', [])]
+          retry = []
+          for source, obj in zip(batches[0], self.compiler.object_filenames(batches[0], output_dir=self.get_object_directory(ext))):
+            if source in batches[1] and (obj in failed or not failed):
+              self.warn("building unity batch '%s' failed; compiling its sources separately" % source)
+              retry.extend(batches[1][source])
+            else:
+              retry.append(source)
+          self._build_sources(ext, retry)
+      finally:
+        ext.sources = sources
+
+
+  def get_object_directory(self, ext):
+    """Returns the directory where the objects of the given (non-Library) extension are compiled into; ISA variants use ``isa/<level>`` inside ``build_temp``"""
+
+    if getattr(ext, 'isa_name', None) is None:
+      return self.build_temp
+    return os.path.join(self.build_temp, 'isa', ext.isa_level)
+
+
+  def _build_sources(self, ext, sources):
+    """Builds the given (non-Library) extension from the given sources"""
+
+    ext.sources = sources
+    # include the precompiled header into all sources
+    if getattr(ext, 'precompiled_header', None) and getattr(self, 'precompiled_headers', None) is not None:
+      args = self.precompiled_headers.register(ext.precompiled_header)
+      if args[1] not in ext.extra_compile_args:
+        ext.extra_compile_args = ext.extra_compile_args + args
+    objects = self.compiler.object_filenames(ext.sources, output_dir=self.get_object_directory(ext))
+    build_telemetry.set_owner(objects + [self.get_ext_fullpath(ext.name)], ext.name)
+    # rebuild the extension when one of the headers of its objects changed
+    if self.dependencies is not None:
+      headers = [k for obj in objects for k in self.dependencies.dependencies(obj)]
+      ext.depends = uniq(ext.depends + [k for k in headers if os.path.exists(k)])
+    if getattr(ext, 'isa_name', None) is not None:
+      # the objects of ISA variants are compiled into a directory of their own
+      self._build_variant(ext)
     else:
       # all other libs are build with the default command
       _build_ext.build_extension(self, ext)
 
 
+  def _build_variant(self, ext):
+    """Builds the given ISA variant of an extension, compiling its objects into its :py:meth:`get_object_directory`, so that they do not overwrite the objects of the other variants.
+
+    Those lines follow ``build_extension`` of distutils, which compiles all objects into ``build_temp``.
+    """
+
+    sources = sorted(ext.sources)
+    ext_path = self.get_ext_fullpath(ext.name)
+    if not (self.force or newer_group(sources + ext.depends, ext_path, 'newer')):
+      distutils.log.debug("skipping '%s' extension (up-to-date)", ext.name)
+      return
+    distutils.log.info("building '%s' extension", ext.name)
+
+    output_dir = self.get_object_directory(ext)
+    macros = ext.define_macros[:] + [(k,) for k in ext.undef_macros]
+    objects = self.compiler.compile(sources, output_dir=output_dir, macros=macros, include_dirs=ext.include_dirs,
+        debug=self.debug, extra_postargs=ext.extra_compile_args or [], depends=ext.depends)
+    self.compiler.link_shared_object(objects + (ext.extra_objects or []), ext_path,
+        libraries=self.get_libraries(ext), library_dirs=ext.library_dirs, runtime_library_dirs=ext.runtime_library_dirs,
+        extra_postargs=ext.extra_link_args or [], export_symbols=self.get_export_symbols(ext), debug=self.debug,
+        build_temp=output_dir, target_lang=ext.language or self.compiler.detect_language(sources))
+
+
+  def _unity_batches(self, ext):
+    """Writes the unity batches of the given extension, if enabled (see :py:mod:`bob.extension.unity`).
+
+    Returns ``None`` if the sources are compiled separately.
+    Otherwise, returns the list of sources to compile (the batch files and the sources that cannot be merged), and a dictionary with the sources merged into each batch file.
+    """
+
+    # Python bindings often define macros for the headers they include, so they are only merged on request, and not by BOB_BUILD_UNITY
+    if getattr(ext, 'unity', None) is None: return None
+    count = unity.batch_count(ext.unity, self.parallel)
+    if count is None: return None
+    batches, separate = unity.plan(ext.sources, count)
+    filenames = unity.write_batches(os.path.join(self.build_temp, 'unity'), ext.name.replace('.', '_'), batches)
+    return filenames + separate, dict(zip(filenames, batches))
+
+
+  def build_superbuild(self, libraries):
+    """Builds the given :py:class:`Library`'s with a single CMake project in ``build_cmake/bob_extension_superbuild``.
+
+    Each Library is a separate target of the project, so the project is configured only once, and all Library's are built with a single parallel ``make`` or ``ninja`` call.
+    Library's that list other Library's of the package in their ``libraries`` are linked after them.
+    """
+
+    generators = [ext.cmake_lists_generator(self.build_lib, self.jobs) for ext in libraries]
+    build_dir = os.path.join(os.path.dirname(os.path.realpath(self.build_lib)), 'build_cmake', SUPERBUILD_NAME)
+    if not os.path.exists(build_dir):
+      os.makedirs(build_dir)
+    superbuild = CMakeSuperbuildGenerator(SUPERBUILD_NAME, generators)
+    superbuild.generate(libraries[0].c_package_directory, build_dir)
+
+    try:
+      libraries[0].run_cmake(build_dir, jobs=self.jobs, verbose=self.verbose > 1)
+    except CMakeBuildError:
+      if not any(generator.unity_batches for generator in generators): raise
+      # sources that cannot be compiled together are compiled separately
+      self.warn("building the unity batches failed; compiling the sources of all Library's separately")
+      for generator in generators: generator.unity_batches = None
+      superbuild.generate(libraries[0].c_package_directory, build_dir)
+      libraries[0].run_cmake(build_dir, jobs=self.jobs, verbose=self.verbose > 1)
+
+
+  def _finish_libraries(self, libraries, failed=False):
+    """Wakes up the extensions waiting for the given Library's in :py:meth:`get_libraries`"""
+
+    for library, finished in getattr(self, '_libraries', []):
+      if library in libraries:
+        if failed: self._failed_libraries.add(library.name)
+        finished.set()
+
+
+  def _add_library(self, ext, target_directory):
+    """Adds the given Library, its include directory and the given target directory to all other extensions"""
+
+    # extensions are linked against the original library, which has the SONAME of all variants
+    if getattr(ext, 'isa_name', None) is not None: return
+
+    libs = [ext.c_name]
+    lib_dirs = [target_directory]
+    include_dirs = [ext.c_self_include_directory]
+
+    # set the DEFAULT library path and include path for all other extensions
+    for other_ext in self.extensions:
+      if other_ext != ext:
+        other_ext.libraries = libs + (other_ext.libraries if other_ext.libraries else [])
+        other_ext.library_dirs = lib_dirs + (other_ext.library_dirs if other_ext.library_dirs else [])
+        other_ext.include_dirs = include_dirs + (other_ext.include_dirs if other_ext.include_dirs else [])
+
+
+  def get_libraries(self, ext):
+    """Returns the libraries to link the given extension with, after waiting for all :py:class:`Library`'s to be built"""
+
+    for library, finished in getattr(self, '_libraries', []):
+      if library is ext: continue
+      finished.wait()
+      if library.name in self._failed_libraries:
+        raise distutils.errors.LinkError("cannot link '%s', since building '%s' failed" % (ext.name, library.name))
+    return _build_ext.get_libraries(self, ext)
+
+
   def get_ext_filename(self, fullname):
     """Returns the library path for the given name"""
     filename = _build_ext.get_ext_filename(self, fullname)
@@ -669,35 +1858,6 @@ class build_ext(_build_ext):
 
 
 
-## Compile in parallel, when BOB_BUILD_PARALLEL is given
-# see http://stackoverflow.com/questions/11013851/speeding-up-build-process-with-distutils
-if "BOB_BUILD_PARALLEL" in os.environ:
-  # monkey-patch for parallel compilation
-  def parallelCCompile(self, sources, output_dir=None, macros=None, include_dirs=None, debug=0, extra_preargs=None, extra_postargs=None, depends=None):
-      # those lines are copied from distutils.ccompiler.CCompiler directly
-      macros, objects, extra_postargs, pp_opts, build = self._setup_compile(output_dir, macros, include_dirs, sources, depends, extra_postargs)
-      cc_args = self._get_cc_args(pp_opts, debug, extra_preargs)
-      # parallel code
-      N = min(int(os.environ["BOB_BUILD_PARALLEL"]), len(objects)) # number of parallel compilations
-      import multiprocessing.pool
-      def _single_compile(obj):
-          try: src, ext = build[obj]
-          except KeyError: return
-          self._compile(obj, src, ext, cc_args, extra_postargs, pp_opts)
-      # create process pool
-      pool = multiprocessing.pool.ThreadPool(N)
-      # execute each compilation in a separate process
-      pool.map(_single_compile, objects)
-      # wait until all processes finished
-      pool.close()
-      pool.join()
-
-      return objects
-
-  import distutils.ccompiler
-  distutils.ccompiler.CCompiler.compile=parallelCCompile
-
-
 def get_config(package=__name__, externals=None, api_version=None):
   """Returns a string containing the configuration information for the given ``package`` name.
   By default, it returns the configuration of this package.
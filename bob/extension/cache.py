@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Fri 16 Oct 2026 14:12:05 CEST
+
+"""A content-addressed cache for the object files compiled by build_ext"""
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+import threading
+import subprocess
+
+from .utils import cache_directory
+from .depends import strip_dependency_flags
+
+#: Size of the object cache, if ``BOB_BUILD_CACHE_SIZE`` is not set
+DEFAULT_SIZE = '5G'
+
+_units = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+
+def parse_size(size):
+  """Converts a size like ``500M`` or ``5G`` into a number of bytes"""
+
+  match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$', str(size), re.IGNORECASE)
+  if match is None:
+    raise ValueError("cannot parse size `%s'" % size)
+  return int(float(match.group(1)) * _units[match.group(2).upper()])
+
+
+_compiler_identities = {}
+
+def compiler_identity(executable):
+  """Returns (memoized) a string identifying the given compiler
+
+  The identity consists of the output of ``executable --version`` and of the
+  size and modification time of the executable, so that updating the compiler
+  in place invalidates all objects it has compiled.
+  """
+
+  if executable not in _compiler_identities:
+    try:
+      from distutils.spawn import find_executable
+      path = os.path.realpath(find_executable(executable) or executable)
+      stat = os.stat(path)
+      version = subprocess.Popen([executable, '--version'],
+          stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()[0]
+      identity = '%s:%d:%d:%s' % (path, stat.st_size, int(stat.st_mtime),
+          version.decode('utf8', 'replace'))
+    except OSError:
+      identity = None
+    _compiler_identities[executable] = identity
+  return _compiler_identities[executable]
+
+
+_prefix_map_flags = {}
+
+def prefix_map_flag(executable):
+  """Returns (memoized) the option of the given compiler that replaces path
+  prefixes in the compiled output, or ``None`` if it does not support any
+
+  ``-ffile-prefix-map`` (GCC >= 8, Clang >= 10) also applies to ``__FILE__``,
+  while ``-fdebug-prefix-map`` only applies to debug information.
+  """
+
+  if executable not in _prefix_map_flags:
+    _prefix_map_flags[executable] = None
+    for flag in ('-ffile-prefix-map', '-fdebug-prefix-map'):
+      try:
+        process = subprocess.Popen([executable, '%s=%s=.' % (flag, os.sep), '-E', '-x', 'c', os.devnull],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        process.communicate()
+      except OSError:
+        break
+      if process.returncode == 0:
+        _prefix_map_flags[executable] = flag
+        break
+  return _prefix_map_flags[executable]
+
+
+class ObjectCache:
+  """A cache of object files shared by all builds on this machine
+
+  Each object file is stored under a key computed from the identity of the
+  compiler (see :py:func:`compiler_identity`), all compiler options and the
+  preprocessed source code. If an object for the same key was compiled before,
+  it is copied from the cache instead of running the compiler.
+
+  To allow cache hits between source trees in different directories, paths
+  below the ``base_directory`` (by default, the current working directory,
+  i.e., the directory of ``setup.py``) are considered relative to it when
+  computing the key. The compiler is asked to do the same in its output with
+  ``-ffile-prefix-map`` (or ``-fdebug-prefix-map``). If it does not support
+  either of those, the ``base_directory`` becomes part of the key.
+
+  Once more than ``max_size`` bytes are stored, the least recently used
+  objects are removed when :py:meth:`cleanup` is called.
+
+  Parameters:
+
+  directory, str
+    The directory where the objects are stored
+
+  max_size, int
+    The maximum size of the cache, in bytes
+
+  base_directory, str
+    The directory whose paths are made relative when computing keys
+  """
+
+  def __init__(self, directory, max_size, base_directory=None):
+    self.directory = directory
+    self.max_size = max_size
+    self.base_directory = os.path.realpath(base_directory or os.getcwd())
+    self.hits = 0
+    self.misses = 0
+    self.stored = 0
+    self._lock = threading.Lock()
+
+  @classmethod
+  def from_environment(cls):
+    """Returns the cache configured by the environment, or ``None``
+
+    The cache is only used if ``BOB_BUILD_CACHE`` is set. Objects are stored in
+    its ``objects`` subdirectory, and its size is limited by
+    ``BOB_BUILD_CACHE_SIZE`` (e.g., ``500M`` or ``10G``), which defaults to
+    :py:data:`DEFAULT_SIZE`.
+    """
+
+    directory = cache_directory('objects')
+    if directory is None: return None
+    return cls(directory, parse_size(os.environ.get('BOB_BUILD_CACHE_SIZE', DEFAULT_SIZE)))
+
+  def install(self, compiler):
+    """Makes the given :py:class:`distutils.ccompiler.CCompiler` use this cache
+    for all its compilations"""
+
+    original = compiler._compile
+
+    def _compile(obj, src, ext, cc_args, extra_postargs, pp_opts):
+      self.compile(compiler, original, obj, src, ext, cc_args, extra_postargs, pp_opts)
+
+    compiler._compile = _compile
+
+  def _relative(self, text):
+    """Replaces the base directory in the given (byte) string by ``.``"""
+
+    if isinstance(text, bytes):
+      return text.replace(self.base_directory.encode('utf8'), b'.')
+    return text.replace(self.base_directory, '.')
+
+  def key(self, compiler, src, cc_args, extra_postargs):
+    """Computes the key for compiling ``src`` with the given options
+
+    Options that generate dependency files (like ``-MMD -MF <file>``) are not
+    part of the key, but the dependency file is written while preprocessing.
+
+    Returns ``None`` if the source cannot be preprocessed; in this case, the
+    compiler should be run to report the error.
+    """
+
+    executable = compiler.compiler_so[0]
+    identity = compiler_identity(executable)
+    if identity is None: return None
+
+    command = compiler.compiler_so + cc_args + ['-E', src] + extra_postargs
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    preprocessed = process.communicate()[0]
+    if process.returncode != 0: return None
+
+    digest = hashlib.sha256()
+    digest.update(identity.encode('utf8'))
+    flags = strip_dependency_flags(compiler.compiler_so + cc_args + extra_postargs)
+    digest.update(json.dumps([self._relative(k) for k in flags]).encode('utf8'))
+    if prefix_map_flag(executable) is None:
+      digest.update(self.base_directory.encode('utf8'))
+    digest.update(self._relative(preprocessed))
+    return digest.hexdigest()
+
+  def path(self, key):
+    """Returns the file name of the object stored for the given key"""
+
+    return os.path.join(self.directory, key[:2], key[2:] + '.o')
+
+  def compile(self, compiler, original, obj, src, ext, cc_args, extra_postargs, pp_opts):
+    """Compiles a single object file using the cache
+
+    The ``original`` function is the ``_compile`` method of the ``compiler``,
+    which is called in case of a cache miss.
+    """
+
+    flag = prefix_map_flag(compiler.compiler_so[0])
+    if flag is not None:
+      extra_postargs = extra_postargs + ['%s=%s=.' % (flag, self.base_directory)]
+
+    key = self.key(compiler, src, cc_args, extra_postargs)
+    if key is not None:
+      cached = self.path(key)
+      try:
+        shutil.copyfile(cached, obj)
+        os.utime(cached, None) # marks it as recently used
+        with self._lock: self.hits += 1
+        logging.getLogger('bob.extension').debug("object cache hit for `%s'" % src)
+        return
+      except (IOError, OSError):
+        pass
+
+    with self._lock: self.misses += 1
+    original(obj, src, ext, cc_args, extra_postargs, pp_opts)
+
+    if key is not None:
+      self.store(cached, obj)
+
+  def store(self, cached, obj):
+    """Stores the compiled object file under the given cache path"""
+
+    directory = os.path.dirname(cached)
+    tmp = '%s.%d.%d' % (cached, os.getpid(), threading.current_thread().ident)
+    try:
+      if not os.path.exists(directory):
+        os.makedirs(directory)
+      shutil.copyfile(obj, tmp)
+      os.rename(tmp, cached)
+      with self._lock: self.stored += os.path.getsize(cached)
+    except (IOError, OSError):
+      # the cache is only an optimization
+      if os.path.exists(tmp): os.remove(tmp)
+
+  def cleanup(self):
+    """Removes the least recently used objects until the cache fits into its
+    maximum size"""
+
+    if not self.stored: return
+
+    entries = []
+    for path, directories, files in os.walk(self.directory):
+      for name in files:
+        filename = os.path.join(path, name)
+        try:
+          stat = os.stat(filename)
+        except OSError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, filename))
+
+    total = sum(k[1] for k in entries)
+    for mtime, size, filename in sorted(entries):
+      if total <= self.max_size: break
+      try:
+        os.remove(filename)
+        total -= size
+      except OSError:
+        pass
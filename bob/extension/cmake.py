@@ -43,11 +43,130 @@ HEADER = (
   'set(BUILD_SHARED_LIBS "ON" CACHE BOOL "Build shared libs")\n\n'
 )
 
+# The file recording the inputs of the last successful configuration of a build directory
+STAMP_NAME = 'bob_extension_configure.stamp'
+
+# Environment variables that are read by CMake when configuring (see HEADER)
+CONFIGURE_VARIABLES = ('CC', 'CXX', 'CFLAGS', 'CXXFLAGS', 'CPPFLAGS', 'LDFLAGS', 'CMAKE_PREFIX_PATH')
+
+# The name of the CMake project that builds all Libraries of a package at once
+SUPERBUILD_NAME = 'bob_extension_superbuild'
+
+# The CMake generators that can be used to build Libraries, and the corresponding build tools
+GENERATORS = {'Ninja' : 'ninja', 'Unix Makefiles' : 'make'}
+
+
+# The versions of the ninja executables used so far
+_ninja_versions = {}
+
+def is_ninja(build_tool):
+  """Checks if the given build tool is ``ninja``, as opposed to ``make``"""
+
+  return os.path.splitext(os.path.basename(build_tool))[0] == 'ninja'
+
+
+def supports_jobserver(build_tool, jobserver):
+  """Checks if the given ``make`` or ``ninja`` executable takes its jobs from
+  the given :py:class:`bob.extension.scheduler.JobServer`
+
+  ninja does since version 1.13, but only from jobservers announced by their
+  named pipe (``--jobserver-auth=fifo:PATH``), while anonymous pipes are
+  ignored.
+  """
+
+  if not is_ninja(build_tool): return True
+  if jobserver.fifo is None: return False
+  if build_tool not in _ninja_versions:
+    import re
+    import subprocess
+    try:
+      version = subprocess.check_output([build_tool, '--version']).decode('utf8', 'replace')
+      match = re.match(r'\s*(\d+)\.(\d+)', version)
+      _ninja_versions[build_tool] = (int(match.group(1)), int(match.group(2))) if match is not None else None
+    except (OSError, subprocess.CalledProcessError):
+      _ninja_versions[build_tool] = None
+  version = _ninja_versions[build_tool]
+  return version is not None and version >= (1, 13)
+
+
+class CMakeBuildError(OSError):
+  """Raised when ``make`` or ``ninja`` fails to build a configured CMake
+  project, as opposed to errors when configuring it"""
+
+
+def cached_generator(build_directory):
+  """Returns the CMake generator that the given build directory was configured with, or ``None`` if it is not configured."""
+  try:
+    with open(os.path.join(build_directory, "CMakeCache.txt")) as f:
+      for line in f:
+        if line.startswith('CMAKE_GENERATOR:'):
+          return line.split('=', 1)[1].strip()
+  except (IOError, OSError):
+    pass
+  return None
+
+
+def clean_build_directory(build_directory):
+  """Removes everything but the CMakeLists.txt file from the given build directory, e.g., before configuring it with another generator."""
+  import shutil
+  for name in os.listdir(build_directory):
+    if name == "CMakeLists.txt": continue
+    path = os.path.join(build_directory, name)
+    if os.path.isdir(path) and not os.path.islink(path):
+      shutil.rmtree(path)
+    else:
+      os.remove(path)
+
+
+def configure_stamp(build_directory, command, environ):
+  """Returns a string identifying the inputs of configuring the given build directory with CMake.
+
+  Keyword parameters:
+
+  build_directory : string
+    The directory containing the CMakeLists.txt file
+
+  command : [string]
+    The CMake command line
+
+  environ : dict
+    The environment CMake is run in; only the :py:data:`CONFIGURE_VARIABLES` are taken into account
+  """
+  import hashlib
+  digest = hashlib.sha1()
+  with open(os.path.join(build_directory, "CMakeLists.txt"), 'rb') as f:
+    digest.update(f.read())
+  digest.update(repr(list(command)).encode('utf8'))
+  digest.update(repr([(k, environ.get(k)) for k in CONFIGURE_VARIABLES]).encode('utf8'))
+  return digest.hexdigest()
+
+
+def is_configured(build_directory, stamp):
+  """Checks if the given build directory was successfully configured with the inputs identified by ``stamp`` (see :py:func:`configure_stamp`)."""
+  if not os.path.exists(os.path.join(build_directory, "CMakeCache.txt")):
+    return False
+  try:
+    with open(os.path.join(build_directory, STAMP_NAME)) as f:
+      return f.read().strip() == stamp
+  except (IOError, OSError):
+    return False
+
+
+def set_configured(build_directory, stamp):
+  """Records that the given build directory was configured with the inputs identified by ``stamp``; ``None`` removes the record."""
+  filename = os.path.join(build_directory, STAMP_NAME)
+  if stamp is None:
+    if os.path.exists(filename):
+      os.remove(filename)
+  else:
+    with open(filename, 'w') as f:
+      f.write(stamp + '\n')
+
 
 class CMakeListsGenerator:
   """Generates a CMakeLists.txt file for the given sources, include directories and libraries."""
 
-  def __init__(self, name, sources, target_directory, version = '1.0.0', include_directories = [], system_include_directories=[], libraries = [], library_directories = [], macros = []):
+  def __init__(self, name, sources, target_directory, version = '1.0.0', include_directories = [], system_include_directories=[], libraries = [], library_directories = [], macros = [], unity_batches = None, precompiled_header = None, compile_flags = [], link_flags = [], soname = None, depends = []):
     """Initializes the CMakeLists generator.
 
     Keyword parameters:
@@ -79,6 +198,24 @@ class CMakeListsGenerator:
 
     macros : [(string, string)]
       A list of preprocessor defines ``name=value`` that will be added to the compilation
+
+    unity_batches : int or ``None``
+      If given, the ``sources`` are merged into (at most) this number of unity batch files, see :py:func:`bob.extension.unity.plan`
+
+    precompiled_header : string or ``None``
+      The absolute path of a header that is included into and precompiled for all C++ ``sources``
+
+    compile_flags : [string]
+      Additional compiler options for this library, e.g., for profile-guided optimization
+
+    link_flags : [string]
+      Additional linker options for this library
+
+    soname : string or ``None``
+      The ``SONAME`` of the library, if it should differ from its file name, e.g., for the variants of :py:mod:`bob.extension.isa`
+
+    depends : [string]
+      Files that all ``sources`` depend on, but which the compiler does not list, e.g., the profiles of :py:mod:`bob.extension.pgo`
     """
 
     self.name = name
@@ -90,43 +227,154 @@ class CMakeListsGenerator:
     self.libraries = libraries
     self.library_directories = library_directories
     self.macros = macros
+    self.unity_batches = unity_batches
+    self.precompiled_header = precompiled_header
+    self.compile_flags = compile_flags
+    self.link_flags = link_flags
+    self.soname = soname
+    self.depends = depends
+
+  def contents(self, source_directory, subproject = False, source_files = None):
+    """Returns the contents of the CMakeLists.txt file for the given source directory.
+
+    If ``subproject`` is set, the file is meant to be added to a :py:class:`CMakeSuperbuildGenerator` project, which contains the global settings.
+    The ``source_files`` to compile, if given, replace the ``sources`` of this library.
+    """
+
+    if source_files is None:
+      # source and target in different directories -> use absolute paths
+      source_files = [os.path.join(os.path.realpath(source_directory), s) for s in self.sources]
+
+    lines = []
+    lines.append('# WARNING! This file is automatically generated. Do not change its contents.\n\n')
+    if not subproject:
+      lines.append('cmake_minimum_required(VERSION 2.8)\n')
+    lines.append('project(%s)\n' % self.name)
+    if not subproject:
+      lines.append(HEADER)
+    # add include directories
+    for directory in self.includes:
+      lines.append('include_directories(%s)\n' % directory)
+    for directory in self.system_includes:
+      lines.append('include_directories(SYSTEM %s)\n' % directory)
+    # add link directories
+    # TODO: handle RPATH and Non-RPATH differently (don't know, how, though)
+    for directory in self.library_directories:
+      lines.append('link_directories(%s)\n' % directory)
+    # add defines
+    for macro in self.macros:
+      lines.append('add_definitions(-D%s=%s)\n' % macro)
+    # compile this library
+    lines.append('\nadd_library(${PROJECT_NAME} \n\t' + "\n\t".join(source_files) + '\n)\n')
+    lines.append('set_target_properties(${PROJECT_NAME} PROPERTIES POSITION_INDEPENDENT_CODE TRUE)\n')
+    lines.append('set_target_properties(${PROJECT_NAME} PROPERTIES LIBRARY_OUTPUT_DIRECTORY %s)\n\n' % self.target_directory)
+    # files that the compiler does not list as dependencies
+    if self.depends:
+      lines.append('set_source_files_properties(\n\t' + "\n\t".join(source_files) + '\n\tPROPERTIES OBJECT_DEPENDS "%s"\n)\n\n' % ";".join(self.depends))
+    # precompile the header, if CMake supports it, or include it otherwise
+    if self.precompiled_header:
+      lines.append('if(NOT CMAKE_VERSION VERSION_LESS 3.16)\n')
+      lines.append('  target_precompile_headers(${PROJECT_NAME} PRIVATE "$<$<COMPILE_LANGUAGE:CXX>:%s>")\n' % self.precompiled_header)
+      lines.append('else()\n')
+      lines.append('  set_target_properties(${PROJECT_NAME} PROPERTIES COMPILE_FLAGS "-include %s")\n' % self.precompiled_header)
+      lines.append('endif()\n\n')
+    # additional options
+    if self.compile_flags:
+      lines.append('set_property(TARGET ${PROJECT_NAME} APPEND_STRING PROPERTY COMPILE_FLAGS " %s")\n' % " ".join(self.compile_flags))
+    if self.link_flags:
+      lines.append('set_property(TARGET ${PROJECT_NAME} APPEND_STRING PROPERTY LINK_FLAGS " %s")\n' % " ".join(self.link_flags))
+    if self.soname:
+      lines.append('set_target_properties(${PROJECT_NAME} PROPERTIES NO_SONAME TRUE)\n')
+      lines.append('set_property(TARGET ${PROJECT_NAME} APPEND_STRING PROPERTY LINK_FLAGS " -Wl,-soname,%s")\n' % self.soname)
+    # link libraries
+    if self.libraries:
+      lines.append('target_link_libraries(${PROJECT_NAME} %s)\n\n' % " ".join(self.libraries))
+
+    return ''.join(lines)
+
+  def generate(self, source_directory, build_directory, subproject = False):
+    """Generates the CMakeLists.txt file in the given directory.
+
+    The file is only written if its contents changed, so that CMake does not reconfigure the build unnecessarily.
+    If ``unity_batches`` are enabled, the batch files are written into the same directory.
+    Returns ``True`` if the file was written, ``False`` otherwise.
+    """
+
+    _set_default_flags()
+    source_files = None
+    if self.unity_batches:
+      from .unity import plan, write_batches
+      source_files = [os.path.join(os.path.realpath(source_directory), s) for s in self.sources]
+      batches, separate = plan(source_files, self.unity_batches)
+      source_files = write_batches(os.path.realpath(build_directory), self.name, batches) + separate
+    return _write_if_changed(os.path.join(build_directory, "CMakeLists.txt"), self.contents(source_directory, subproject, source_files))
+
+
+class CMakeSuperbuildGenerator:
+  """Generates a single CMake project that builds several libraries, each of them described by a :py:class:`CMakeListsGenerator`.
+
+  Each library is added as a sub-directory with its own target.
+  Libraries that link against other libraries of the project are built after them.
+  """
+
+  def __init__(self, name, generators):
+    """Initializes the superbuild generator.
+
+    Keyword parameters:
+
+    name : string
+      The name of the CMake project
+
+    generators : [:py:class:`CMakeListsGenerator`]
+      The generators of all libraries of the project
+    """
+    self.name = name
+    self.generators = generators
+
+  def contents(self):
+    """Returns the contents of the top-level CMakeLists.txt file."""
+
+    lines = []
+    lines.append('# WARNING! This file is automatically generated. Do not change its contents.\n\n')
+    lines.append('cmake_minimum_required(VERSION 2.8)\n')
+    lines.append('project(%s)\n' % self.name)
+    lines.append(HEADER)
+    for generator in self.generators:
+      lines.append('add_subdirectory(%s)\n' % generator.name)
+
+    return ''.join(lines)
 
   def generate(self, source_directory, build_directory):
-    """Generates the CMakeLists.txt file in the given directory."""
+    """Generates the top-level CMakeLists.txt file in the given directory, and the one of each library in a sub-directory of the same name.
+
+    Only files whose contents changed are written.
+    Returns ``True`` if any file was written, ``False`` otherwise.
+    """
 
-    # check if CFLAGS or CXXFLAGS are set, and set them if not
-    if 'CFLAGS' not in os.environ:
-      os.environ['CFLAGS'] = '-O3 -g0 -DNDEBUG -mtune=generic'
-    if 'CXXFLAGS' not in os.environ:
-      os.environ['CXXFLAGS'] = '-O3 -g0 -DNDEBUG -mtune=generic'
+    _set_default_flags()
+    changed = _write_if_changed(os.path.join(build_directory, "CMakeLists.txt"), self.contents())
+    for generator in self.generators:
+      directory = os.path.join(build_directory, generator.name)
+      if not os.path.exists(directory):
+        os.makedirs(directory)
+      changed = generator.generate(source_directory, directory, subproject=True) or changed
+    return changed
 
-    source_dir = os.path.realpath(source_directory)
 
-    # source and target in different directories -> use absolute paths
-    source_files = [os.path.join(source_dir, s) for s in self.sources]
+def _set_default_flags():
+  """Sets CFLAGS and CXXFLAGS, if they are not set yet"""
+  if 'CFLAGS' not in os.environ:
+    os.environ['CFLAGS'] = '-O3 -g0 -DNDEBUG -mtune=generic'
+  if 'CXXFLAGS' not in os.environ:
+    os.environ['CXXFLAGS'] = '-O3 -g0 -DNDEBUG -mtune=generic'
 
-    filename = os.path.join(build_directory, "CMakeLists.txt")
-    with open(filename, 'w') as f:
-      f.write('# WARNING! This file is automatically generated. Do not change its contents.\n\n')
-      f.write('cmake_minimum_required(VERSION 2.8)\n')
-      f.write('project(%s)\n' % self.name)
-      f.write(HEADER)
-      # add include directories
-      for directory in self.includes:
-        f.write('include_directories(%s)\n' % directory)
-      for directory in self.system_includes:
-        f.write('include_directories(SYSTEM %s)\n' % directory)
-      # add link directories
-      # TODO: handle RPATH and Non-RPATH differently (don't know, how, though)
-      for directory in self.library_directories:
-        f.write('link_directories(%s)\n' % directory)
-      # add defines
-      for macro in self.macros:
-        f.write('add_definitions(-D%s=%s)\n' % macro)
-      # compile this library
-      f.write('\nadd_library(${PROJECT_NAME} \n\t' + "\n\t".join(source_files) + '\n)\n')
-      f.write('set_target_properties(${PROJECT_NAME} PROPERTIES POSITION_INDEPENDENT_CODE TRUE)\n')
-      f.write('set_target_properties(${PROJECT_NAME} PROPERTIES LIBRARY_OUTPUT_DIRECTORY %s)\n\n' % self.target_directory)
-      # link libraries
-      if self.libraries:
-        f.write('target_link_libraries(${PROJECT_NAME} %s)\n\n' % " ".join(self.libraries))
+
+def _write_if_changed(filename, contents):
+  """Writes the given contents into the file, unless it already contains them; returns ``True`` if the file was written"""
+  if os.path.exists(filename):
+    with open(filename) as f:
+      if f.read() == contents: return False
+
+  with open(filename, 'w') as f:
+    f.write(contents)
+  return True
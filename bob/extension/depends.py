@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Fri 16 Oct 2026 16:47:31 CEST
+
+"""Tracks the headers included by each object file compiled by build_ext"""
+
+import os
+import re
+import json
+import threading
+
+#: Name of the dependency database inside ``build_temp``
+DATABASE_NAME = 'bob_extension_depends.json'
+
+#: Options that only control the generation of dependency files
+DEPENDENCY_FLAGS = ('-MD', '-MMD', '-MP')
+DEPENDENCY_OPTIONS = ('-MF', '-MT', '-MQ')
+
+def strip_dependency_flags(args):
+  """Removes the options that generate dependency files from the given
+  compiler arguments"""
+
+  retval = []
+  skip = False
+  for arg in args:
+    if skip:
+      skip = False
+    elif arg in DEPENDENCY_OPTIONS:
+      skip = True
+    elif arg not in DEPENDENCY_FLAGS and arg[:3] not in DEPENDENCY_OPTIONS:
+      retval.append(arg)
+  return retval
+
+def parse_depfile(filename):
+  """Returns the list of prerequisites in a make rule written by ``-MMD``
+
+  Line continuations, escaped spaces (``\\ ``) and dollar signs (``$$``) are
+  handled like GNU make does.
+  """
+
+  with open(filename) as f:
+    contents = f.read().replace('\\\n', ' ')
+
+  # the first rule lists all prerequisites; others (-MP) are empty
+  target, sep, prerequisites = contents.partition(': ')
+  if not sep: return []
+  prerequisites = prerequisites.split('\n', 1)[0]
+
+  return [k.replace('\\ ', ' ').replace('$$', '$')
+      for k in re.split(r'(?<!\\)\s+', prerequisites.strip()) if k]
+
+def add_dependencies(filename, dependencies):
+  """Adds the given files to the prerequisites of the first rule in a make
+  rule file written by ``-MMD``, e.g., the headers of a precompiled header
+  that the compiler does not list"""
+
+  try:
+    with open(filename) as f:
+      contents = f.read()
+  except (IOError, OSError):
+    return
+
+  existing = parse_depfile(filename)
+  added = [k for k in dependencies if k not in existing]
+  if not added: return
+
+  # the first rule ends at the first line that is not continued
+  match = re.search(r'(?<!\\)\n', contents)
+  end = match.start() if match else len(contents)
+  escaped = ' '.join(k.replace('$', '$$').replace(' ', '\\ ') for k in added)
+  with open(filename, 'w') as f:
+    f.write(contents[:end] + ' \\\n  ' + escaped + contents[end:])
+
+
+class DependencyDatabase:
+  """A persistent record of the files each object file was compiled from
+
+  When :py:meth:`install`\\ed on a compiler, each object is compiled with
+  ``-MMD -MF <object>.d`` and the source and (non-system) header files listed
+  by the compiler are recorded together with the command used. In later
+  builds, an object is only compiled again if its command changed, or if one
+  of the recorded files is newer than the object or was removed.
+
+  Files that all objects depend on, but the compiler does not list (e.g., the
+  profiles of :py:mod:`bob.extension.pgo`), can be added to the list
+  ``common``.
+
+  Parameters:
+
+  filename, str
+    The JSON file where the database is stored, usually
+    :py:data:`DATABASE_NAME` inside ``build_temp``
+  """
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.compiled = 0
+    self.skipped = 0
+    self.common = []
+    self._lock = threading.Lock()
+    try:
+      with open(filename) as f:
+        self._entries = json.load(f)
+    except (IOError, OSError, ValueError):
+      self._entries = {}
+
+  def save(self):
+    """Writes the database to disk"""
+
+    directory = os.path.dirname(self.filename)
+    tmp = '%s.%d' % (self.filename, os.getpid())
+    try:
+      if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+      with self._lock:
+        with open(tmp, 'wt') as f:
+          json.dump(self._entries, f, indent=1, sort_keys=True)
+      os.rename(tmp, self.filename)
+    except (IOError, OSError):
+      pass # the next build is then a full one
+
+  def dependencies(self, obj):
+    """Returns the files the given object was compiled from, or ``[]``"""
+
+    entry = self._entries.get(os.path.normpath(obj))
+    return list(entry['depends']) if entry else []
+
+  def up_to_date(self, obj, command):
+    """Checks if the given object was compiled with the given command from
+    files that did not change since"""
+
+    entry = self._entries.get(os.path.normpath(obj))
+    if entry is None or entry['command'] != command: return False
+
+    try:
+      mtime = os.stat(obj).st_mtime
+      for k in entry['depends'] + self.common:
+        if os.stat(k).st_mtime > mtime: return False
+    except OSError: # object or dependency missing
+      return False
+    return True
+
+  def record(self, obj, command, depfile):
+    """Records the dependencies of a freshly compiled object"""
+
+    try:
+      depends = parse_depfile(depfile)
+    except (IOError, OSError):
+      depends = None
+
+    with self._lock:
+      if depends:
+        depends += [k for k in self.common if k not in depends]
+        self._entries[os.path.normpath(obj)] = {'command': command, 'depends': depends}
+      else:
+        self._entries.pop(os.path.normpath(obj), None)
+
+  def install(self, compiler, force=False):
+    """Makes the given :py:class:`distutils.ccompiler.CCompiler` skip objects
+    that are up to date (unless ``force`` is set) and record the dependencies
+    of all others"""
+
+    original = compiler._compile
+
+    def _compile(obj, src, ext, cc_args, extra_postargs, pp_opts):
+      command = compiler.compiler_so + cc_args + [src] + extra_postargs
+      if not force and self.up_to_date(obj, command):
+        with self._lock: self.skipped += 1
+        return
+
+      depfile = obj + '.d'
+      original(obj, src, ext, cc_args, extra_postargs + ['-MMD', '-MF', depfile], pp_opts)
+      with self._lock: self.compiled += 1
+      self.record(obj, command, depfile)
+
+    compiler._compile = _compile
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Wed 21 Oct 2026 10:26:44 CEST
+
+"""Analyzes how much compile time the headers included by each translation
+unit cost
+
+With ``python setup.py build_ext --analyze-includes``, each translation unit
+is parsed a second time with ``-fsyntax-only -H``, which lists the headers it
+includes as a tree. Afterwards, the headers included by the translation units
+are parsed on their own with the same compiler options, so that their
+cumulative parse time (including the headers they include) is known. The
+results are combined into an include tree annotated with the parse time and
+inclusion count of each header, and written into :py:data:`REPORT_NAME`
+inside ``build_temp``.
+
+The report lists all headers, ranked by the time they cost the build (their
+parse time times the number of translation units including them), and
+suggests:
+
+* ``'precompile'`` for expensive headers included by at least half of the
+  translation units, which should go into the ``precompiled_header`` of the
+  extensions (see :py:mod:`bob.extension.pch`), and
+* ``'split'`` for expensive headers that pull in many other headers, but are
+  included by less than half of the translation units, so that their
+  includers only pay for what they use.
+
+GCC and Clang both support ``-H``, while ``-ftime-trace`` is Clang only; the
+standalone parse times are measured for both alike.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import subprocess
+
+from .depends import strip_dependency_flags
+
+#: Name of the report inside ``build_temp``
+REPORT_NAME = 'bob_extension_includes.json'
+
+#: Headers are parsed on their own up to this depth of the include tree
+MAX_DEPTH = 2
+
+#: Headers parsed faster than this (in seconds) are not suggested
+MIN_TIME = 0.02
+
+_h_line = re.compile(r'^(\.+) (.+)$')
+
+
+def parse_includes(output, cwd=None):
+  """Returns the ``(depth, header)`` pairs listed by the ``-H`` option of the
+  compiler in the given (standard error) output, in order
+
+  The compiler lists headers found through relative include directories with
+  relative paths, which are made absolute with respect to the directory
+  ``cwd`` that the compiler ran in (by default, the current directory).
+  """
+
+  if cwd is None: cwd = os.getcwd()
+  retval = []
+  for line in output.splitlines():
+    match = _h_line.match(line.rstrip())
+    if match is not None:
+      retval.append((len(match.group(1)), os.path.abspath(os.path.join(cwd, match.group(2)))))
+  return retval
+
+
+def include_tree(includes):
+  """Returns the headers that each header includes (``None`` for the
+  translation unit itself), given the ``(depth, header)`` pairs of
+  :py:func:`parse_includes`"""
+
+  children = {None: []}
+  parents = [None]
+  for depth, header in includes:
+    # a depth can only increase by one
+    depth = min(depth, len(parents))
+    del parents[depth:]
+    children.setdefault(parents[-1], []).append(header)
+    children.setdefault(header, [])
+    parents.append(header)
+  return children
+
+
+def merge_tree(tree, children, header=None, _path=()):
+  """Merges the include tree of a translation unit (see
+  :py:func:`include_tree`) into the given nested tree, counting each inclusion
+  of a header at the same position"""
+
+  for child in children.get(header, []):
+    # headers without include guards may include each other
+    if child in _path: continue
+    node = tree.setdefault(child, {'count': 0, 'time': None, 'includes': {}})
+    node['count'] += 1
+    merge_tree(node['includes'], children, child, _path + (child,))
+
+
+class IncludeAnalyzer:
+  """Collects the include trees of all translation units compiled by a
+  compiler that it is :py:meth:`install`\\ed on
+
+  Parameters:
+
+  directory, str
+    The directory where the files to parse headers on their own are written
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+    self.units = {}
+    self._commands = {}
+    self._lock = threading.Lock()
+
+  def install(self, compiler):
+    """Makes the given :py:class:`distutils.ccompiler.CCompiler` parse each
+    source with ``-H`` after compiling it
+
+    It should be installed after all other hooks, so that sources that are up
+    to date (and therefore not compiled) are analyzed as well, with the
+    original options.
+    """
+
+    original = compiler._compile
+
+    def _compile(obj, src, ext, cc_args, extra_postargs, pp_opts):
+      original(obj, src, ext, cc_args, extra_postargs, pp_opts)
+      self.analyze(compiler.compiler_so + cc_args, src, extra_postargs)
+
+    compiler._compile = _compile
+
+  def analyze(self, command, source, extra_postargs):
+    """Parses the given source with the given compiler command and options,
+    and records its include tree and parse time"""
+
+    # the dependency files of the compilation must not be overwritten
+    extra_postargs = strip_dependency_flags(extra_postargs)
+    cwd = os.getcwd()
+    start = time.time()
+    process = subprocess.Popen(command + [source] + extra_postargs + ['-fsyntax-only', '-H'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
+    output = process.communicate()[1].decode('utf8', 'replace')
+    duration = time.time() - start
+    if process.returncode != 0: return
+
+    # the headers are parsed on their own in another directory
+    children = include_tree(parse_includes(output, cwd))
+    # headers included with -include are parsed on their own as well
+    extra_postargs = _strip_forced_includes(extra_postargs)
+    with self._lock:
+      self.units[source] = {'time': duration, 'includes': children}
+      # the headers are parsed on their own with the options of the first source including them
+      key = repr([command, extra_postargs])
+      for header in children:
+        if header is not None:
+          self._commands.setdefault(header, (key, command, extra_postargs))
+
+  def header_times(self, pool=None, max_depth=MAX_DEPTH):
+    """Measures the time to parse each header up to the given depth of the
+    include trees on its own, and returns it as a dictionary
+
+    The time to parse an empty file with the same options is subtracted. The
+    headers are parsed in parallel, if a :py:class:`bob.extension.scheduler.TokenPool`
+    is given.
+    """
+
+    headers = set()
+    for unit in self.units.values():
+      level = [None]
+      for depth in range(max_depth):
+        level = [k for parent in level for k in unit['includes'].get(parent, [])]
+        headers.update(level)
+
+    if not os.path.exists(self.directory):
+      os.makedirs(self.directory)
+
+    baselines = {}
+    lock = threading.Lock()
+
+    def _parse(key, command, extra_postargs, header):
+      name = hashlib.sha1((key + repr(header)).encode('utf8')).hexdigest() + '.cpp'
+      stub = os.path.join(self.directory, name)
+      with open(stub, 'w') as f:
+        if header is not None: f.write('#include "%s"\n' % header.replace('\\', '/'))
+      start = time.time()
+      process = subprocess.Popen(command + ['-x', 'c++', stub] + extra_postargs + ['-fsyntax-only'],
+          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+      process.communicate()
+      return time.time() - start if process.returncode == 0 else None
+
+    def _measure(header):
+      key, command, extra_postargs = self._commands[header]
+      with lock: baseline = baselines.get(key)
+      if baseline is None:
+        baseline = _parse(key, command, extra_postargs, None) or 0.
+        with lock: baselines[key] = baseline
+      duration = _parse(key, command, extra_postargs, header)
+      with lock:
+        times[header] = None if duration is None else max(duration - baseline, 0.)
+
+    times = {}
+    headers = sorted(headers)
+    if pool is not None:
+      from .scheduler import run_parallel
+      run_parallel(_measure, headers, pool)
+    else:
+      for header in headers: _measure(header)
+    return times
+
+  def report(self, times):
+    """Returns the report of the analysis, see the description of this module
+
+    Parameters:
+
+    times, dict
+      The parse time of the headers, see :py:meth:`header_times`
+    """
+
+    units = len(self.units)
+    tree = {}
+    headers = {}
+    for source, unit in sorted(self.units.items()):
+      merge_tree(tree, unit['includes'])
+      # all headers included by this source, and the ones each of them pulls in
+      for header, children in unit['includes'].items():
+        if header is None: continue
+        entry = headers.setdefault(header, {'header': header, 'count': 0, 'direct': 0, 'includes': set()})
+        entry['count'] += 1
+        entry['includes'].update(_descendants(unit['includes'], header))
+      for header in unit['includes'][None]:
+        headers[header]['direct'] += 1
+
+    def _annotate(nodes):
+      for header, node in nodes.items():
+        node['time'] = times.get(header)
+        _annotate(node['includes'])
+    _annotate(tree)
+
+    mean = sum(k['time'] for k in self.units.values()) / units if units else 0.
+    threshold = max(MIN_TIME, 0.05 * mean)
+    ranked = []
+    for entry in headers.values():
+      entry['includes'] = len(entry['includes'])
+      entry['time'] = times.get(entry['header'])
+      entry['total'] = (entry['time'] or 0.) * entry['count']
+      entry['suggestion'] = None
+      if entry['time'] is not None and entry['time'] >= threshold:
+        if 2 * entry['count'] >= units:
+          entry['suggestion'] = 'precompile'
+        elif entry['count'] > 1 and entry['includes'] >= 20:
+          entry['suggestion'] = 'split'
+      ranked.append(entry)
+    ranked.sort(key=lambda k: (-k['total'], k['header']))
+
+    return {'translation_units': dict((k, v['time']) for k, v in self.units.items()),
+        'tree': tree, 'headers': ranked}
+
+  def save(self, filename, times):
+    """Writes the :py:meth:`report` to the given JSON file, and returns it"""
+
+    report = self.report(times)
+    with open(filename, 'wt') as f:
+      json.dump(report, f, indent=1, sort_keys=True)
+    return report
+
+
+def _strip_forced_includes(args):
+  """Removes the ``-include <header>`` options from the given arguments"""
+
+  retval = []
+  skip = False
+  for arg in args:
+    if skip: skip = False
+    elif arg == '-include': skip = True
+    else: retval.append(arg)
+  return retval
+
+
+def _descendants(children, header):
+  """Returns all headers included by the given header, directly or not"""
+
+  retval = set()
+  stack = list(children.get(header, []))
+  while stack:
+    k = stack.pop()
+    if k in retval: continue
+    retval.add(k)
+    stack.extend(children.get(k, []))
+  return retval
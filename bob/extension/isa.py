@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Mon 19 Oct 2026 14:08:52 CEST
+
+"""Builds extensions and libraries for several x86-64 micro-architecture
+levels, and selects the best one for the CPU at import
+
+An :py:class:`bob.extension.Extension` or :py:class:`bob.extension.Library`
+with the ``isa`` parameter is built once for each of its :py:func:`levels`.
+The original is always built for the baseline ``v1``, so that it can be
+imported on every x86-64 CPU; each higher level is a variant named
+``<name>_<level>``, compiled with the instruction set extensions of the level
+(see :py:func:`flags`). Variants of a library keep the ``SONAME`` of the
+original library, so that extensions linked against it use the variant that
+was loaded.
+
+At import, :py:func:`bob.extension.load_bob_library` and
+:py:func:`bob.extension.load_bob_extension` load the variant of the highest
+level the CPU supports (see :py:func:`supported_levels`), and the original
+otherwise.
+"""
+
+import os
+import platform
+
+#: The x86-64 micro-architecture levels, from the baseline to AVX-512
+LEVELS = ('v1', 'v2', 'v3', 'v4')
+
+#: The levels built when ``isa=True`` and ``BOB_BUILD_ISA`` is not set
+DEFAULT_LEVELS = ('v1', 'v3', 'v4')
+
+# the CPU flags (as in /proc/cpuinfo) and compiler options each level adds
+_FEATURES = {
+    'v1': [],
+    'v2': [('cx16', '-mcx16'), ('lahf_lm', '-msahf'), ('popcnt', '-mpopcnt'), ('pni', '-msse3'),
+           ('ssse3', '-mssse3'), ('sse4_1', '-msse4.1'), ('sse4_2', '-msse4.2')],
+    'v3': [('avx', '-mavx'), ('avx2', '-mavx2'), ('bmi1', '-mbmi'), ('bmi2', '-mbmi2'), ('f16c', '-mf16c'),
+           ('fma', '-mfma'), ('abm', '-mlzcnt'), ('movbe', '-mmovbe'), ('xsave', '-mxsave')],
+    'v4': [('avx512f', '-mavx512f'), ('avx512bw', '-mavx512bw'), ('avx512cd', '-mavx512cd'),
+           ('avx512dq', '-mavx512dq'), ('avx512vl', '-mavx512vl')],
+}
+
+
+def is_x86_64(machine=None):
+  """Checks if the given machine (by default, this one) is x86-64"""
+
+  return (machine or platform.machine()).lower() in ('x86_64', 'amd64')
+
+
+def levels(isa):
+  """Returns the levels to build for the given ``isa`` parameter of an
+  extension, lowest first
+
+  Parameters:
+
+  isa, bool, str or [str]
+    ``True`` selects the comma-separated levels in the ``BOB_BUILD_ISA``
+    environment variable, or :py:data:`DEFAULT_LEVELS`; a list (or a
+    comma-separated string) selects the given levels. ``None`` or ``False``
+    builds the extension only once, as do all values on machines other than
+    x86-64.
+
+  The baseline ``v1`` is always included, since the original extension (built
+  for the lowest level) is imported on CPUs that support none of the others.
+  """
+
+  if not isa or not is_x86_64():
+    return []
+  if isa is True:
+    isa = os.environ.get('BOB_BUILD_ISA') or DEFAULT_LEVELS
+  if isinstance(isa, str):
+    isa = [k.strip() for k in isa.split(',') if k.strip()]
+  for level in isa:
+    if level not in LEVELS:
+      raise ValueError("The micro-architecture level `%s' is not supported; use one of %s" % (level, ", ".join("`%s'" % k for k in LEVELS)))
+  return [k for k in LEVELS if k in isa or k == LEVELS[0]]
+
+
+def flags(level):
+  """Returns the compiler options that enable the instruction set extensions
+  of the given level and all levels below it"""
+
+  retval = []
+  for k in LEVELS[:LEVELS.index(level) + 1]:
+    retval.extend(option for feature, option in _FEATURES[k])
+  return retval
+
+
+def variant_name(name, level):
+  """Returns the name of the variant of the given extension or library name
+  for the given level, e.g., ``bob.core._library_v3``"""
+
+  return '%s_%s' % (name, level)
+
+
+def cpu_features(filename='/proc/cpuinfo'):
+  """Returns the set of features of the CPU, as listed in the ``flags`` of
+  ``/proc/cpuinfo``, or ``None`` if they are not available"""
+
+  try:
+    with open(filename) as f:
+      for line in f:
+        if line.startswith('flags'):
+          return set(line.partition(':')[2].split())
+  except (IOError, OSError):
+    pass
+  return None
+
+
+def supported_levels(features=None):
+  """Returns the levels that the CPU supports, highest first
+
+  Only levels up to the one given in the ``BOB_ISA_LEVEL`` environment
+  variable are returned, e.g., ``BOB_ISA_LEVEL=v1`` loads the original
+  extensions on all machines. If the CPU features are unknown, no level is
+  returned.
+
+  Parameters:
+
+  features, set or ``None``
+    The features of the CPU; by default, the :py:func:`cpu_features`
+  """
+
+  if features is None:
+    if not is_x86_64(): return []
+    features = cpu_features()
+    if features is None: return []
+
+  highest = os.environ.get('BOB_ISA_LEVEL', LEVELS[-1])
+  if highest not in LEVELS:
+    raise ValueError("BOB_ISA_LEVEL must be one of %s, not `%s'" % (", ".join("`%s'" % k for k in LEVELS), highest))
+
+  retval = []
+  for level in LEVELS[:LEVELS.index(highest) + 1]:
+    if not all(feature in features for feature, option in _FEATURES[level]): break
+    retval.append(level)
+  return retval[::-1]
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Mon 19 Oct 2026 09:47:05 CEST
+
+"""Compiler, linker and archiver options for link-time optimization (LTO)
+
+With ``python setup.py build_ext --lto`` (or ``BOB_BUILD_LTO`` set), all
+extensions and libraries are compiled into objects containing the
+intermediate representation of the compiler, which is optimized as a whole
+when the extension or library is linked. The link step runs as many parallel
+LTO jobs as the build.
+
+Each :py:class:`bob.extension.Library` is a shared library, and it is
+optimized separately from the extensions linking it.
+"""
+
+import os
+
+from distutils.spawn import find_executable
+
+from .pgo import is_clang
+
+
+def is_enabled(lto):
+  """Checks if LTO is enabled
+
+  Parameters:
+
+  lto, bool or ``None``
+    The ``--lto`` option of ``build_ext``; if ``None``, the ``BOB_BUILD_LTO``
+    environment variable is read (``'1'``, ``'on'``, ``'yes'`` or ``'true'``
+    enable LTO)
+  """
+
+  if lto is None:
+    lto = os.environ.get('BOB_BUILD_LTO', '').lower() in ('1', 'on', 'yes', 'true')
+  return bool(lto)
+
+
+def flags(executable, jobs):
+  """Returns the compiler and linker options for LTO
+
+  Parameters:
+
+  executable, str
+    The compiler executable, e.g., ``compiler.compiler_so[0]``
+
+  jobs, int
+    The number of parallel LTO jobs when linking
+
+  Returns a tuple with the list of compiler and the list of linker options.
+  """
+
+  if is_clang(executable):
+    # ThinLTO parallelizes the link step by itself
+    return ['-flto=thin'], ['-flto=thin']
+  # GCC partitions the program, and optimizes the partitions in parallel
+  return ['-flto'], ['-flto=%d' % max(int(jobs), 1)]
+
+
+def archiver(executable):
+  """Returns the ``ar`` and ``ranlib`` executables with the linker plugin of
+  the given compiler, which static libraries of LTO objects require, or
+  ``None`` if they cannot be found
+
+  The tools are looked up next to the compiler, e.g., ``gcc-ar`` for
+  ``/usr/bin/gcc`` and ``x86_64-linux-gnu-gcc-ar`` for
+  ``x86_64-linux-gnu-gcc``, and for Clang, ``llvm-ar`` and ``llvm-ranlib``.
+  """
+
+  directory, name = os.path.split(executable)
+  if is_clang(executable):
+    names = ['llvm-ar', 'llvm-ranlib']
+  else:
+    # e.g. 'g++-9' uses 'gcc-ar-9'
+    prefix, sep, suffix = name.rpartition('-') if name[-1:].isdigit() else (name, '', '')
+    prefix = prefix.replace('g++', 'gcc').replace('c++', 'gcc')
+    if prefix.rpartition('-')[2] == 'cc': prefix = prefix[:-2] + 'gcc'
+    names = [prefix + '-ar' + sep + suffix, prefix + '-ranlib' + sep + suffix]
+
+  tools = [find_executable(k, directory or None) or find_executable(k) for k in names]
+  return tuple(tools) if all(tools) else None
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Sat 17 Oct 2026 17:40:12 CEST
+
+"""Precompiles the headers that build_ext includes into every C++ source of an
+extension"""
+
+import os
+import hashlib
+import logging
+import threading
+
+from .depends import parse_depfile, strip_dependency_flags, add_dependencies
+from .unity import SOURCE_SUFFIXES
+
+#: Name of the directory inside ``build_temp`` where the precompiled headers
+#: are stored
+DIRECTORY_NAME = 'pch'
+
+
+class PrecompiledHeaders:
+  """Precompiles the registered headers once per unique set of compiler
+  options
+
+  Extensions using a precompiled header are compiled with ``-include
+  <header>``. When :py:meth:`install`\\ed on a compiler, this option is
+  replaced by ``-include <directory>/<key>/<header name>``, where ``<key>`` is
+  a hash of all other compiler options. The file included there just includes
+  the original header, and next to it, the precompiled header
+  (``<header name>.gch``) is built before the first source is compiled. GCC
+  and Clang then use the precompiled header instead of parsing the include.
+
+  A precompiled header is built again when its options change (as they are
+  part of the key) or when one of the headers it includes was modified. Those
+  headers are added to the dependency files of the objects using it, see
+  :py:class:`bob.extension.depends.DependencyDatabase`. If the header cannot be
+  precompiled, the sources just include it.
+
+  Only C++ sources include the header; C sources are compiled without it.
+
+  Parameters:
+
+  directory, str
+    The directory where the precompiled headers are built, usually
+    :py:data:`DIRECTORY_NAME` inside ``build_temp``
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+    self.headers = set()
+    self.built = 0
+    self._lock = threading.Lock()
+    self._locks = {}
+    self._failed = set()
+    self._ready = set()
+
+  def register(self, header):
+    """Registers a header to be precompiled, and returns the compiler options
+    that include it into each C++ source"""
+
+    header = os.path.realpath(header)
+    with self._lock: self.headers.add(header)
+    return ['-include', header]
+
+  def install(self, compiler):
+    """Makes the given :py:class:`distutils.ccompiler.CCompiler` use the
+    precompiled versions of the registered headers
+
+    This should be installed before any other hook, so that the original
+    ``-include <header>`` options are seen by them.
+    """
+
+    original = compiler._compile
+
+    def _compile(obj, src, ext, cc_args, extra_postargs, pp_opts):
+      extra_postargs, dependencies = self.arguments(compiler, src, cc_args, extra_postargs)
+      original(obj, src, ext, cc_args, extra_postargs, pp_opts)
+      if dependencies and '-MF' in extra_postargs:
+        add_dependencies(extra_postargs[extra_postargs.index('-MF') + 1], dependencies)
+
+    compiler._compile = _compile
+
+  def arguments(self, compiler, src, cc_args, extra_postargs):
+    """Returns the ``extra_postargs`` to compile the given source with the
+    precompiled header, and the files the precompiled header depends on"""
+
+    for index in range(len(extra_postargs) - 1):
+      if extra_postargs[index] == '-include' and extra_postargs[index + 1] in self.headers:
+        break
+    else:
+      return extra_postargs, []
+
+    header = extra_postargs[index + 1]
+    others = extra_postargs[:index] + extra_postargs[index + 2:]
+    if SOURCE_SUFFIXES.get(os.path.splitext(src)[1]) != 'c++':
+      return others, []
+
+    stub = self.build(compiler, header, cc_args, strip_dependency_flags(others))
+    if stub is None:
+      return extra_postargs, []
+    return others[:index] + ['-include', stub] + others[index:], parse_depfile(stub + '.d')
+
+  def build(self, compiler, header, cc_args, extra_postargs):
+    """Builds the precompiled header for the given options, if it is not up
+    to date, and returns the file to include, or ``None`` if it cannot be
+    built"""
+
+    command = compiler.compiler_so + cc_args + extra_postargs
+    key = hashlib.sha1(repr([header] + command).encode('utf8')).hexdigest()
+    stub = os.path.join(os.path.realpath(self.directory), key, os.path.basename(header))
+    binary = stub + ('.pch' if 'clang' in os.path.basename(compiler.compiler_so[0]) else '.gch')
+
+    with self._lock:
+      lock = self._locks.setdefault(key, threading.Lock())
+    with lock:
+      if key in self._failed: return None
+      # each precompiled header is checked only once per build
+      if key in self._ready or self.up_to_date(binary, stub + '.d'):
+        self._ready.add(key)
+        return stub
+
+      from distutils.errors import DistutilsExecError
+      try:
+        if not os.path.exists(os.path.dirname(stub)):
+          os.makedirs(os.path.dirname(stub))
+        with open(stub, 'w') as f:
+          f.write('// WARNING! This file is automatically generated. Do not change its contents.\n\n#include "%s"\n' % header.replace('\\', '/'))
+        compiler.spawn(compiler.compiler_so + cc_args + ['-x', 'c++-header', stub, '-o', binary] + extra_postargs + ['-MMD', '-MF', stub + '.d'])
+      except (IOError, OSError, DistutilsExecError) as e:
+        logging.getLogger('bob.extension').warn("cannot precompile header `%s', including it instead: %s" % (header, e))
+        self._failed.add(key)
+        return None
+
+      with self._lock: self.built += 1
+      self._ready.add(key)
+      return stub
+
+  def up_to_date(self, binary, depfile):
+    """Checks if the given precompiled header is newer than all files it was
+    built from"""
+
+    try:
+      mtime = os.stat(binary).st_mtime
+      for k in parse_depfile(depfile):
+        if os.stat(k).st_mtime > mtime: return False
+    except (IOError, OSError):
+      return False
+    return True
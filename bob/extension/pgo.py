@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Sun 18 Oct 2026 10:12:37 CEST
+
+"""Compiler options for profile-guided optimization (PGO)
+
+A PGO build has three steps:
+
+1. ``python setup.py build_ext --force --pgo=generate`` builds all extensions
+   and libraries instrumented to record profiles
+2. a training workload, e.g., the test suite of the package, is run, which
+   writes the profiles into the :py:func:`profile_directory`
+3. ``python setup.py build_ext --force --pgo=use`` builds them again,
+   optimized using the recorded profiles
+
+The ``bob_pgo.py`` script runs all three steps.
+"""
+
+import os
+import glob
+import shutil
+import logging
+import subprocess
+
+from .utils import cache_directory
+
+#: The phases of a PGO build, see :py:func:`flags`
+PHASES = ('generate', 'use')
+
+
+def profile_directory(name, version):
+  """Returns the directory where the profiles of the given package version
+  are stored
+
+  The directory is ``<base>/<name>-<version>``. The base directory is
+  ``BOB_PGO_DIRECTORY``, if set, or the ``profiles`` directory inside the
+  ``BOB_BUILD_CACHE``, or ``build/pgo`` otherwise.
+  """
+
+  base = os.environ.get('BOB_PGO_DIRECTORY')
+  if base:
+    base = os.path.expanduser(base)
+  else:
+    base = cache_directory('profiles') or os.path.join('build', 'pgo')
+  return os.path.realpath(os.path.join(base, '%s-%s' % (name, version)))
+
+
+_clang = {}
+
+def is_clang(executable):
+  """Checks if the given compiler executable is Clang, which stores profiles
+  differently than GCC
+
+  Compilers whose name does not tell, like ``c++``, are asked for their
+  version.
+  """
+
+  if 'clang' in os.path.basename(executable): return True
+  if 'gcc' in os.path.basename(executable) or 'g++' in os.path.basename(executable): return False
+  if executable not in _clang:
+    try:
+      process = subprocess.Popen([executable, '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+      output = process.communicate()[0].decode('utf8', 'replace')
+      _clang[executable] = 'clang' in output.lower()
+    except OSError:
+      _clang[executable] = False
+  return _clang[executable]
+
+
+def clear_profiles(directory):
+  """Removes the profiles recorded in the given directory, which do not match
+  a new instrumented build"""
+
+  if os.path.isdir(directory):
+    shutil.rmtree(directory)
+  os.makedirs(directory)
+
+
+def merge_profiles(directory):
+  """Merges the raw profiles that Clang recorded in the given directory into
+  ``default.profdata`` using ``llvm-profdata`` (or the tool given in the
+  ``LLVM_PROFDATA`` environment variable), and returns its file name"""
+
+  merged = os.path.join(directory, 'default.profdata')
+  raw = sorted(glob.glob(os.path.join(directory, '*.profraw')))
+  # merging again would make all objects that depend on the profiles out of date
+  if raw and (not os.path.exists(merged) or max(os.path.getmtime(k) for k in raw) > os.path.getmtime(merged)):
+    command = [os.environ.get('LLVM_PROFDATA', 'llvm-profdata'), 'merge', '-output=%s' % merged] + raw
+    if subprocess.call(command) != 0:
+      raise OSError("Could not merge the profiles in `%s' with `%s'" % (directory, command[0]))
+  return merged
+
+
+def profiles(directory, executable):
+  """Returns the files of the given :py:func:`profile_directory` that objects
+  compiled with ``--pgo=use`` depend on
+
+  For Clang, this is the profile merged by :py:func:`merge_profiles`. GCC
+  reads one ``.gcda`` file per object; the directories are listed as well, so
+  that objects are compiled again when profiles are added or removed.
+  """
+
+  if is_clang(executable):
+    merged = os.path.join(directory, 'default.profdata')
+    return [merged] if os.path.exists(merged) else []
+
+  retval = []
+  for path, directories, files in os.walk(directory):
+    retval.append(path)
+    retval.extend(os.path.join(path, k) for k in sorted(files) if k.endswith('.gcda'))
+    directories.sort()
+  return retval
+
+
+def flags(phase, directory, executable):
+  """Returns the compiler and linker options for the given PGO ``phase``
+
+  Parameters:
+
+  phase, str
+    One of :py:data:`PHASES`: ``'generate'`` instruments the code to record
+    profiles into the ``directory``, and ``'use'`` optimizes the code using
+    them
+
+  directory, str
+    The :py:func:`profile_directory` of the package
+
+  executable, str
+    The compiler executable, e.g., ``compiler.compiler_so[0]``
+
+  Returns a tuple with the list of compiler and the list of linker options.
+  """
+
+  if phase not in PHASES:
+    raise ValueError("The PGO phase must be one of %s, not `%s'" % (", ".join("`%s'" % p for p in PHASES), phase))
+
+  if phase == 'generate':
+    options = ['-fprofile-generate=%s' % directory]
+    return options, options
+
+  if not os.path.isdir(directory) or not os.listdir(directory):
+    logging.getLogger('bob.extension').warn("no profiles found in `%s'; did you run the training after building with --pgo=generate?" % directory)
+
+  if is_clang(executable):
+    options = ['-fprofile-use=%s' % merge_profiles(directory), '-Wno-profile-instr-unprofiled', '-Wno-profile-instr-out-of-date']
+  else:
+    # profiles of multi-threaded code may be slightly inconsistent
+    options = ['-fprofile-use=%s' % directory, '-fprofile-correction', '-Wno-missing-profile']
+  return options, []
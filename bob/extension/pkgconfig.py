@@ -4,26 +4,23 @@
 # Wed 16 Oct 10:08:42 2013 CEST
 
 import os
+import re
 import sys
+import shlex
 import subprocess
 import logging
-from .utils import uniq, uniq_paths, find_executable
+from .utils import uniq, uniq_paths, find_executable, directory_index, \
+    probe_environment, probe_statistics
 
-def call_pkgconfig(cmd, paths=None):
-  """Runs a command as a subprocess and raises if that does not work
+def pkg_config_path(paths=None):
+  """Returns the list of paths prepended to ``PKG_CONFIG_PATH`` for queries
 
-  Returns the exit status, stdout and stderr.
-  """
+  The list takes into consideration, in order:
 
-  # locates the pkg-config program
-  pkg_config = find_executable('pkg-config')
-  if not pkg_config:
-    raise OSError("Cannot find `pkg-config' - did you install it?")
-
-  # sets the PKG_CONFIG_PATH taking into consideration:
-  # 1. BOB_PREFIX_PATH, if set
-  # 2. the paths set by the user
-  # 3. the current python executable prefix
+  1. the ``lib/pkgconfig`` directories of the prefixes in ``BOB_PREFIX_PATH``
+  2. the given ``paths``
+  3. the ``lib/pkgconfig`` directory of the current python executable prefix
+  """
 
   # 1. BOB_PREFIX_PATH
   bob_prefix = os.environ.get('BOB_PREFIX_PATH', False)
@@ -40,7 +37,41 @@ def call_pkgconfig(cmd, paths=None):
   pkg_path.append(os.path.join(os.path.dirname(os.path.dirname(sys.executable)), 'lib', 'pkgconfig'))
 
   # Make unique to avoid searching twice
-  pkg_path = uniq_paths(pkg_path)
+  return uniq_paths(pkg_path)
+
+_executables = {}
+
+def _pkg_config_executable():
+  """Returns (memoized) the candidates for the pkg-config program
+
+  The program is searched for in the prefixes (see
+  :py:func:`bob.extension.utils.find_executable`), and otherwise in the
+  ``PATH``, so the result depends on both ``BOB_PREFIX_PATH`` and ``PATH``.
+  """
+
+  key = (os.environ.get('BOB_PREFIX_PATH', ''), os.environ.get('PATH', ''))
+  if key not in _executables:
+    candidates = find_executable('pkg-config')
+    if not candidates:
+      from distutils.spawn import find_executable as which
+      found = which('pkg-config')
+      if found: candidates = [found]
+    _executables[key] = candidates
+  return _executables[key]
+
+def call_pkgconfig(cmd, paths=None):
+  """Runs a command as a subprocess and raises if that does not work
+
+  Returns the exit status, stdout and stderr.
+  """
+
+  # locates the pkg-config program
+  pkg_config = _pkg_config_executable()
+  if not pkg_config:
+    raise OSError("Cannot find `pkg-config' - did you install it?")
+
+  # sets the PKG_CONFIG_PATH
+  pkg_path = pkg_config_path(paths)
 
   env = os.environ.copy()
   var = os.pathsep.join(pkg_path)
@@ -49,6 +80,7 @@ def call_pkgconfig(cmd, paths=None):
 
   # calls the program
   cmd = pkg_config[:1] + [str(k) for k in cmd]
+  probe_statistics.count('subprocesses')
   subproc = subprocess.Popen(
       cmd,
       env=env,
@@ -83,6 +115,278 @@ def version():
 
   return stdout.strip()
 
+class _Unsupported(Exception):
+  """Raised when a query cannot be answered by the native .pc resolver"""
+  pass
+
+_pkg_config_defaults = {}
+
+def _pkg_config_variable(name):
+  """Returns (memoized) a variable of pkg-config's own configuration"""
+
+  if name not in _pkg_config_defaults:
+    status, stdout, stderr = call_pkgconfig(['--variable=%s' % name, 'pkg-config'])
+    _pkg_config_defaults[name] = stdout.strip() if status == 0 else ''
+  return _pkg_config_defaults[name]
+
+def _search_path(paths=None):
+  """Returns the list of directories pkg-config searches for .pc files"""
+
+  search = pkg_config_path(paths)
+  if os.environ.get('PKG_CONFIG_PATH'):
+    search += os.environ['PKG_CONFIG_PATH'].split(os.pathsep)
+  if 'PKG_CONFIG_LIBDIR' in os.environ:
+    default = os.environ['PKG_CONFIG_LIBDIR']
+  else:
+    default = _pkg_config_variable('pc_path')
+    if not default: raise _Unsupported("unknown default search path")
+  return search + [k for k in default.split(os.pathsep) if k]
+
+def _system_directories(variable, environment, default):
+  """Returns the system directories that pkg-config filters from its output"""
+
+  if environment in os.environ:
+    value = os.environ[environment]
+  else:
+    value = _pkg_config_variable(variable) or default
+  return set(os.path.normpath(k) for k in value.split(os.pathsep) if k)
+
+_pc_field = re.compile(r'^\s*([A-Za-z0-9_.]+)\s*([:=])\s*(.*?)\s*$')
+_pc_variable = re.compile(r'\$\{([^}]*)\}')
+_pc_operators = ('<=', '>=', '!=', '=', '<', '>')
+
+class PcFile:
+  """A parsed pkg-config ``.pc`` file
+
+  Variables are kept as defined in the file and only substituted when the
+  fields using them are read, with :py:meth:`expand`.
+  """
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.variables = {'pcfiledir': os.path.dirname(filename)}
+    self.fields = {}
+
+    with open(filename, 'rt') as f:
+      contents = f.read()
+
+    # joins continuation lines and removes comments
+    contents = contents.replace('\\\n', ' ')
+    for line in contents.split('\n'):
+      line = re.sub(r'(?<!\\)#.*$', '', line).replace('\\#', '#')
+      match = _pc_field.match(line)
+      if not match: continue
+      key, separator, value = match.groups()
+      if separator == '=':
+        self.variables[key] = value
+      else:
+        self.fields[key.lower()] = value
+
+    for required in ('name', 'description', 'version'):
+      if required not in self.fields:
+        raise _Unsupported("`%s' does not declare a `%s' field" % (filename, required))
+
+  def expand(self, value, _seen=()):
+    """Substitutes all ``${variable}`` occurrences in the given value"""
+
+    def _replace(match):
+      name = match.group(1)
+      if name in _seen:
+        raise _Unsupported("recursive definition of variable `%s' in `%s'" % (name, self.filename))
+      return self.expand(self.variables.get(name, ''), _seen + (name,))
+
+    return _pc_variable.sub(_replace, value).replace('$$', '$')
+
+  def field(self, name):
+    """Returns the expanded contents of the given field (or an empty string)"""
+    return self.expand(self.fields.get(name.lower(), ''))
+
+  def flags(self, name):
+    """Returns the flags in the given field, split like a shell would do"""
+    return shlex.split(self.field(name))
+
+  def requires(self, name):
+    """Returns the list of ``(package, operator, version)`` in the given field
+
+    The operator and version are ``None`` for unversioned requirements.
+    """
+
+    tokens = self.field(name).replace(',', ' ').split()
+    retval = []
+    while tokens:
+      package = tokens.pop(0)
+      if tokens and tokens[0] in _pc_operators and len(tokens) > 1:
+        retval.append((package, tokens[0], tokens[1]))
+        del tokens[:2]
+      else:
+        retval.append((package, None, None))
+    return retval
+
+_pc_files = {}
+
+def _find_pc_file(name, search):
+  """Returns the parsed .pc file for the given package name"""
+
+  for directory in search:
+    if directory_index.exists(os.path.join(directory, name + '-uninstalled.pc')):
+      raise _Unsupported("uninstalled package `%s'" % name)
+    filename = os.path.join(directory, name + '.pc')
+    if not directory_index.exists(filename): continue
+    mtime = os.stat(filename).st_mtime
+    if filename not in _pc_files or _pc_files[filename][0] != mtime:
+      _pc_files[filename] = (mtime, PcFile(filename))
+    return _pc_files[filename][1]
+  return None
+
+def _satisfies(version, operator, required):
+  """Checks if the given version satisfies the requirement"""
+
+  from distutils.version import LooseVersion
+  available, required = LooseVersion(version), LooseVersion(required)
+  return {
+      '<': available < required,
+      '<=': available <= required,
+      '=': available == required,
+      '!=': available != required,
+      '>=': available >= required,
+      '>': available > required,
+      }[operator]
+
+def _uniq_libs(libs):
+  """Makes the given linker flags unique
+
+  Libraries keep their last occurrence, to preserve the link order, while all
+  other flags keep their first one.
+  """
+
+  first, last = {}, {}
+  for i, k in enumerate(libs):
+    first.setdefault(k, i)
+    last[k] = i
+  return [k for i, k in enumerate(libs) if i == (last[k] if k.startswith('-l') else first[k])]
+
+def resolve(name, paths=None):
+  """Resolves the given package by directly parsing its ``.pc`` files
+
+  This function follows the same search order as :py:func:`call_pkgconfig`,
+  substitutes ``${variable}`` definitions and collects flags through the
+  closure of ``Requires`` (and, for compilation flags, ``Requires.private``).
+  System include and library directories are filtered out as pkg-config does.
+
+  Returns a dictionary with the ``version`` of the package and the ``cflags``
+  and ``libs`` it would require, or ``None`` if the package cannot be found.
+  Raises ``_Unsupported`` if the query should rather be answered by
+  pkg-config itself.
+  """
+
+  if os.environ.get('PKG_CONFIG_SYSROOT_DIR') or name.endswith('.pc'):
+    raise _Unsupported("query not handled natively")
+
+  search = _search_path(paths)
+  collected = {}
+
+  def _collect(pc, private, stack):
+    key = (pc.filename, private)
+    if key in collected: return collected[key]
+    cflags = pc.flags('Cflags')
+    libs = pc.flags('Libs')
+    fields = ['Requires', 'Requires.private'] if private else ['Requires']
+    for field in fields:
+      for package, operator, required in pc.requires(field):
+        if package in stack:
+          raise _Unsupported("circular requirement on `%s'" % package)
+        dependency = _find_pc_file(package, search)
+        if dependency is None:
+          raise _Unsupported("required package `%s' was not found" % package)
+        if operator is not None and not _satisfies(dependency.field('Version'), operator, required):
+          raise _Unsupported("version requirement `%s %s %s' not met" % (package, operator, required))
+        more_cflags, more_libs = _collect(dependency, private, stack + (package,))
+        cflags += more_cflags
+        libs += more_libs
+    collected[key] = (uniq(cflags), _uniq_libs(libs))
+    return collected[key]
+
+  pc = _find_pc_file(name, search)
+  if pc is None: return None
+
+  # compilation flags follow the whole closure, libraries only public requirements
+  cflags, _ = _collect(pc, True, (name,))
+  _, libs = _collect(pc, False, (name,))
+
+  for flag in cflags + libs:
+    if flag in ('-I', '-L', '-l'):
+      raise _Unsupported("detached flag arguments in `%s'" % pc.filename)
+
+  if not os.environ.get('PKG_CONFIG_ALLOW_SYSTEM_CFLAGS'):
+    system = _system_directories('pc_system_includedirs', 'PKG_CONFIG_SYSTEM_INCLUDE_PATH', '/usr/include')
+    cflags = [k for k in cflags if not (k.startswith('-I') and os.path.normpath(k[2:]) in system)]
+  if not os.environ.get('PKG_CONFIG_ALLOW_SYSTEM_LIBS'):
+    system = _system_directories('pc_system_libdirs', 'PKG_CONFIG_SYSTEM_LIBRARY_PATH', os.pathsep.join(('/usr/lib', '/lib')))
+    libs = [k for k in libs if not (k.startswith('-L') and os.path.normpath(k[2:]) in system)]
+
+  return {
+      'version': pc.field('Version'),
+      'cflags': cflags,
+      'libs': libs,
+      }
+
+_flag_queries = {
+    '--cflags-only-I': lambda r: [k for k in r['cflags'] if k.startswith('-I')],
+    '--cflags-only-other': lambda r: [k for k in r['cflags'] if not k.startswith('-I')],
+    '--libs-only-l': lambda r: [k for k in r['libs'] if k.startswith('-l')],
+    '--libs-only-L': lambda r: [k for k in r['libs'] if k.startswith('-L')],
+    '--libs-only-other': lambda r: [k for k in r['libs'] if k[:2] not in ('-l', '-L')],
+    }
+
+_queries = {}
+
+def query(name, paths=None):
+  """Returns all information required to build against the given package
+
+  The package is resolved natively with :py:func:`resolve`. If that is not
+  possible (or the environment variable ``BOB_DISABLE_NATIVE_PKGCONFIG`` is
+  set), pkg-config is called once for each of ``--modversion``, ``--cflags``
+  and ``--libs``. Results are memoized for the whole process, per package
+  name, search paths and pkg-config related environment.
+
+  Returns a dictionary with the ``version`` of the package, its ``cflags`` and
+  ``libs`` and whether it was resolved ``native``\ly, or ``None`` if the
+  package cannot be found.
+  """
+
+  key = (name, tuple(paths or ()), probe_environment())
+
+  if key not in _queries:
+    _queries[key] = _query(name, paths)
+  return _queries[key]
+
+def _query(name, paths):
+  """Implements :py:func:`query` without memoization"""
+
+  if not os.environ.get('BOB_DISABLE_NATIVE_PKGCONFIG'):
+    try:
+      record = resolve(name, paths)
+      if record is not None:
+        record['native'] = True
+        return record
+    except _Unsupported as e:
+      logging.debug("Querying pkg-config for `%s': %s" % (name, e))
+
+  status, stdout, stderr = call_pkgconfig(['--modversion', name], paths)
+
+  if status != 0:
+    return None
+
+  record = {'version': stdout.strip(), 'native': False}
+
+  for flag in ('cflags', 'libs'):
+    status, stdout, stderr = call_pkgconfig(['--%s' % flag, name], paths)
+    if status != 0:
+      raise RuntimeError("error querying --%s for package `%s': %s" % (flag, name, stderr))
+    record[flag] = stdout.split()
+
+  return record
+
 class pkgconfig:
   """A class for capturing configuration information from pkg-config
 
@@ -98,10 +402,12 @@ class pkgconfig:
      >>> blitz.library_directories()
      [...]
 
-  If the package does not exist, a RuntimeError is raised. All calls to any
-  methods of a ``pkgconfig`` object are translated into a subprocess call that
-  queries for that specific information. If ``pkg-config`` fails, a
-  RuntimeError is raised.
+  If the package does not exist, a RuntimeError is raised. All information
+  about the package is obtained at once and memoized with :py:func:`query`,
+  so that creating several objects for the same package is cheap. Only calls
+  to :py:meth:`variable_names` and :py:meth:`variable` are translated into a
+  subprocess call that queries for that specific information. If
+  ``pkg-config`` fails, a RuntimeError is raised.
   """
 
   def __init__(self, name, paths=None):
@@ -125,17 +431,23 @@ class pkgconfig:
 
     """
 
-    status, stdout, stderr = call_pkgconfig(['--modversion', name], paths)
+    self._record = query(name, paths)
 
-    if status != 0:
+    if self._record is None:
       raise RuntimeError("pkg-config package `%s' was not found" % name)
 
     self.name = name
-    self.version = stdout.strip()
+    self.version = self._record['version']
     self.paths = paths
 
   def __xcall__(self, cmd):
-    """Calls call_pkgconfig() with self.name and self.paths"""
+    """Calls call_pkgconfig() with self.name and self.paths
+
+    Flag queries are answered from the memoized package information.
+    """
+
+    if len(cmd) == 1 and cmd[0] in _flag_queries:
+      return 0, ' '.join(_flag_queries[cmd[0]](self._record)), ''
 
     return call_pkgconfig(cmd + [self.name], self.paths)
 
@@ -0,0 +1,718 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Sat 17 Oct 2026 09:21:16 CEST
+
+"""Runs the jobs of a build in parallel, optionally sharing a GNU make
+jobserver, and within a memory budget
+
+Jobs with a higher priority are started first. ``build_ext`` uses the
+duration that compiling each object took in earlier builds (see
+:py:class:`JobHistory`), so that the longest compilations are started first
+and do not stretch the end of the build.
+"""
+
+import os
+import re
+import json
+import heapq
+import errno
+import select
+import itertools
+import threading
+import multiprocessing.pool
+
+#: Name of the file inside ``build_temp`` where the duration and peak memory of
+#: each compilation are kept for later builds
+HISTORY_NAME = 'bob_extension_history.json'
+
+#: The memory estimated for compiling an object that was never compiled before
+DEFAULT_ESTIMATE = 512 * 1024**2
+
+#: The compile time per byte of source estimated when no object was compiled before
+DEFAULT_SECONDS_PER_BYTE = 1e-4
+
+#: The fraction of the available memory used by default, see :py:func:`memory_budget`
+DEFAULT_MEMORY_FRACTION = 0.9
+
+
+def available_cpus():
+  """Returns the number of CPUs this process may run on"""
+
+  try:
+    return len(os.sched_getaffinity(0))
+  except (AttributeError, OSError):
+    return multiprocessing.cpu_count()
+
+
+def parent_jobs(environ=None):
+  """Returns the number of jobs of the parent ``make -jN`` whose jobserver is
+  announced in ``MAKEFLAGS`` (GNU make >= 4.2 announces it as well), or
+  ``None`` if it is unknown"""
+
+  flags = (environ if environ is not None else os.environ).get('MAKEFLAGS', '')
+  if not re.search(r'--jobserver-(?:auth|fds)=', flags): return None
+  match = re.search(r'(?:^|\s)-j(\d+)', flags)
+  return int(match.group(1)) if match is not None else None
+
+
+def available_memory():
+  """Returns the memory (in bytes) that new processes may use, i.e.,
+  ``MemAvailable`` in ``/proc/meminfo``, limited by the memory left in the
+  control group of this process, or ``None`` if it is unknown"""
+
+  available = None
+  try:
+    with open('/proc/meminfo') as f:
+      for line in f:
+        if line.startswith('MemAvailable:'):
+          available = int(line.split()[1]) * 1024
+  except (IOError, OSError, ValueError):
+    return None
+
+  # the limit of a (version 2) control group, e.g., of a batch job
+  try:
+    with open('/proc/self/cgroup') as f:
+      path = [line.strip()[3:] for line in f if line.startswith('0::')][0]
+    directory = os.path.join('/sys/fs/cgroup', path.lstrip('/'))
+    with open(os.path.join(directory, 'memory.max')) as f:
+      limit = f.read().strip()
+    if limit != 'max':
+      with open(os.path.join(directory, 'memory.current')) as f:
+        left = int(limit) - int(f.read().strip())
+      available = left if available is None else min(available, left)
+  except (IOError, OSError, ValueError, IndexError):
+    pass
+  return available
+
+
+def memory_budget(environ=None):
+  """Returns the memory (in bytes) that the compilations of a build may use
+  together, or ``None`` for no limit
+
+  The budget is taken from the ``BOB_BUILD_MEMORY`` environment variable,
+  which is either a size like ``16G`` or a percentage of the
+  :py:func:`available_memory` like ``50%``; ``0`` or ``off`` disable the
+  limit. By default, :py:data:`DEFAULT_MEMORY_FRACTION` of the available
+  memory is used.
+  """
+
+  value = (environ if environ is not None else os.environ).get('BOB_BUILD_MEMORY', '').strip()
+  if value.lower() in ('0', 'off', 'no', 'none'):
+    return None
+  if value and not value.endswith('%'):
+    from .cache import parse_size
+    return parse_size(value)
+
+  fraction = float(value[:-1]) / 100. if value else DEFAULT_MEMORY_FRACTION
+  available = available_memory()
+  return None if available is None else int(available * fraction)
+
+
+class JobHistory:
+  """The duration, peak memory and source size of the jobs (e.g., the
+  compilation of each object) of earlier builds, kept in a JSON file
+
+  Parameters:
+
+  filename, str
+    The JSON file where the history is stored, usually :py:data:`HISTORY_NAME`
+    inside ``build_temp``
+
+  measure, callable
+    Returns the summed duration (in seconds) and the peak resident memory (in
+    KiB, or ``None``) of the processes that the last job run in this thread
+    started, or ``None`` if it did not start any; see
+    :py:meth:`bob.extension.telemetry.Telemetry.usage`
+  """
+
+  def __init__(self, filename=None, measure=None):
+    self.filename = filename
+    self.measure = measure
+    self._lock = threading.Lock()
+    self._jobs = {}
+    if filename is not None:
+      try:
+        with open(filename) as f:
+          self._jobs = json.load(f)
+      except (IOError, OSError, ValueError):
+        pass
+
+  def record(self, key, **values):
+    """Records the given values (``duration``, ``peak_rss`` in bytes or
+    ``size``) of the job with the given key"""
+
+    with self._lock:
+      self._jobs.setdefault(key, {}).update(values)
+
+  def peak_rss(self, key):
+    """Returns the memory (in bytes) that the job with the given key is
+    expected to need: its last peak memory, or the mean of all known jobs, or
+    :py:data:`DEFAULT_ESTIMATE`"""
+
+    with self._lock:
+      known = [k['peak_rss'] for k in self._jobs.values() if k.get('peak_rss')]
+      if self._jobs.get(key, {}).get('peak_rss'): return self._jobs[key]['peak_rss']
+    return sum(known) // len(known) if known else DEFAULT_ESTIMATE
+
+  def duration(self, key, size=0):
+    """Returns the time (in seconds) that the job with the given key is
+    expected to take: its last duration, or otherwise the given size of its
+    source times the mean time per byte of the known jobs (or
+    :py:data:`DEFAULT_SECONDS_PER_BYTE`)"""
+
+    with self._lock:
+      if self._jobs.get(key, {}).get('duration') is not None: return self._jobs[key]['duration']
+      known = [(k['duration'], k['size']) for k in self._jobs.values() if k.get('duration') is not None and k.get('size')]
+    rate = sum(k[0] for k in known) / sum(k[1] for k in known) if known else DEFAULT_SECONDS_PER_BYTE
+    return size * rate
+
+  def run(self, key, function, *args):
+    """Calls ``function(*args)`` and records the duration and peak memory of
+    the processes it started for the job with the given key"""
+
+    if self.measure is None: return function(*args)
+    self.measure()
+    retval = function(*args)
+    usage = self.measure()
+    if usage is not None:
+      self.record(key, duration=usage[0])
+      if usage[1]: self.record(key, peak_rss=usage[1] * 1024)
+    return retval
+
+  def save(self):
+    """Writes the history to disk"""
+
+    if self.filename is None: return
+    directory = os.path.dirname(self.filename)
+    tmp = '%s.%d' % (self.filename, os.getpid())
+    try:
+      if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+      with self._lock:
+        with open(tmp, 'wt') as f:
+          json.dump(self._jobs, f, indent=1, sort_keys=True)
+      os.rename(tmp, self.filename)
+    except (IOError, OSError):
+      pass
+
+
+class MemoryBudget:
+  """Holds jobs back while their estimated memory would exceed a budget
+
+  The memory of each job is estimated by :py:meth:`JobHistory.peak_rss` from
+  the peak memory that the same job (e.g., the compilation of the same object)
+  needed in earlier builds. A job is always started if no other job is
+  running, even if it exceeds the budget.
+
+  Parameters:
+
+  budget, int
+    The memory (in bytes) that all running jobs may use together, see
+    :py:func:`memory_budget`
+
+  history, :py:class:`JobHistory`
+    The history that the memory of the jobs is estimated from, and recorded
+    into
+  """
+
+  def __init__(self, budget, history=None):
+    self.budget = int(budget)
+    self.history = history if history is not None else JobHistory()
+    self.used = 0
+    self.held_back = 0
+    self._condition = threading.Condition()
+
+  def reserve(self, amount):
+    """Blocks until the given amount of memory is available, and reserves it"""
+
+    with self._condition:
+      if self.used and self.used + amount > self.budget:
+        self.held_back += 1
+        while self.used and self.used + amount > self.budget:
+          self._condition.wait()
+      self.used += amount
+
+  def release(self, amount):
+    """Releases memory reserved with :py:meth:`reserve`"""
+
+    with self._condition:
+      self.used -= amount
+      self._condition.notify_all()
+
+  def admit(self, key):
+    """Blocks until the estimated memory of the job with the given key is
+    available, and reserves it; returns the function releasing it"""
+
+    amount = self.history.peak_rss(key)
+    self.reserve(amount)
+    return lambda: self.release(amount)
+
+  def run(self, key, function, *args):
+    """Calls ``function(*args)`` once the estimated memory of the job with the
+    given key is available (see :py:meth:`JobHistory.run`)"""
+
+    release = self.admit(key)
+    try:
+      return self.history.run(key, function, *args)
+    finally:
+      release()
+
+
+class JobServer:
+  """A client of the jobserver of a parent GNU make
+
+  When a build is started from ``make -jN``, make announces its jobserver in
+  the ``MAKEFLAGS`` environment variable. Each token read from the jobserver
+  allows running one job in addition to the one this process may always run,
+  and must be written back once that job is finished. Use
+  :py:meth:`from_environment` to connect to the jobserver, if any.
+
+  Parameters:
+
+  read_fd, int
+    The file descriptor to read tokens from
+
+  write_fd, int
+    The file descriptor to write tokens back to
+
+  fifo, str
+    The named pipe the file descriptors were opened from (``None`` for
+    anonymous pipes)
+  """
+
+  def __init__(self, read_fd, write_fd, fifo=None):
+    self.read_fd = read_fd
+    self.write_fd = write_fd
+    self.fifo = fifo
+    self.owned = False
+
+  @classmethod
+  def create(cls, jobs):
+    """Creates a new jobserver for the given number of parallel jobs, which
+    this process shares with the ``make`` (or ``ninja``) processes it starts
+
+    Like for GNU make, the jobserver is a pipe holding one token less than the
+    number of jobs. It is a named pipe, so that it can be announced to
+    ``ninja`` as well (see :py:meth:`environment`). Use :py:meth:`close` when
+    it is not needed anymore.
+    """
+
+    import tempfile
+    fifo = os.path.join(tempfile.mkdtemp(prefix='bob_extension_jobserver_'), 'fifo')
+    os.mkfifo(fifo, 0o600)
+    fd = os.open(fifo, os.O_RDWR)
+    os.write(fd, b'+' * (max(1, int(jobs)) - 1))
+    retval = cls(fd, fd, fifo)
+    retval.owned = True
+    return retval
+
+  def close(self):
+    """Closes and removes the named pipe of a jobserver that was
+    :py:meth:`create`\d"""
+
+    if self.owned:
+      os.close(self.read_fd)
+      os.remove(self.fifo)
+      os.rmdir(os.path.dirname(self.fifo))
+      self.owned = False
+
+  @classmethod
+  def from_environment(cls, environ=None):
+    """Connects to the jobserver announced in ``MAKEFLAGS``, or returns
+    ``None`` if there is none (or it cannot be used)"""
+
+    flags = (environ if environ is not None else os.environ).get('MAKEFLAGS', '')
+
+    match = re.search(r'--jobserver-(?:auth|fds)=fifo:(\S+)', flags)
+    if match is not None:
+      try:
+        fd = os.open(match.group(1), os.O_RDWR)
+      except OSError:
+        return None
+      return cls(fd, fd, match.group(1))
+
+    match = re.search(r'--jobserver-(?:auth|fds)=(\d+),(\d+)', flags)
+    if match is not None:
+      read_fd, write_fd = int(match.group(1)), int(match.group(2))
+      try:
+        os.fstat(read_fd)
+        os.fstat(write_fd)
+      except OSError: # make did not pass the pipe to us (no '+' in the rule)
+        return None
+      return cls(read_fd, write_fd)
+
+    return None
+
+  def acquire(self, block=True):
+    """Blocks until a token is available and returns it
+
+    If ``block`` is ``False``, returns ``None`` instead of waiting when no
+    token is available right away.
+    """
+
+    while True:
+      if not block and not select.select([self.read_fd], [], [], 0)[0]: return None
+      try:
+        token = os.read(self.read_fd, 1)
+      except OSError as e:
+        if e.errno == errno.EINTR: continue
+        # GNU make >= 4.3 makes the pipe non-blocking; wait until a token is written back
+        if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+          if not block: return None
+          select.select([self.read_fd], [], [])
+          continue
+        raise
+      if token: return token
+
+  def release(self, token):
+    """Gives the given token back to the jobserver"""
+
+    os.write(self.write_fd, token)
+
+  def pass_fds(self, fifo=False):
+    """Returns the file descriptors child processes need to share this
+    jobserver
+
+    Children that the jobserver is announced to by the path of its named pipe
+    (``fifo``) open it themselves.
+    """
+
+    if self.fifo is not None and (fifo or not self.owned): return ()
+    return (self.read_fd, self.write_fd)
+
+  def environment(self, fifo=False):
+    """Returns the environment variables that child processes need to share
+    this jobserver; the ones of a parent make are inherited already
+
+    With ``fifo``, the jobserver is announced as ``--jobserver-auth=fifo:PATH``,
+    the only form that ``ninja`` understands on POSIX systems, but that GNU
+    make only understands since version 4.4. Otherwise, it is announced by the
+    file descriptors the children inherit.
+    """
+
+    if not self.owned: return {}
+    if fifo:
+      return {'MAKEFLAGS': ' -j --jobserver-auth=fifo:%s' % self.fifo}
+    return {'MAKEFLAGS': ' -j --jobserver-auth=%d,%d' % (self.read_fd, self.write_fd)}
+
+
+class TokenPool:
+  """Limits the number of jobs that run at the same time
+
+  At most ``jobs`` jobs run concurrently. If a :py:class:`JobServer` is given,
+  every job besides the first one also needs one of its tokens, so that all
+  processes of a recursive make share the same limit. When jobs wait, the one
+  with the highest priority runs next.
+
+  Parameters:
+
+  jobs, int
+    The maximum number of parallel jobs of this process
+
+  jobserver, :py:class:`JobServer`
+    The jobserver of the parent make, if any
+  """
+
+  def __init__(self, jobs, jobserver=None):
+    self.jobs = max(1, int(jobs))
+    self.jobserver = jobserver
+    self._free = self.jobs
+    self._waiting = [] # a heap of (-priority, arrival)
+    self._arrival = itertools.count()
+    self._condition = threading.Condition()
+    self._lock = threading.Lock()
+    self._implicit = True
+
+  def _acquire_slot(self, priority, block=True):
+    """Blocks until one of the ``jobs`` slots is free and no job with a higher
+    priority is waiting for it; if ``block`` is ``False``, only takes a slot
+    that is free right away and returns whether it did"""
+
+    with self._condition:
+      if not block:
+        if not self._free or self._waiting: return False
+        self._free -= 1
+        return True
+      entry = (-priority, next(self._arrival))
+      heapq.heappush(self._waiting, entry)
+      while not self._free or self._waiting[0] != entry:
+        self._condition.wait()
+      heapq.heappop(self._waiting)
+      self._free -= 1
+      # the next waiting job may get a free slot as well
+      self._condition.notify_all()
+      return True
+
+  def _release_slot(self):
+    with self._condition:
+      self._free += 1
+      self._condition.notify_all()
+
+  def acquire(self, priority=0):
+    """Blocks until a new job may run; returns the token to release
+
+    Jobs with a higher ``priority`` are served first; jobs with the same
+    priority in the order they asked.
+    """
+
+    self._acquire_slot(priority)
+    if self.jobserver is None: return None
+
+    with self._lock:
+      if self._implicit:
+        self._implicit = False
+        return None
+    try:
+      return self.jobserver.acquire()
+    except BaseException:
+      self._release_slot()
+      raise
+
+  def acquire_many(self, count, priority=0):
+    """Blocks until a new job may run, and takes the slots of up to ``count``
+    jobs in total, as far as they are free right away; returns the list of
+    tokens to release
+
+    The number of tokens returned is the number of jobs the caller may run,
+    e.g., with ``make -jN``. Waiting for more than one of them could wait
+    forever, if a parent make holds less tokens.
+    """
+
+    tokens = [self.acquire(priority)]
+    try:
+      while len(tokens) < count and self._acquire_slot(priority, block=False):
+        if self.jobserver is None:
+          tokens.append(None)
+          continue
+        with self._lock:
+          implicit, self._implicit = self._implicit, False
+        if implicit:
+          tokens.append(None)
+          continue
+        try:
+          token = self.jobserver.acquire(block=False)
+        except BaseException:
+          self._release_slot()
+          raise
+        if token is None:
+          self._release_slot()
+          break
+        tokens.append(token)
+    except BaseException:
+      for token in tokens: self.release(token)
+      raise
+    return tokens
+
+  def release(self, token):
+    """Marks the job holding the given token as finished"""
+
+    if self.jobserver is not None:
+      if token is None:
+        with self._lock: self._implicit = True
+      else:
+        self.jobserver.release(token)
+    self._release_slot()
+
+  def make_arguments(self, jobserver=True, fifo=False, jobs=None):
+    """Returns the arguments for a child ``make``, the file descriptors it
+    must inherit and the environment variables it needs, so that it runs with
+    the same job limit
+
+    Children that need the jobserver announced by its named pipe (``fifo``,
+    see :py:meth:`JobServer.environment`) open it themselves. Children that do
+    not support the ``jobserver`` (e.g., ``ninja`` before version 1.13) get
+    the number of ``jobs`` (by default, all jobs of this pool) as argument
+    instead.
+    """
+
+    if self.jobserver is not None and jobserver:
+      return [], self.jobserver.pass_fds(fifo), self.jobserver.environment(fifo)
+    return ['-j%d' % (jobs if jobs is not None else self.jobs)], (), {}
+
+
+def run_parallel(function, items, pool, priority=None, reserve=None):
+  """Calls ``function(item)`` for all items, running as many calls in
+  parallel as the given :py:class:`TokenPool` allows
+
+  If given, ``priority(item)`` returns the priority of each item, e.g., its
+  expected duration: items with a higher priority are started first, also
+  before the waiting items of other calls sharing the pool. Otherwise, the
+  items are started in their order.
+
+  If given, ``reserve(item)`` blocks until the item may start (e.g., see
+  :py:meth:`MemoryBudget.admit`) and returns the function to call once it
+  finished. It is called before a token of the pool is taken, so that items
+  waiting for it do not keep other jobs from running.
+
+  All items are processed, even if some of them fail. Returns the list of
+  results in the order of the items. If calls raised exceptions, the one of
+  the first failing item (in the order of the items) is raised after all
+  calls finished. The other exceptions are attached to it as
+  ``errors``, a list of ``(item, exception)`` pairs in the order of the items.
+  """
+
+  items = list(items)
+  results = [None] * len(items)
+  errors = [None] * len(items)
+  priorities = [0] * len(items) if priority is None else [priority(k) for k in items]
+  order = sorted(range(len(items)), key=lambda k: -priorities[k])
+
+  def _run(index):
+    release = reserve(items[index]) if reserve is not None else None
+    try:
+      token = pool.acquire(priorities[index])
+      try:
+        results[index] = function(items[index])
+      except Exception as e:
+        errors[index] = e
+      finally:
+        pool.release(token)
+    finally:
+      if release is not None: release()
+
+  if pool.jobs == 1 or len(items) <= 1:
+    for index in order: _run(index)
+  else:
+    threads = multiprocessing.pool.ThreadPool(min(pool.jobs, len(items)))
+    try:
+      threads.map(_run, order, chunksize=1)
+    finally:
+      threads.close()
+      threads.join()
+
+  failed = [(items[k], errors[k]) for k in range(len(items)) if errors[k] is not None]
+  if failed:
+    failed[0][1].errors = failed
+    raise failed[0][1]
+  return results
+
+
+def run_graph(function, items, requires, workers, priority=None):
+  """Calls ``function(item)`` for all items, respecting their dependencies
+
+  ``requires(item)`` returns the items that must have been processed
+  successfully before ``item``. Up to ``workers`` items whose requirements are
+  satisfied are processed at the same time, the ones with the highest
+  ``priority(item)`` first, or in the order of the items. Items that
+  (directly or indirectly) require a failed item are skipped.
+
+  The workers are plain threads and do not take tokens from a
+  :py:class:`TokenPool`: this is left to the jobs started by ``function``, so
+  that they can share a pool without deadlocks. Errors are raised like in
+  :py:func:`run_parallel`, after all other items were processed or skipped.
+  """
+
+  items = list(items)
+  required = [[items.index(k) for k in requires(item)] for item in items]
+  order = list(range(len(items)))
+  if priority is not None:
+    priorities = [priority(k) for k in items]
+    order.sort(key=lambda k: -priorities[k])
+  state = [None] * len(items) # None: waiting, True: success, False: running/skipped, else: exception
+  finished = [False] * len(items)
+  condition = threading.Condition()
+
+  def _run(index):
+    try:
+      function(items[index])
+      result = True
+    except Exception as e:
+      result = e
+    with condition:
+      state[index] = result
+      finished[index] = True
+      condition.notify()
+
+  threads = multiprocessing.pool.ThreadPool(max(1, min(int(workers), len(items))))
+  try:
+    with condition:
+      while not all(finished):
+        for index in order:
+          if state[index] is not None: continue
+          if all(state[k] is True for k in required[index]):
+            state[index] = False
+            threads.apply_async(_run, (index,))
+          elif any(finished[k] and state[k] is not True for k in required[index]):
+            state[index] = False
+            finished[index] = True
+        if not all(finished): condition.wait()
+  finally:
+    threads.close()
+    threads.join()
+
+  failed = [(items[k], state[k]) for k in range(len(items)) if isinstance(state[k], Exception)]
+  if failed:
+    failed[0][1].errors = failed
+    raise failed[0][1]
+
+
+def source_size(filename):
+  """Returns the size (in bytes) of the given source file, or 0 if it does not
+  exist"""
+
+  try:
+    return os.path.getsize(filename)
+  except OSError:
+    return 0
+
+
+def install(compiler, pool, history=None, memory=None):
+  """Makes the given :py:class:`distutils.ccompiler.CCompiler` compile the
+  objects of each call to its ``compile`` method in parallel
+
+  Failed compilations do not stop the others. Afterwards, the error messages
+  of all failed objects are reported together, in the order of the sources,
+  and the raised error lists the ``(object, exception)`` pairs as ``errors``.
+  Each link step also takes a token of the ``pool``.
+
+  If a :py:class:`JobHistory` is given, the objects that are expected to take
+  longest are compiled first, and the duration of each compilation is
+  recorded. If a :py:class:`MemoryBudget` is given, each compilation also
+  waits for its estimated memory, before it takes a token of the ``pool``.
+  """
+
+  from distutils.errors import CompileError
+
+  def compile(sources, output_dir=None, macros=None, include_dirs=None, debug=0, extra_preargs=None, extra_postargs=None, depends=None):
+    # those lines are copied from distutils.ccompiler.CCompiler directly
+    macros, objects, extra_postargs, pp_opts, build = compiler._setup_compile(output_dir, macros, include_dirs, sources, depends, extra_postargs)
+    cc_args = compiler._get_cc_args(pp_opts, debug, extra_preargs)
+
+    def _single_compile(obj):
+      src, ext = build[obj]
+      # the memory is reserved by run_parallel(), before the job takes a token
+      if memory is not None:
+        memory.history.run(os.path.normpath(obj), compiler._compile, obj, src, ext, cc_args, extra_postargs, pp_opts)
+      elif history is not None:
+        history.run(os.path.normpath(obj), compiler._compile, obj, src, ext, cc_args, extra_postargs, pp_opts)
+      else:
+        compiler._compile(obj, src, ext, cc_args, extra_postargs, pp_opts)
+
+    def _priority(obj):
+      size = source_size(build[obj][0])
+      history.record(os.path.normpath(obj), size=size)
+      return history.duration(os.path.normpath(obj), size)
+
+    try:
+      run_parallel(_single_compile, [k for k in objects if k in build], pool, None if history is None else _priority,
+          None if memory is None else lambda obj: memory.admit(os.path.normpath(obj)))
+    except CompileError as e:
+      if len(e.errors) > 1:
+        combined = CompileError('\n'.join('%s: %s' % (build[obj][0], error) for obj, error in e.errors))
+        combined.errors = e.errors
+        raise combined
+      raise
+
+    return objects
+
+  original_link = compiler.link
+
+  def link(*args, **kwargs):
+    token = pool.acquire()
+    try:
+      return original_link(*args, **kwargs)
+    finally:
+      pool.release(token)
+
+  compiler.compile = compile
+  compiler.link = link
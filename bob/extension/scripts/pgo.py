@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""
+This script builds the C/C++ code of the package in the current directory with
+profile-guided optimization (PGO).
+
+It assumes that you are in the main directory of the package, i.e., where its
+'setup.py' is located. By default, this script executes three steps, in this
+order:
+
+  * generate: All Extension's and Library's of the package are (re-)built
+    in place, instrumented to record profiles ('build_ext --pgo=generate').
+
+  * train: The given training command is run, which should exercise the
+    C/C++ code in a representative way, e.g., by running the tests of the
+    package. The profiles are recorded during this step.
+
+  * use: All Extension's and Library's are built again in place, optimized
+    using the recorded profiles ('build_ext --pgo=use').
+
+The profiles are stored per package and version, in the directory given by the
+BOB_PGO_DIRECTORY environment variable, or in the 'profiles' directory inside
+the BOB_BUILD_CACHE, or in 'build/pgo' otherwise. If any of the steps fails, the
+remaining steps are skipped.
+
+Examples:
+
+  Optimize the package using its test suite as training:
+
+    %(prog)s --train "bin/nosetests -sv bob.example.library"
+
+  Print out, what would be done using the '--dry-run' option:
+
+    %(prog)s --train "bin/nosetests -sv bob.example.library" -q
+
+  Rebuild the optimized version from the profiles recorded before:
+
+    %(prog)s --steps use
+"""
+
+from __future__ import print_function
+import sys, os
+import subprocess
+
+import argparse
+
+
+def main(command_line_options = None):
+  doc = __doc__ % dict(prog=os.path.basename(sys.argv[0]))
+  parser = argparse.ArgumentParser(description=doc, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+  parser.add_argument("--train", '-t', help = "The training command, which is run in a shell; required by the 'train' step")
+  parser.add_argument("--python", '-p', default = sys.executable, help = "The python executable that runs the setup.py")
+  parser.add_argument("--build-options", '-b', nargs='+', default = [], help = "Add options to the build_ext commands, e.g., '-j 4'")
+  parser.add_argument("--steps", nargs = "+", choices = ['generate', 'train', 'use'], default = ['generate', 'train', 'use'], help = "Select the steps that you want to execute")
+  parser.add_argument("--dry-run", '-q', action = 'store_true', help = "Only print the actions, but do not execute them")
+  parser.add_argument("--verbose", '-v', action = 'store_true', help = "Print more information")
+
+  args = parser.parse_args(command_line_options)
+
+  if 'train' in args.steps and not args.train:
+    raise ValueError("The 'train' step requires a training command, see --train")
+  if not os.path.exists('setup.py'):
+    raise IOError("Could not find the 'setup.py' file. Are you inside the root directory of your package?")
+
+  def run_command(call, shell = False):
+    """Runs the given command, and raises an exception if it fails."""
+    text = call if shell else ' '.join(call)
+    if args.verbose or args.dry_run:
+      print (' - ' + text)
+    if not args.dry_run:
+      if subprocess.call(call, shell = shell):
+        raise ValueError("Command '%s' failed; stopping" % text)
+
+  def build(phase):
+    return [args.python, 'setup.py', 'build_ext', '--inplace', '--force', '--pgo=%s' % phase] + args.build_options
+
+
+  if 'generate' in args.steps:
+    print ("\nBuilding the instrumented package")
+    run_command(build('generate'))
+
+  if 'train' in args.steps:
+    print ("\nRecording profiles")
+    run_command(args.train, shell = True)
+
+  if 'use' in args.steps:
+    print ("\nBuilding the optimized package")
+    run_command(build('use'))
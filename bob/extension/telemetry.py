@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Tue 20 Oct 2026 09:15:26 CEST
+
+"""Records where the time of a build goes
+
+The wall time of each step of a build (compiling a translation unit, linking,
+configuring and building a :py:class:`bob.extension.Library` with CMake,
+resolving a dependency, ...) is recorded by the :py:data:`build_telemetry` of
+the process, together with the peak resident memory of the processes that
+were run. ``build_ext`` writes the records into :py:data:`REPORT_NAME` inside
+``build_temp``, and reports the slowest translation units and the critical
+path of the build.
+
+The report is a JSON dictionary with the ``package``, its ``version``, the
+``host``, the ``start`` time (seconds since the epoch) and ``duration`` of the
+build, and the list of ``records``. Each record has a ``phase`` (see
+:py:data:`PHASES`), a ``name`` (e.g., the source file), the ``extension`` it
+belongs to (if known), its ``start`` (relative to the start of the build) and
+``duration`` in seconds, and the ``peak_rss`` in KiB (or ``None``). Use
+:py:func:`aggregate` to combine the reports of several packages.
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import socket
+import threading
+import subprocess
+
+from .unity import SOURCE_SUFFIXES
+
+#: Name of the telemetry report inside ``build_temp``
+REPORT_NAME = 'bob_extension_telemetry.json'
+
+#: The phases of the records
+PHASES = ('resolve', 'pch', 'compile', 'link', 'cmake-configure', 'cmake-build', 'extension')
+
+
+def run(command, **kwargs):
+  """Runs the given command with :py:class:`subprocess.Popen` and the given
+  keyword arguments, and waits for it
+
+  Returns a tuple with the exit code and the peak resident memory in KiB of the
+  process and its children, or ``None`` if it cannot be measured.
+  """
+
+  process = subprocess.Popen(command, **kwargs)
+  if not hasattr(os, 'wait4'):
+    return process.wait(), None
+
+  while True:
+    try:
+      pid, status, usage = os.wait4(process.pid, 0)
+      break
+    except OSError as e: # python < 3.5
+      if e.errno != errno.EINTR: raise
+  process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+  # macOS reports bytes, Linux KiB
+  rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+  return process.returncode, rss
+
+
+def output_file(command):
+  """Returns the output file of the given compiler command, or ``None``"""
+  return command[command.index('-o') + 1] if '-o' in command[:-1] else None
+
+
+def classify(command):
+  """Returns the phase and name of the step that the given compiler command
+  runs: ``('pch', header)``, ``('compile', source)`` or ``('link', output)``"""
+
+  output = output_file(command)
+  if 'c++-header' in command:
+    return 'pch', output
+  if '-c' in command:
+    sources = [k for k in command[1:] if os.path.splitext(k)[1] in SOURCE_SUFFIXES]
+    return 'compile', sources[0] if sources else output
+  return 'link', output
+
+
+def ninja_records(log_file, offset, start):
+  """Returns the steps that ninja appended to its ``.ninja_log`` file after the
+  given byte ``offset``, in a build started at the given time
+
+  Each step is a tuple of its output file, its start and its end time.
+  """
+
+  retval = []
+  try:
+    with open(log_file) as f:
+      f.seek(offset)
+      for line in f:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) < 4 or line.startswith('#'): continue
+        retval.append((fields[3], start + int(fields[0]) / 1000., start + int(fields[1]) / 1000.))
+  except (IOError, OSError, ValueError):
+    pass
+  return retval
+
+
+class Telemetry:
+  """A thread-safe record of the steps of a build
+
+  Use :py:meth:`measure` or :py:meth:`record` to add steps, and
+  :py:meth:`install` to record each process that a compiler runs.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._local = threading.local()
+    self.clear()
+
+  def clear(self):
+    """Forgets about all records"""
+    with self._lock:
+      self.records = []
+      self.owners = {}
+
+  def record(self, phase, name, start, end, peak_rss=None, extension=None, output=None):
+    """Records a step of the given ``phase`` that ran from ``start`` to ``end``
+    (as returned by :py:func:`time.time`)
+
+    The ``output`` file of the step is used to find its ``extension``, if not
+    given (see :py:meth:`set_owner`).
+    """
+
+    with self._lock:
+      self.records.append({'phase': phase, 'name': name, 'extension': extension, 'output': output,
+          'start': start, 'duration': end - start, 'peak_rss': peak_rss})
+
+  def measure(self, phase, name, extension=None):
+    """Returns a context manager that records the wall time of its block"""
+    return _Measure(self, phase, name, extension)
+
+  def usage(self):
+    """Returns the summed duration (in seconds) and the largest peak resident
+    memory (in KiB, or ``None``) of the processes that the compiler ran in
+    this thread since the last call, or ``None`` if it ran none"""
+
+    retval = getattr(self._local, 'usage', None)
+    self._local.usage = None
+    return retval
+
+  def set_owner(self, outputs, extension):
+    """Declares that the given output files belong to the given extension"""
+    with self._lock:
+      for k in outputs: self.owners[os.path.normpath(k)] = extension
+
+  def install(self, compiler):
+    """Makes the given :py:class:`distutils.ccompiler.CCompiler` record each
+    process it runs, i.e., each compilation and link step"""
+
+    # distutils sets up the environment of the processes on macOS
+    if not hasattr(os, 'wait4') or sys.platform == 'darwin':
+      original = compiler.spawn
+      def spawn(cmd, **kwargs):
+        phase, name = classify(cmd)
+        start = time.time()
+        try:
+          original(cmd, **kwargs)
+        finally:
+          end = time.time()
+          self.record(phase, name, start, end, output=output_file(cmd))
+          self._add_usage(end - start, None)
+      compiler.spawn = spawn
+      return
+
+    import distutils.log
+    from distutils.errors import DistutilsExecError
+
+    def spawn(cmd, **kwargs):
+      # those lines follow distutils.spawn.spawn, but keep the resource usage of the process
+      cmd = list(cmd)
+      distutils.log.info(subprocess.list2cmdline(cmd))
+      if compiler.dry_run: return
+      phase, name = classify(cmd)
+      start = time.time()
+      try:
+        status, rss = run(cmd, env=kwargs.get('env'))
+      except OSError as e:
+        raise DistutilsExecError("command %r failed: %s" % (cmd[0], e.args[-1]))
+      end = time.time()
+      self.record(phase, name, start, end, rss, output=output_file(cmd))
+      self._add_usage(end - start, rss)
+      if status:
+        raise DistutilsExecError("command %r failed with exit code %s" % (cmd[0], status))
+
+    compiler.spawn = spawn
+
+  def _add_usage(self, duration, rss):
+    """Adds a process to the :py:meth:`usage` of this thread"""
+
+    previous = getattr(self._local, 'usage', None) or (0., None)
+    if previous[1] is not None: rss = max(rss or 0, previous[1])
+    self._local.usage = (previous[0] + duration, rss)
+
+  def report(self, package=None, version=None):
+    """Returns the report of all records, see the description of this module"""
+
+    with self._lock:
+      records = [dict(k) for k in self.records]
+      owners = dict(self.owners)
+    start = min([k['start'] for k in records] or [time.time()])
+    end = max([k['start'] + k['duration'] for k in records] or [start])
+    for k in records:
+      output = k.pop('output')
+      if k['extension'] is None and output is not None:
+        k['extension'] = owners.get(os.path.normpath(output))
+      k['start'] -= start
+    records.sort(key=lambda k: k['start'])
+    return {'package': package, 'version': version, 'host': socket.gethostname(),
+        'start': start, 'duration': end - start, 'records': records}
+
+  def save(self, filename, package=None, version=None):
+    """Writes the :py:meth:`report` to the given JSON file, and returns it"""
+
+    report = self.report(package, version)
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+      os.makedirs(directory)
+    with open(filename, 'wt') as f:
+      json.dump(report, f, indent=1, sort_keys=True)
+    return report
+
+
+class _Measure:
+  """Records the wall time of a ``with`` block"""
+
+  def __init__(self, telemetry, phase, name, extension):
+    self.telemetry = telemetry
+    self.phase = phase
+    self.name = name
+    self.extension = extension
+
+  def __enter__(self):
+    self.start = time.time()
+    return self
+
+  def __exit__(self, *args):
+    self.telemetry.record(self.phase, self.name, self.start, time.time(), extension=self.extension)
+
+
+def slowest(report, count=10, phases=('compile',)):
+  """Returns the ``count`` records of the given phases with the longest
+  duration, slowest first"""
+
+  records = [k for k in report['records'] if k['phase'] in phases]
+  return sorted(records, key=lambda k: -k['duration'])[:count]
+
+
+def critical_path(report):
+  """Returns the chain of steps that determined the duration of the build
+
+  Starting from the step that finished last, the previous step of the chain is
+  the one that finished last before it started; waiting extensions
+  (``'extension'`` records) are not steps themselves.
+  """
+
+  steps = [k for k in report['records'] if k['phase'] != 'extension']
+  path = []
+  current = max(steps, key=lambda k: k['start'] + k['duration']) if steps else None
+  while current is not None:
+    path.append(current)
+    before = [k for k in steps if k['start'] + k['duration'] <= current['start'] and not any(k is p for p in path)]
+    current = max(before, key=lambda k: k['start'] + k['duration']) if before else None
+  return path[::-1]
+
+
+def totals(report):
+  """Returns the summed duration of the records for each phase"""
+
+  retval = {}
+  for k in report['records']:
+    retval[k['phase']] = retval.get(k['phase'], 0.) + k['duration']
+  return retval
+
+
+def aggregate(filenames):
+  """Reads the reports in the given JSON files (e.g., of all packages of a
+  stack) and returns all their records in one list, each with the ``package``
+  and ``version`` it belongs to, and its ``start`` relative to the earliest
+  build"""
+
+  reports = []
+  for filename in filenames:
+    with open(filename) as f:
+      reports.append(json.load(f))
+  start = min([k['start'] for k in reports] or [0])
+  retval = []
+  for report in reports:
+    for record in report['records']:
+      record = dict(record)
+      record.update(package=report['package'], version=report['version'])
+      record['start'] += report['start'] - start
+      retval.append(record)
+  retval.sort(key=lambda k: k['start'])
+  return retval
+
+
+#: The telemetry of all builds in this process
+build_telemetry = Telemetry()
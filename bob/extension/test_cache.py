@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Fri 16 Oct 2026 14:12:05 CEST
+
+"""Tests for the object cache
+"""
+
+import os
+import shutil
+import tempfile
+import nose.tools
+
+import distutils.ccompiler
+import distutils.sysconfig
+
+from .cache import ObjectCache, parse_size
+
+
+def test_parse_size():
+  nose.tools.eq_(parse_size('100'), 100)
+  nose.tools.eq_(parse_size('2K'), 2048)
+  nose.tools.eq_(parse_size('1.5M'), 1536 * 1024)
+  nose.tools.eq_(parse_size('5GB'), 5 * 1024**3)
+  nose.tools.assert_raises(ValueError, parse_size, 'lots')
+
+
+def test_object_cache():
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  old_dir = os.getcwd()
+  try:
+    os.chdir(temp_dir)
+    with open('test.c', 'w') as f:
+      f.write('int answer() { return 42; }\n')
+
+    cache = ObjectCache(os.path.join(temp_dir, 'cache'), 1024**2)
+
+    def _compile(macros=None):
+      compiler = distutils.ccompiler.new_compiler()
+      distutils.sysconfig.customize_compiler(compiler)
+      cache.install(compiler)
+      objects = compiler.compile(['test.c'], output_dir='build', macros=macros)
+      assert os.path.exists(objects[0])
+      os.remove(objects[0])
+
+    _compile()
+    nose.tools.eq_((cache.hits, cache.misses), (0, 1))
+
+    # the same compilation is taken from the cache
+    _compile()
+    nose.tools.eq_((cache.hits, cache.misses), (1, 1))
+
+    # changes in the flags lead to a different object
+    _compile([('FOO', '1')])
+    nose.tools.eq_((cache.hits, cache.misses), (1, 2))
+
+    # the least recently used objects are removed first
+    objects = [os.path.join(path, k) for path, _, files in os.walk(cache.directory) for k in files]
+    nose.tools.eq_(len(objects), 2)
+    os.utime(objects[0], (0, 0))
+    cache.max_size = os.path.getsize(objects[1])
+    cache.cleanup()
+    assert not os.path.exists(objects[0])
+    assert os.path.exists(objects[1])
+
+  finally:
+    os.chdir(old_dir)
+    shutil.rmtree(temp_dir)
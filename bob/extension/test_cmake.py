@@ -15,6 +15,7 @@ import platform
 import bob.extension
 import pkg_resources
 
+import json
 import tempfile
 
 def _find(lines, start):
@@ -40,7 +41,9 @@ def test_cmake_list():
 
   temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
 
-  generator.generate(temp_dir, temp_dir)
+  assert generator.generate(temp_dir, temp_dir)
+  # unchanged contents are not written again
+  assert not generator.generate(temp_dir, temp_dir)
 
   # read created file
   lines = [line.rstrip() for line in open(os.path.join(temp_dir, "CMakeLists.txt"))]
@@ -64,6 +67,21 @@ def test_cmake_list():
   shutil.rmtree(temp_dir)
 
 
+def test_cmake_precompiled_header():
+  generator = bob.extension.CMakeListsGenerator(
+    name = 'bob_cmake_test',
+    sources = ['cmake_test.cpp'],
+    target_directory = "test_target",
+    precompiled_header = "/usr/include/test/pch.h"
+  )
+  lines = [line.strip() for line in generator.contents('.').split('\n')]
+  # precompiled for C++ only, if CMake supports it, and included otherwise
+  index = _find(lines, 'if(NOT CMAKE_VERSION VERSION_LESS 3.16)')
+  assert lines[index+1] == 'target_precompile_headers(${PROJECT_NAME} PRIVATE "$<$<COMPILE_LANGUAGE:CXX>:/usr/include/test/pch.h>")'
+  assert lines[index+2] == 'else()'
+  assert lines[index+3] == 'set_target_properties(${PROJECT_NAME} PROPERTIES COMPILE_FLAGS "-include /usr/include/test/pch.h")'
+
+
 def test_library():
   old_dir = os.getcwd()
   temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
@@ -95,9 +113,223 @@ def test_library():
 
   assert os.path.exists(os.path.join(target_dir, lib_name))
 
+  # a second compilation neither rewrites the CMakeLists.txt nor reconfigures
+  cmake_dir = os.path.join(temp_dir, 'build', 'build_cmake', 'bob_cmake_test')
+  files = [os.path.join(cmake_dir, k) for k in ('CMakeLists.txt', 'CMakeCache.txt')]
+  past = os.path.getmtime(files[0]) - 10
+  for f in files: os.utime(f, (past, past))
+  library.compile(compile_dir,stdout=devnull)
+  assert all(os.path.getmtime(f) == past for f in files)
+
+  # changing the flags reconfigures
+  old_flags = os.environ.get('CXXFLAGS')
+  os.environ['CXXFLAGS'] = '-O0'
+  try:
+    library.compile(compile_dir,stdout=devnull)
+  finally:
+    if old_flags is None: del os.environ['CXXFLAGS']
+    else: os.environ['CXXFLAGS'] = old_flags
+  assert os.path.getmtime(files[0]) == past
+  assert os.path.getmtime(files[1]) != past
+
   os.chdir(old_dir)
 
   # TODO: compile a test executable to actually link the library
 
   # finally, clean up the mess
   shutil.rmtree(temp_dir)
+
+
+def test_generator():
+  from .cmake import cached_generator, clean_build_directory
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    assert cached_generator(temp_dir) is None
+    with open(os.path.join(temp_dir, 'CMakeLists.txt'), 'w') as f: f.write('project(test)\n')
+    with open(os.path.join(temp_dir, 'CMakeCache.txt'), 'w') as f: f.write('CMAKE_COMMAND:INTERNAL=/usr/bin/cmake\nCMAKE_GENERATOR:INTERNAL=Unix Makefiles\n')
+    os.makedirs(os.path.join(temp_dir, 'CMakeFiles', 'test.dir'))
+    assert cached_generator(temp_dir) == 'Unix Makefiles'
+
+    # switching the generator requires a clean build directory
+    clean_build_directory(temp_dir)
+    assert os.listdir(temp_dir) == ['CMakeLists.txt']
+    assert cached_generator(temp_dir) is None
+  finally:
+    shutil.rmtree(temp_dir)
+
+  # unknown generators are refused
+  library = bob.extension.Library('target.bob_cmake_test', ['test.cpp'], version = '1.0.0')
+  old_generator = os.environ.get('BOB_CMAKE_GENERATOR')
+  os.environ['BOB_CMAKE_GENERATOR'] = 'Visual Studio'
+  try:
+    nose.tools.assert_raises(ValueError, library.configure)
+  finally:
+    if old_generator is None: del os.environ['BOB_CMAKE_GENERATOR']
+    else: os.environ['BOB_CMAKE_GENERATOR'] = old_generator
+
+
+def test_bob_libraries_manifest():
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  package_dir = os.path.join(temp_dir, 'bob_extension_manifest_test')
+  os.makedirs(package_dir)
+  # the package cannot be imported; it must be found through its manifest
+  with open(os.path.join(package_dir, '__init__.py'), 'w') as f:
+    f.write("raise ImportError('must not be imported')\n")
+  with open(os.path.join(package_dir, 'bob_extension.json'), 'w') as f:
+    f.write('{"get_include_directories": false, "libraries": ["bob_extension_manifest_test"]}')
+
+  sys.path.insert(0, temp_dir)
+  try:
+    includes, libraries, library_dirs = bob.extension.get_bob_libraries(['bob_extension_manifest_test'])
+
+    # packages defining get_include_directories() are imported to call it
+    with open(os.path.join(package_dir, '__init__.py'), 'w') as f:
+      f.write("def get_include_directories():\n  return ['/usr/include/test']\n")
+    with open(os.path.join(package_dir, 'bob_extension.json'), 'w') as f:
+      f.write('{"get_include_directories": true, "libraries": []}')
+    assert bob.extension.get_bob_libraries(['bob_extension_manifest_test'])[0] == [os.path.join(package_dir, 'include'), '/usr/include/test']
+    assert bob.extension._defines_function(os.path.join(package_dir, '__init__.py'), 'get_include_directories')
+    assert not bob.extension._defines_function(os.path.join(package_dir, '__init__.py'), 'get_config')
+  finally:
+    sys.path.remove(temp_dir)
+    sys.modules.pop('bob_extension_manifest_test', None)
+    shutil.rmtree(temp_dir)
+
+  assert includes == [os.path.join(package_dir, 'include')]
+  assert libraries == ['bob_extension_manifest_test']
+  assert library_dirs == [package_dir]
+
+
+def test_bob_libraries_manifest_include_directories():
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  # a package whose get_include_directories() imports a heavy module, like NumPy
+  os.makedirs(os.path.join(temp_dir, 'bob_extension_heavy_dependency', 'include'))
+  with open(os.path.join(temp_dir, 'bob_extension_heavy_dependency', '__init__.py'), 'w') as f:
+    f.write("import os\ndef get_include():\n  return os.path.join(os.path.dirname(__file__), 'include')\n")
+  package_dir = os.path.join(temp_dir, 'bob_extension_manifest_test')
+  os.makedirs(package_dir)
+  with open(os.path.join(package_dir, '__init__.py'), 'w') as f:
+    f.write("import bob_extension_heavy_dependency\ndef get_include_directories():\n  return [bob_extension_heavy_dependency.get_include()]\n")
+
+  moved_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    # recorded at build time, from the built package
+    directories = bob.extension._include_directories('bob_extension_manifest_test', temp_dir)
+    assert directories == [{'module': 'bob_extension_heavy_dependency', 'path': 'include'}]
+    with open(os.path.join(package_dir, 'bob_extension.json'), 'w') as f:
+      json.dump({'get_include_directories': True, 'include_directories': directories, 'libraries': []}, f)
+
+    # ... and found again after the packages were moved, without importing them
+    os.rmdir(moved_dir)
+    shutil.move(temp_dir, moved_dir)
+    sys.path.insert(0, moved_dir)
+    try:
+      includes = bob.extension.get_bob_libraries(['bob_extension_manifest_test'])[0]
+    finally:
+      sys.path.remove(moved_dir)
+    assert includes == [os.path.join(moved_dir, 'bob_extension_manifest_test', 'include'), os.path.join(moved_dir, 'bob_extension_heavy_dependency', 'include')]
+    assert 'bob_extension_manifest_test' not in sys.modules
+    assert 'bob_extension_heavy_dependency' not in sys.modules
+  finally:
+    for k in ('bob_extension_manifest_test', 'bob_extension_heavy_dependency'): sys.modules.pop(k, None)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    shutil.rmtree(moved_dir, ignore_errors=True)
+
+
+def test_link_waits_for_library():
+  import threading
+  import distutils.errors
+  from setuptools import Distribution
+
+  library = bob.extension.Library('bob.test.bob_test', ['test.cpp'], version='1.0')
+  extension = bob.extension.Extension('bob.test._test', ['test.cpp'])
+  command = bob.extension.build_ext(Distribution({'ext_modules': [library, extension]}))
+
+  finished = threading.Event()
+  command._libraries = [(library, finished)]
+  command._failed_libraries = set()
+
+  # linking is only possible after the library is built
+  timer = threading.Timer(0.1, finished.set)
+  timer.start()
+  command.get_libraries(extension)
+  assert finished.is_set()
+  timer.join()
+
+  command._failed_libraries.add(library.name)
+  nose.tools.assert_raises(distutils.errors.LinkError, command.get_libraries, extension)
+
+
+def test_superbuild():
+  from setuptools import Distribution
+  old_dir = os.getcwd()
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    os.chdir(temp_dir)
+    with open('first.cpp', 'w') as f: f.write('int first() { return 1; }\n')
+    with open('second.cpp', 'w') as f: f.write('int first();\nint second() { return first() + 1; }\n')
+    # the second library links against the first one, which is not installed anywhere yet
+    first = bob.extension.Library('target.bob_first', ['first.cpp'], version='1.0.0')
+    second = bob.extension.Library('target.bob_second', ['second.cpp'], version='1.0.0', libraries=['bob_first'])
+
+    command = bob.extension.build_ext(Distribution({'ext_modules': [first, second]}))
+    command.build_lib = os.path.join(temp_dir, 'build', 'lib')
+    command.jobs = None
+    command.build_superbuild([first, second])
+
+    # a single project with a sub-directory for each library
+    cmake_dir = os.path.join(temp_dir, 'build', 'build_cmake', 'bob_extension_superbuild')
+    lines = [line.rstrip() for line in open(os.path.join(cmake_dir, 'CMakeLists.txt'))]
+    assert lines[_find(lines, 'project')] == 'project(bob_extension_superbuild)'
+    assert 'add_subdirectory(bob_first)' in lines and 'add_subdirectory(bob_second)' in lines
+    lines = [line.rstrip() for line in open(os.path.join(cmake_dir, 'bob_second', 'CMakeLists.txt'))]
+    assert not any(line.startswith('cmake_minimum_required') for line in lines)
+
+    suffix = '.dylib' if platform.system() == 'Darwin' else '.so'
+    assert os.path.exists(os.path.join(temp_dir, 'build', 'lib', 'target', 'libbob_first' + suffix))
+    assert os.path.exists(os.path.join(temp_dir, 'build', 'lib', 'target', 'libbob_second' + suffix))
+  finally:
+    os.chdir(old_dir)
+    shutil.rmtree(temp_dir)
+
+def test_ninja_jobserver():
+  # ninja 1.13 only shares jobservers that are announced by a named pipe
+  from .cmake import supports_jobserver
+  from .scheduler import JobServer, TokenPool
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    ninja = os.path.join(temp_dir, 'ninja')
+    with open(ninja, 'w') as f:
+      f.write('#!/bin/sh\necho 1.13.1\n')
+    os.chmod(ninja, 0o755)
+
+    jobserver = JobServer.create(4)
+    try:
+      assert supports_jobserver(ninja, jobserver)
+      assert supports_jobserver('/usr/bin/make', jobserver)
+      environ = TokenPool(4, jobserver).make_arguments(True, True)[2]
+      nose.tools.eq_(environ['MAKEFLAGS'].split()[-1], '--jobserver-auth=fifo:%s' % jobserver.fifo)
+    finally:
+      jobserver.close()
+
+    # ... but not the anonymous pipe of a parent make
+    read_fd, write_fd = os.pipe()
+    try:
+      assert not supports_jobserver(ninja, JobServer(read_fd, write_fd))
+    finally:
+      os.close(read_fd)
+      os.close(write_fd)
+
+    # older versions do not share jobservers at all
+    old = os.path.join(temp_dir, 'old', 'ninja')
+    os.makedirs(os.path.dirname(old))
+    with open(old, 'w') as f:
+      f.write('#!/bin/sh\necho 1.12.1\n')
+    os.chmod(old, 0o755)
+    jobserver = JobServer.create(4)
+    try:
+      assert not supports_jobserver(old, jobserver)
+    finally:
+      jobserver.close()
+  finally:
+    shutil.rmtree(temp_dir)
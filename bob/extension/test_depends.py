@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Fri 16 Oct 2026 16:47:31 CEST
+
+"""Tests for the header dependency tracking
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import nose.tools
+
+import distutils.ccompiler
+import distutils.sysconfig
+
+from .depends import DependencyDatabase, parse_depfile, strip_dependency_flags, add_dependencies
+
+
+def test_strip_dependency_flags():
+  nose.tools.eq_(strip_dependency_flags(['-O2', '-MMD', '-MF', 'a.d', '-MTa.o', '-MP', '-I.']), ['-O2', '-I.'])
+
+
+def test_parse_depfile():
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    depfile = os.path.join(temp_dir, 'test.o.d')
+    with open(depfile, 'w') as f:
+      f.write('build/test.o: test.c include/a.h \\\n  include/with\\ space.h cost$$.h\ninclude/a.h:\n')
+    nose.tools.eq_(parse_depfile(depfile), ['test.c', 'include/a.h', 'include/with space.h', 'cost$.h'])
+  finally:
+    shutil.rmtree(temp_dir)
+
+
+def test_add_dependencies():
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    depfile = os.path.join(temp_dir, 'test.o.d')
+    with open(depfile, 'w') as f:
+      f.write('build/test.o: test.c \\\n  include/a.h\ninclude/a.h:\n')
+    add_dependencies(depfile, ['include/a.h', 'pch/with space.h'])
+    nose.tools.eq_(parse_depfile(depfile), ['test.c', 'include/a.h', 'pch/with space.h'])
+  finally:
+    shutil.rmtree(temp_dir)
+
+
+def test_dependency_database():
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  old_dir = os.getcwd()
+  try:
+    os.chdir(temp_dir)
+    with open('test.h', 'w') as f:
+      f.write('#define ANSWER 42\n')
+    with open('test.c', 'w') as f:
+      f.write('#include "test.h"\nint answer() { return ANSWER; }\n')
+    with open('other.c', 'w') as f:
+      f.write('int other() { return 0; }\n')
+
+    def _compile(common=[]):
+      database = DependencyDatabase(os.path.join('build', 'depends.json'))
+      database.common = common
+      compiler = distutils.ccompiler.new_compiler()
+      distutils.sysconfig.customize_compiler(compiler)
+      database.install(compiler)
+      compiler.compile(['test.c', 'other.c'], output_dir='build')
+      database.save()
+      return database
+
+    database = _compile()
+    nose.tools.eq_((database.compiled, database.skipped), (2, 0))
+    nose.tools.eq_(database.dependencies(os.path.join('build', 'test.o')), ['test.c', 'test.h'])
+
+    # nothing changed
+    database = _compile()
+    nose.tools.eq_((database.compiled, database.skipped), (0, 2))
+
+    # only the object including the header is compiled again
+    future = time.time() + 10
+    os.utime('test.h', (future, future))
+    database = _compile()
+    nose.tools.eq_((database.compiled, database.skipped), (1, 1))
+
+    # files that all objects depend on, e.g., profiles
+    past = time.time() - 10
+    os.utime('test.h', (past, past))
+    with open('profile', 'w') as f:
+      f.write('\n')
+    os.utime('profile', (past, past))
+    database = _compile(['profile'])
+    nose.tools.eq_((database.compiled, database.skipped), (0, 2))
+    os.utime('profile', (future, future))
+    database = _compile(['profile'])
+    nose.tools.eq_((database.compiled, database.skipped), (2, 0))
+
+  finally:
+    os.chdir(old_dir)
+    shutil.rmtree(temp_dir)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Wed 21 Oct 2026 14:48:13 CEST
+
+"""Tests for the analysis of the included headers
+"""
+
+import os
+import shutil
+import tempfile
+import nose.tools
+
+from distutils.spawn import find_executable
+
+from .includes import parse_includes, include_tree, merge_tree, IncludeAnalyzer
+
+
+def _write(filename, contents):
+  with open(filename, 'w') as f:
+    f.write(contents)
+
+
+def test_include_tree():
+  output = ". /usr/include/a.h\n.. /usr/include/b.h\n... /usr/include/c.h\n. /usr/include/d.h\nMultiple include guards may be useful for:\n/usr/include/d.h\n"
+  includes = parse_includes(output)
+  nose.tools.eq_(includes, [(1, '/usr/include/a.h'), (2, '/usr/include/b.h'), (3, '/usr/include/c.h'), (1, '/usr/include/d.h')])
+
+  children = include_tree(includes)
+  nose.tools.eq_(children[None], ['/usr/include/a.h', '/usr/include/d.h'])
+  nose.tools.eq_(children['/usr/include/a.h'], ['/usr/include/b.h'])
+  nose.tools.eq_(children['/usr/include/c.h'], [])
+
+  tree = {}
+  merge_tree(tree, children)
+  merge_tree(tree, include_tree([(1, '/usr/include/a.h')]))
+  nose.tools.eq_(tree['/usr/include/a.h']['count'], 2)
+  nose.tools.eq_(tree['/usr/include/a.h']['includes']['/usr/include/b.h']['count'], 1)
+
+  # relative paths are resolved against the directory of the compiler
+  nose.tools.eq_(parse_includes(". pkg/local.h\n.. ../other.h\n", '/src'), [(1, '/src/pkg/local.h'), (2, '/other.h')])
+
+
+def test_analyzer():
+  compiler = find_executable('g++') or find_executable('clang++')
+  if compiler is None: return
+
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    _write(os.path.join(temp_dir, 'common.h'), '#pragma once\n#include "detail.h"\n')
+    _write(os.path.join(temp_dir, 'detail.h'), '#pragma once\nint detail();\n')
+    _write(os.path.join(temp_dir, 'rare.h'), '#pragma once\nint rare();\n')
+    sources = [os.path.join(temp_dir, k) for k in ('a.cpp', 'b.cpp', 'c.cpp')]
+    _write(sources[0], '#include "common.h"\n#include "rare.h"\n')
+    _write(sources[1], '#include "common.h"\n')
+    _write(sources[2], 'int c() { return 0; }\n')
+
+    analyzer = IncludeAnalyzer(os.path.join(temp_dir, 'includes'))
+    for source in sources:
+      analyzer.analyze([compiler, '-c'], source, ['-I' + temp_dir, '-MMD', '-MF', 'unused.d'])
+    nose.tools.eq_(sorted(analyzer.units), sorted(sources))
+
+    times = analyzer.header_times()
+    common = os.path.join(temp_dir, 'common.h')
+    nose.tools.eq_(sorted(times), sorted(os.path.join(temp_dir, k) for k in ('common.h', 'detail.h', 'rare.h')))
+
+    # pretend that the common header is expensive
+    times[common] = 1.
+    report = analyzer.report(times)
+    nose.tools.eq_(report['headers'][0]['header'], common)
+    nose.tools.eq_((report['headers'][0]['count'], report['headers'][0]['direct'], report['headers'][0]['includes']), (2, 2, 1))
+    nose.tools.eq_(report['headers'][0]['suggestion'], 'precompile')
+    nose.tools.eq_(report['tree'][common]['includes'][os.path.join(temp_dir, 'detail.h')]['count'], 2)
+    nose.tools.eq_(report['tree'][common]['time'], 1.)
+  finally:
+    shutil.rmtree(temp_dir)
+
+
+def test_analyzer_relative():
+  compiler = find_executable('g++') or find_executable('clang++')
+  if compiler is None: return
+
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  cwd = os.getcwd()
+  try:
+    os.makedirs(os.path.join(temp_dir, 'pkg'))
+    _write(os.path.join(temp_dir, 'pkg', 'local.h'), '#pragma once\nint local();\n')
+    _write(os.path.join(temp_dir, 'a.cpp'), '#include "pkg/local.h"\n')
+
+    # the source and the include directory are relative, as in a setup.py
+    os.chdir(temp_dir)
+    analyzer = IncludeAnalyzer(os.path.join(temp_dir, 'includes'))
+    analyzer.analyze([compiler, '-c'], 'a.cpp', ['-I.'])
+    os.chdir(cwd)
+
+    local = os.path.join(os.path.realpath(temp_dir), 'pkg', 'local.h')
+    nose.tools.eq_([os.path.realpath(k) for k in analyzer.units['a.cpp']['includes'][None]], [local])
+    times = analyzer.header_times()
+    nose.tools.eq_([os.path.realpath(k) for k in times], [local])
+    assert list(times.values())[0] is not None
+  finally:
+    os.chdir(cwd)
+    shutil.rmtree(temp_dir)
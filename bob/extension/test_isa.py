@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Mon 19 Oct 2026 16:22:40 CEST
+
+"""Tests for the builds for several micro-architecture levels
+"""
+
+import os
+import tempfile
+import platform
+import nose.tools
+
+import bob.extension
+from .isa import levels, flags, variant_name, cpu_features, supported_levels, is_x86_64
+
+
+def _environ(name, value):
+  old = os.environ.get(name)
+  if value is None: os.environ.pop(name, None)
+  else: os.environ[name] = value
+  return old
+
+
+def test_levels():
+  if not is_x86_64():
+    nose.tools.eq_(levels(['v1', 'v3']), [])
+    return
+  nose.tools.eq_(levels(None), [])
+  nose.tools.eq_(levels(['v4', 'v1']), ['v1', 'v4'])
+  nose.tools.eq_(levels('v1, v2'), ['v1', 'v2'])
+  # the original extension is always built for the baseline
+  nose.tools.eq_(levels(['v3', 'v4']), ['v1', 'v3', 'v4'])
+  nose.tools.assert_raises(ValueError, levels, ['v5'])
+
+  old = _environ('BOB_BUILD_ISA', None)
+  try:
+    nose.tools.eq_(levels(True), ['v1', 'v3', 'v4'])
+    os.environ['BOB_BUILD_ISA'] = 'v1,v2'
+    nose.tools.eq_(levels(True), ['v1', 'v2'])
+  finally:
+    _environ('BOB_BUILD_ISA', old)
+
+
+def test_flags():
+  nose.tools.eq_(flags('v1'), [])
+  assert '-msse4.2' in flags('v2')
+  assert '-mavx2' not in flags('v2')
+  assert '-msse4.2' in flags('v3') and '-mavx2' in flags('v3') and '-mfma' in flags('v3')
+  assert '-mavx512f' in flags('v4') and '-mavx2' in flags('v4')
+  nose.tools.eq_(variant_name('bob.core._library', 'v3'), 'bob.core._library_v3')
+
+
+def test_supported_levels():
+  v3 = set('fpu sse2 cx16 lahf_lm popcnt pni ssse3 sse4_1 sse4_2 avx avx2 bmi1 bmi2 f16c fma abm movbe xsave'.split())
+  old = _environ('BOB_ISA_LEVEL', None)
+  try:
+    nose.tools.eq_(supported_levels(set(['sse2'])), ['v1'])
+    nose.tools.eq_(supported_levels(v3), ['v3', 'v2', 'v1'])
+    nose.tools.eq_(supported_levels(v3 | set(['avx512f'])), ['v3', 'v2', 'v1'])
+    os.environ['BOB_ISA_LEVEL'] = 'v2'
+    nose.tools.eq_(supported_levels(v3), ['v2', 'v1'])
+    os.environ['BOB_ISA_LEVEL'] = 'v9'
+    nose.tools.assert_raises(ValueError, supported_levels, v3)
+  finally:
+    _environ('BOB_ISA_LEVEL', old)
+
+  fd, filename = tempfile.mkstemp(prefix="bob_extension_test_")
+  try:
+    with os.fdopen(fd, 'w') as f:
+      f.write('processor\t: 0\nflags\t\t: fpu sse2 avx2\n\nprocessor\t: 1\nflags\t\t: fpu sse2 avx2\n')
+    nose.tools.eq_(cpu_features(filename), set(['fpu', 'sse2', 'avx2']))
+  finally:
+    os.remove(filename)
+  nose.tools.eq_(cpu_features('/non/existing/cpuinfo'), None)
+
+
+def test_variants():
+  if not is_x86_64(): return
+  ext = bob.extension.Extension('bob.example._library', ['library.cpp'], version='1.0.0', isa=['v1', 'v3'])
+  variants = ext.isa_variants()
+  nose.tools.eq_([k.name for k in variants], ['bob.example._library_v3'])
+  # variants are created only once
+  assert ext.isa_variants() is variants
+  nose.tools.eq_((ext.isa_level, ext.isa_name), ('v1', None))
+  nose.tools.eq_((variants[0].isa_level, variants[0].isa_name), ('v3', 'bob.example._library'))
+  # the variant is imported under the name of the original extension
+  assert ('BOB_EXT_MODULE_NAME', '"_library"') in variants[0].define_macros
+
+  library = bob.extension.Library('bob.example.bob_example', ['library.cpp'], version='1.0.0', isa=True)
+  old = _environ('BOB_BUILD_ISA', 'v1,v4')
+  try:
+    variants = library.isa_variants()
+  finally:
+    _environ('BOB_BUILD_ISA', old)
+  nose.tools.eq_([k.c_name for k in variants], ['bob_example_v4'])
+  if platform.system() == 'Linux':
+    nose.tools.eq_(variants[0].c_soname, 'libbob_example.so')
+
+  generator = bob.extension.CMakeListsGenerator(name = 'bob_example_v4', sources = ['library.cpp'], target_directory = "test_target", soname = 'libbob_example.so')
+  contents = generator.contents(tempfile.gettempdir())
+  assert 'NO_SONAME TRUE' in contents
+  assert '-Wl,-soname,libbob_example.so' in contents
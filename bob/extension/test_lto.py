@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Mon 19 Oct 2026 10:31:18 CEST
+
+"""Tests for the link-time optimization options
+"""
+
+import os
+import nose.tools
+
+from .lto import is_enabled, flags, archiver
+
+
+def test_is_enabled():
+  nose.tools.eq_(is_enabled(True), True)
+  nose.tools.eq_(is_enabled(False), False)
+
+  old_lto = os.environ.get('BOB_BUILD_LTO')
+  try:
+    os.environ['BOB_BUILD_LTO'] = 'on'
+    nose.tools.eq_(is_enabled(None), True)
+    # the command line option has priority
+    nose.tools.eq_(is_enabled(False), False)
+    os.environ['BOB_BUILD_LTO'] = '0'
+    nose.tools.eq_(is_enabled(None), False)
+  finally:
+    if old_lto is None: del os.environ['BOB_BUILD_LTO']
+    else: os.environ['BOB_BUILD_LTO'] = old_lto
+
+
+def test_flags():
+  nose.tools.eq_(flags('/usr/bin/gcc', 4), (['-flto'], ['-flto=4']))
+  nose.tools.eq_(flags('x86_64-linux-gnu-g++', 0), (['-flto'], ['-flto=1']))
+  nose.tools.eq_(flags('clang++', 4), (['-flto=thin'], ['-flto=thin']))
+
+
+def test_archiver():
+  tools = archiver('gcc')
+  if tools is not None:
+    nose.tools.eq_([os.path.basename(k) for k in tools], ['gcc-ar', 'gcc-ranlib'])
+  nose.tools.eq_(archiver('/non/existing/compiler-that-does-not-exist'), None)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Sat 17 Oct 2026 17:40:12 CEST
+
+"""Tests for the precompiled headers
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import nose.tools
+
+import distutils.ccompiler
+import distutils.sysconfig
+
+from .pch import PrecompiledHeaders
+from .depends import DependencyDatabase
+
+
+def test_precompiled_headers():
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  old_dir = os.getcwd()
+  try:
+    os.chdir(temp_dir)
+    with open('inner.h', 'w') as f:
+      f.write('#define ANSWER 42\n')
+    with open('pch.h', 'w') as f:
+      f.write('#include <vector>\n#include "inner.h"\n')
+    with open('first.cpp', 'w') as f:
+      f.write('int first() { std::vector<int> v(ANSWER); return v.size(); }\n')
+    with open('second.cpp', 'w') as f:
+      f.write('int second() { return ANSWER; }\n')
+    # C sources do not include the (C++) header
+    with open('third.c', 'w') as f:
+      f.write('int third() { return 0; }\n')
+
+    def _compile():
+      compiler = distutils.ccompiler.new_compiler()
+      distutils.sysconfig.customize_compiler(compiler)
+      headers = PrecompiledHeaders(os.path.join('build', 'pch'))
+      headers.install(compiler)
+      database = DependencyDatabase(os.path.join('build', 'depends.json'))
+      database.install(compiler)
+      compiler.compile(['first.cpp', 'second.cpp', 'third.c'], output_dir='build', extra_postargs=headers.register('pch.h'))
+      database.save()
+      return headers, database
+
+    # the header is precompiled once for both C++ sources
+    headers, database = _compile()
+    nose.tools.eq_(headers.built, 1)
+    assert os.path.realpath('inner.h') in database.dependencies(os.path.join('build', 'second.o'))
+    assert os.path.realpath('inner.h') not in database.dependencies(os.path.join('build', 'third.o'))
+
+    # nothing changed
+    headers, database = _compile()
+    nose.tools.eq_((headers.built, database.compiled), (0, 0))
+
+    # changing a header included by the precompiled header rebuilds it and the C++ objects
+    future = time.time() + 10
+    os.utime('inner.h', (future, future))
+    headers, database = _compile()
+    nose.tools.eq_((headers.built, database.compiled), (1, 2))
+
+  finally:
+    os.chdir(old_dir)
+    shutil.rmtree(temp_dir)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Sun 18 Oct 2026 10:12:37 CEST
+
+"""Tests for the profile-guided optimization options
+"""
+
+import os
+import shutil
+import tempfile
+import nose.tools
+
+from .pgo import profile_directory, flags, profiles, is_clang
+
+
+def test_profile_directory():
+  old_directory = os.environ.get('BOB_PGO_DIRECTORY')
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    os.environ['BOB_PGO_DIRECTORY'] = temp_dir
+    nose.tools.eq_(profile_directory('bob.example', '1.0.0'), os.path.join(os.path.realpath(temp_dir), 'bob.example-1.0.0'))
+  finally:
+    if old_directory is None: del os.environ['BOB_PGO_DIRECTORY']
+    else: os.environ['BOB_PGO_DIRECTORY'] = old_directory
+    shutil.rmtree(temp_dir)
+
+
+def test_flags():
+  # both compiling and linking are instrumented
+  nose.tools.eq_(flags('generate', '/tmp/profiles', 'gcc'), (['-fprofile-generate=/tmp/profiles'], ['-fprofile-generate=/tmp/profiles']))
+
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    compile_args, link_args = flags('use', temp_dir, 'x86_64-linux-gnu-gcc')
+    assert '-fprofile-use=%s' % temp_dir in compile_args
+    nose.tools.eq_(link_args, [])
+  finally:
+    shutil.rmtree(temp_dir)
+
+  nose.tools.assert_raises(ValueError, flags, 'train', '/tmp/profiles', 'gcc')
+
+
+def test_profiles():
+  nose.tools.eq_(is_clang('/usr/bin/clang++-14'), True)
+  nose.tools.eq_(is_clang('x86_64-linux-gnu-gcc'), False)
+
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    os.makedirs(os.path.join(temp_dir, 'sub'))
+    for name in ('a.gcda', os.path.join('sub', 'b.gcda'), 'c.profraw'):
+      with open(os.path.join(temp_dir, name), 'w') as f:
+        f.write('\n')
+    # GCC objects depend on their profiles and on the directories that contain them
+    nose.tools.eq_(profiles(temp_dir, 'g++'), [temp_dir, os.path.join(temp_dir, 'a.gcda'), os.path.join(temp_dir, 'sub'), os.path.join(temp_dir, 'sub', 'b.gcda')])
+    # Clang objects on the merged profiles only
+    nose.tools.eq_(profiles(temp_dir, 'clang++'), [])
+  finally:
+    shutil.rmtree(temp_dir)
@@ -6,8 +6,9 @@
 """Tests for pkgconfig
 """
 
+import os
 import nose
-from .pkgconfig import pkgconfig, version
+from .pkgconfig import pkgconfig, version, resolve
 
 test_package = 'blitz'
 pkg_config_version = '0.0'
@@ -113,3 +114,287 @@ def test_macros():
   assert macros[1][0].find('_VERSION') > 0
   assert macros[1][1].find('"') == 0
   assert macros[1][1].rfind('"') == (len(macros[1][1]) - 1)
+
+_pc_files = {
+    'bob_test_a': """prefix=/opt/a
+libdir=${prefix}/lib
+Name: a
+Description: package a
+Version: 1.2
+Requires: bob_test_b >= 1.0, bob_test_c
+Requires.private: bob_test_d
+Cflags: -I${prefix}/include -DA=1 -I/usr/include
+Libs: -L${libdir} -la -lm -Wl,--as-needed # a comment
+Libs.private: -lpriv
+""",
+    'bob_test_b': """prefix=/opt/b
+Name: b
+Description: package b
+Version: 1.5
+Requires: bob_test_c
+Cflags: -I${prefix}/include -pthread
+Libs: -L${prefix}/lib -lb -lm -pthread
+""",
+    'bob_test_c': """Name: c
+Description: package c
+Version: 3
+Cflags: -I${pcfiledir}/include
+Libs: -lc3 -lm
+""",
+    'bob_test_d': """Name: d
+Description: package d
+Version: 4
+Cflags: -I/opt/d/include -DD
+Libs: -ld
+""",
+    }
+
+def test_native_resolver():
+  import shutil
+  import tempfile
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    for name, contents in _pc_files.items():
+      with open(os.path.join(temp_dir, name + '.pc'), 'w') as f:
+        f.write(contents)
+
+    result = resolve('bob_test_a', [temp_dir])
+    nose.tools.eq_(result['version'], '1.2')
+    nose.tools.eq_(result['cflags'], ['-I/opt/a/include', '-DA=1', '-I/opt/b/include', '-pthread', '-I%s/include' % os.path.realpath(temp_dir), '-I/opt/d/include', '-DD'])
+    nose.tools.eq_(result['libs'], ['-L/opt/a/lib', '-la', '-Wl,--as-needed', '-L/opt/b/lib', '-lb', '-pthread', '-lc3', '-lm'])
+    nose.tools.eq_(resolve('bob_test_foobarfoo', [temp_dir]), None)
+
+    # the native resolver must give the same results as pkg-config itself
+    native = pkgconfig('bob_test_a', [temp_dir])
+    assert native._record['native']
+    os.environ['BOB_DISABLE_NATIVE_PKGCONFIG'] = '1'
+    try:
+      external = pkgconfig('bob_test_a', [temp_dir])
+    finally:
+      del os.environ['BOB_DISABLE_NATIVE_PKGCONFIG']
+    assert not external._record['native']
+    nose.tools.eq_(native.version, external.version)
+    for method in ('include_directories', 'library_directories', 'libraries', 'other_libraries', 'cflags_other'):
+      nose.tools.eq_(getattr(native, method)(), getattr(external, method)())
+
+  finally:
+    shutil.rmtree(temp_dir)
+
+def test_memoized_queries():
+  import importlib
+  module = importlib.import_module('bob.extension.pkgconfig')
+  calls = []
+  _call_pkgconfig = module.call_pkgconfig
+  def _counting_call(cmd, paths=None):
+    calls.append(cmd)
+    return _call_pkgconfig(cmd, paths)
+
+  os.environ['BOB_DISABLE_NATIVE_PKGCONFIG'] = '1'
+  module.call_pkgconfig = _counting_call
+  try:
+    module._queries.clear()
+    first = module.query(test_package)
+    count = len(calls)
+    # one call for each of --modversion, --cflags and --libs
+    assert count <= 3
+    second = module.query(test_package)
+    assert first is second
+    nose.tools.eq_(len(calls), count)
+  finally:
+    module.call_pkgconfig = _call_pkgconfig
+    del os.environ['BOB_DISABLE_NATIVE_PKGCONFIG']
+
+def test_memoized_executable():
+  import importlib
+  module = importlib.import_module('bob.extension.pkgconfig')
+  _path = os.environ.get('PATH', '')
+  try:
+    module._executables.clear()
+    first = module._pkg_config_executable()
+    assert module._pkg_config_executable() is first
+    # the program is searched for again when the PATH changes
+    os.environ['PATH'] = os.pathsep.join(['/nonexistent', _path])
+    module._pkg_config_executable()
+    nose.tools.eq_(len(module._executables), 2)
+  finally:
+    os.environ['PATH'] = _path
+
+def test_check_packages():
+  import shutil
+  import tempfile
+  from . import check_packages
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  _path = os.environ.get('PKG_CONFIG_PATH')
+  try:
+    for name, contents in _pc_files.items():
+      with open(os.path.join(temp_dir, name + '.pc'), 'w') as f:
+        f.write(contents)
+    os.environ['PKG_CONFIG_PATH'] = temp_dir
+
+    pkgs = check_packages(['bob_test_a >= 1.0', 'bob_test_c', 'bob_test_d == 4'])
+    nose.tools.eq_([p.name for p in pkgs], ['bob_test_a', 'bob_test_c', 'bob_test_d'])
+
+    # all problems are reported at once
+    try:
+      check_packages(['bob_test_a > 2', 'bob_test_b', 'bob_test_foobarfoo', 'bob_test_d < 4'])
+      assert False, "check_packages did not raise"
+    except RuntimeError as e:
+      message = str(e)
+    assert "bob_test_a version is not > `2'" in message
+    assert "bob_test_foobarfoo" in message
+    assert "bob_test_d version is not < `4'" in message
+    assert "bob_test_b" not in message
+
+  finally:
+    if _path is None: del os.environ['PKG_CONFIG_PATH']
+    else: os.environ['PKG_CONFIG_PATH'] = _path
+    shutil.rmtree(temp_dir)
+
+def test_check_packages_unexpected_error():
+  import threading
+  import bob.extension
+
+  def _broken(name):
+    raise OSError("cannot run pkg-config")
+
+  _pkgconfig = bob.extension.pkgconfig
+  threads = threading.active_count()
+  try:
+    bob.extension.pkgconfig = _broken
+    nose.tools.assert_raises(OSError, bob.extension.check_packages, ['bob_test_a', 'bob_test_b'])
+  finally:
+    bob.extension.pkgconfig = _pkgconfig
+  # the worker threads are not leaked
+  nose.tools.eq_(threading.active_count(), threads)
+
+def test_lazy_extension():
+  import shutil
+  import tempfile
+  from . import Extension
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  _path = os.environ.get('PKG_CONFIG_PATH')
+  try:
+    for name, contents in _pc_files.items():
+      with open(os.path.join(temp_dir, name + '.pc'), 'w') as f:
+        f.write(contents)
+
+    # packages are not searched for on construction
+    ext = Extension('bob.test._lazy', ['lazy.cpp'], packages=['bob_test_d'], include_dirs=[temp_dir], version='1.0')
+    nose.tools.eq_(ext._configured, False)
+
+    # ... but on first access to the compilation parameters
+    os.environ['PKG_CONFIG_PATH'] = temp_dir
+    nose.tools.eq_(ext.include_dirs[0], os.path.realpath(temp_dir))
+    nose.tools.eq_(ext._configured, True)
+    nose.tools.eq_(ext.pkg_includes, ['/opt/d/include'])
+    assert ('HAVE_BOB_TEST_D', '1') in ext.define_macros
+    assert ('BOB_EXT_MODULE_VERSION', '"1.0"') in ext.define_macros
+    nose.tools.eq_(ext.libraries, ['d'])
+
+  finally:
+    if _path is None: del os.environ['PKG_CONFIG_PATH']
+    else: os.environ['PKG_CONFIG_PATH'] = _path
+    shutil.rmtree(temp_dir)
+
+def test_lazy_extension_failure():
+  import shutil
+  import tempfile
+  from . import Extension
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  _path = os.environ.get('PKG_CONFIG_PATH')
+  try:
+    ext = Extension('bob.test._lazy', ['lazy.cpp'], packages=['bob_test_d'])
+
+    with open(os.path.join(temp_dir, 'bob_test_d.pc'), 'w') as f:
+      f.write(_pc_files['bob_test_d'])
+
+    # a failed search leaves the extension unconfigured ...
+    os.environ['PKG_CONFIG_PATH'] = os.path.join(temp_dir, 'missing')
+    nose.tools.assert_raises(RuntimeError, lambda: ext.include_dirs)
+    nose.tools.eq_(ext._configured, False)
+
+    # ... so that it is repeated on the next access
+    os.environ['PKG_CONFIG_PATH'] = temp_dir
+    nose.tools.eq_(ext.libraries, ['d'])
+    nose.tools.eq_(ext._configured, True)
+
+  finally:
+    if _path is None: del os.environ['PKG_CONFIG_PATH']
+    else: os.environ['PKG_CONFIG_PATH'] = _path
+    shutil.rmtree(temp_dir)
+
+def test_resolution_context():
+  import shutil
+  import tempfile
+  from . import Extension, resolution_context, probe_statistics
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  _path = os.environ.get('PKG_CONFIG_PATH')
+  try:
+    for name, contents in _pc_files.items():
+      with open(os.path.join(temp_dir, name + '.pc'), 'w') as f:
+        f.write(contents)
+    os.environ['PKG_CONFIG_PATH'] = temp_dir
+
+    resolution_context.clear()
+    first = Extension('bob.test._first', ['first.cpp'], packages=['bob_test_c', 'bob_test_d'])
+    nose.tools.eq_(first.libraries, ['c3', 'm', 'd'])
+    nose.tools.eq_(resolution_context.misses, 2)
+
+    # identical specifications are resolved only once
+    before = probe_statistics.snapshot()
+    second = Extension('bob.test._second', ['second.cpp'], packages=['bob_test_c', 'bob_test_d'])
+    nose.tools.eq_(second.libraries, ['c3', 'm', 'd'])
+    nose.tools.eq_(resolution_context.misses, 2)
+    nose.tools.eq_(resolution_context.hits, 2)
+    nose.tools.eq_(probe_statistics.subprocesses, before['subprocesses'])
+
+    # results are not shared between extensions
+    second.libraries.append('foo')
+    nose.tools.eq_(first.libraries, ['c3', 'm', 'd'])
+
+    # resolutions are reported by what they look for, without the PATH
+    from .telemetry import build_telemetry
+    resolution_context.program('bob_test_foobarfoo')
+    names = [k['name'] for k in build_telemetry.records if k['phase'] == 'resolve']
+    assert 'packages bob_test_c bob_test_d' in names
+    assert 'program bob_test_foobarfoo' in names
+
+  finally:
+    if _path is None: del os.environ['PKG_CONFIG_PATH']
+    else: os.environ['PKG_CONFIG_PATH'] = _path
+    shutil.rmtree(temp_dir)
+
+def test_resolution_context_concurrency():
+  import threading
+  from . import ResolutionContext
+  context = ResolutionContext()
+  started = threading.Event()
+  release = threading.Event()
+
+  def _slow():
+    started.set()
+    release.wait(10)
+    return 'slow'
+
+  results = []
+  threads = [threading.Thread(target=lambda: results.append(context._memoize(('slow', 'a'), _slow))) for k in range(2)]
+  threads[0].start()
+  started.wait(10)
+  threads[1].start()
+  try:
+    # other keys are resolved while the first one is still being resolved
+    nose.tools.eq_(context._memoize(('fast', 'b'), lambda: 'fast'), 'fast')
+    assert threads[0].is_alive()
+  finally:
+    release.set()
+    for thread in threads: thread.join()
+
+  # ... and the same key only once
+  nose.tools.eq_(results, ['slow', 'slow'])
+  nose.tools.eq_((context.misses, context.hits), (2, 1))
+
+  # failed resolutions are repeated
+  def _fail():
+    raise RuntimeError('not found')
+  nose.tools.assert_raises(RuntimeError, context._memoize, ('fail', 'c'), _fail)
+  nose.tools.eq_(context._memoize(('fail', 'c'), lambda: 'found'), 'found')
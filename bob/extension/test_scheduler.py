@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Sat 17 Oct 2026 09:21:16 CEST
+
+"""Tests for the parallel job scheduling
+"""
+
+import os
+import time
+import threading
+import nose.tools
+
+from .scheduler import JobServer, TokenPool, parent_jobs, JobHistory, MemoryBudget, DEFAULT_ESTIMATE, DEFAULT_SECONDS_PER_BYTE, memory_budget, run_parallel, run_graph
+
+
+def test_run_parallel():
+  pool = TokenPool(4)
+  nose.tools.eq_(run_parallel(lambda x: x * x, range(10), pool), [x * x for x in range(10)])
+
+  # at most 'jobs' calls run at the same time
+  running = [0, 0]
+  lock = threading.Lock()
+  def _job(x):
+    with lock:
+      running[0] += 1
+      running[1] = max(running)
+    time.sleep(0.01)
+    with lock: running[0] -= 1
+  run_parallel(_job, range(20), TokenPool(3))
+  nose.tools.eq_(running[1], 3)
+
+
+def test_run_parallel_errors():
+  def _job(x):
+    # the last item fails first
+    time.sleep(0.01 * (10 - x))
+    if x % 3 == 1: raise ValueError(x)
+    return x
+
+  try:
+    run_parallel(_job, range(10), TokenPool(10))
+    assert False, "run_parallel did not raise"
+  except ValueError as e:
+    nose.tools.eq_(e.args, (1,))
+    nose.tools.eq_([k[0] for k in e.errors], [1, 4, 7])
+
+
+def test_jobserver():
+  nose.tools.eq_(JobServer.from_environment({'MAKEFLAGS': '-k'}), None)
+
+  read_fd, write_fd = os.pipe()
+  try:
+    jobserver = JobServer.from_environment({'MAKEFLAGS': ' -j3 --jobserver-auth=%d,%d' % (read_fd, write_fd)})
+    nose.tools.eq_((jobserver.read_fd, jobserver.write_fd), (read_fd, write_fd))
+
+    # make -j3 puts 2 tokens into the pipe; the first job needs none
+    os.write(write_fd, b'++')
+    pool = TokenPool(8, jobserver)
+    tokens = [pool.acquire() for k in range(3)]
+    nose.tools.eq_(tokens, [None, b'+', b'+'])
+    for token in tokens: pool.release(token)
+    nose.tools.eq_(os.read(read_fd, 10), b'++')
+    nose.tools.eq_(pool.make_arguments(), ([], (read_fd, write_fd), {}))
+    # build tools that do not support the jobserver get the number of jobs
+    nose.tools.eq_(pool.make_arguments(False), (['-j8'], (), {}))
+
+  finally:
+    os.close(read_fd)
+    os.close(write_fd)
+
+  nose.tools.eq_(TokenPool(5).make_arguments(), (['-j5'], (), {}))
+
+  # a jobserver of this process is announced to its children
+  jobserver = JobServer.create(3)
+  try:
+    nose.tools.eq_(os.read(jobserver.read_fd, 10), b'++')
+    environ = TokenPool(3, jobserver).make_arguments()[2]
+    nose.tools.eq_(JobServer.from_environment(environ).read_fd, jobserver.read_fd)
+  finally:
+    jobserver.close()
+  assert not os.path.exists(jobserver.fifo)
+
+
+def test_jobserver_fifo():
+  jobserver = JobServer.create(2)
+  try:
+    # ninja only understands the path of the named pipe
+    pool = TokenPool(2, jobserver)
+    nose.tools.eq_(pool.make_arguments(fifo=True), ([], (), {'MAKEFLAGS': ' -j --jobserver-auth=fifo:%s' % jobserver.fifo}))
+    other = JobServer.from_environment(pool.make_arguments(fifo=True)[2])
+    try:
+      nose.tools.eq_(other.acquire(), b'+')
+      nose.tools.eq_(jobserver.acquire(block=False), None)
+      other.release(b'+')
+    finally:
+      os.close(other.read_fd)
+    nose.tools.eq_(jobserver.acquire(block=False), b'+')
+  finally:
+    jobserver.close()
+
+
+def test_acquire_many():
+  # the parent make holds less tokens than the jobs asked for
+  read_fd, write_fd = os.pipe()
+  try:
+    os.write(write_fd, b'+')
+    pool = TokenPool(4, JobServer(read_fd, write_fd))
+    tokens = pool.acquire_many(4)
+    nose.tools.eq_(tokens, [None, b'+'])
+    nose.tools.eq_(pool.make_arguments(False, jobs=len(tokens)), (['-j2'], (), {}))
+    for token in tokens: pool.release(token)
+    nose.tools.eq_(os.read(read_fd, 10), b'+')
+  finally:
+    os.close(read_fd)
+    os.close(write_fd)
+
+  # without jobserver, only the free slots are taken
+  pool = TokenPool(3)
+  token = pool.acquire()
+  nose.tools.eq_(pool.acquire_many(3), [None, None])
+  pool.release(token)
+
+
+def test_parent_jobs():
+  nose.tools.eq_(parent_jobs({'MAKEFLAGS': ' -j6 --jobserver-auth=3,4'}), 6)
+  nose.tools.eq_(parent_jobs({'MAKEFLAGS': ' -j --jobserver-fds=3,4'}), None)
+  nose.tools.eq_(parent_jobs({'MAKEFLAGS': ' -j6'}), None)
+
+
+def test_run_graph():
+  # 'c' requires 'a', 'd' requires 'b' and 'c'
+  requires = {'a': [], 'b': [], 'c': ['a'], 'd': ['b', 'c'], 'e': []}
+  finished = []
+  lock = threading.Lock()
+  def _job(item):
+    time.sleep(0.01)
+    with lock:
+      assert all(k in finished for k in requires[item])
+      finished.append(item)
+  run_graph(_job, sorted(requires), requires.get, 3)
+  nose.tools.eq_(sorted(finished), sorted(requires))
+
+  # items requiring failed items are skipped
+  del finished[:]
+  def _fail(item):
+    if item in ('a', 'e'): raise ValueError(item)
+    with lock: finished.append(item)
+  try:
+    run_graph(_fail, sorted(requires), requires.get, 3)
+    assert False, "run_graph did not raise"
+  except ValueError as e:
+    nose.tools.eq_([k[0] for k in e.errors], ['a', 'e'])
+  nose.tools.eq_(finished, ['b'])
+
+
+def test_memory_budget():
+  nose.tools.eq_(memory_budget({'BOB_BUILD_MEMORY': '2G'}), 2 * 1024**3)
+  nose.tools.eq_(memory_budget({'BOB_BUILD_MEMORY': 'off'}), None)
+  nose.tools.eq_(memory_budget({'BOB_BUILD_MEMORY': '0'}), None)
+
+  budget = MemoryBudget(1000)
+  nose.tools.eq_(budget.history.peak_rss('a.o'), DEFAULT_ESTIMATE)
+
+  # jobs exceeding the budget wait until the others finish
+  running = []
+  maximum = []
+  lock = threading.Lock()
+  def _job(key):
+    with lock:
+      running.append(key)
+      maximum.append(len(running))
+    time.sleep(0.05)
+    with lock:
+      running.remove(key)
+
+  for key in ('a.o', 'b.o', 'c.o', 'd.o'): budget.history.record(key, peak_rss=400)
+  run_parallel(lambda key: budget.run(key, _job, key), ['a.o', 'b.o', 'c.o', 'd.o'], TokenPool(4))
+  nose.tools.eq_(max(maximum), 2)
+  nose.tools.eq_(budget.used, 0)
+  assert budget.held_back >= 2
+
+  # jobs waiting for memory do not hold tokens of the pool
+  pool = TokenPool(4)
+  free = []
+  def _held(key):
+    with lock: free.append(pool._free)
+    time.sleep(0.05)
+  run_parallel(_held, ['a.o', 'b.o', 'c.o', 'd.o'], pool, reserve=budget.admit)
+  nose.tools.eq_(min(free), 2)
+  nose.tools.eq_(budget.used, 0)
+  nose.tools.eq_(pool._free, 4)
+
+  # a single job always runs
+  budget.history.record('huge.o', peak_rss=10**9)
+  nose.tools.eq_(budget.run('huge.o', lambda: 42), 42)
+
+
+def test_job_history():
+  import tempfile, shutil
+  temp_dir = tempfile.mkdtemp(prefix="bobtest_")
+  try:
+    filename = os.path.join(temp_dir, 'build', 'history.json')
+    # the measured duration and peak memory (in KiB) of each job are kept
+    usage = iter([None, (2., 100), None, (4., 300), None, None])
+    history = JobHistory(filename, lambda: next(usage))
+    history.record('a.o', size=1000)
+    history.run('a.o', lambda: None)
+    history.run('b.o', lambda: None)
+    # jobs that started no process (e.g., up to date) are not recorded
+    history.run('c.o', lambda: None)
+    history.save()
+
+    history = JobHistory(filename)
+    nose.tools.eq_(history.peak_rss('a.o'), 100 * 1024)
+    nose.tools.eq_(history.peak_rss('b.o'), 300 * 1024)
+    nose.tools.eq_(history.duration('b.o'), 4.)
+    # unknown jobs are estimated with the mean memory, and with the time per byte of source
+    nose.tools.eq_(history.peak_rss('c.o'), 200 * 1024)
+    nose.tools.eq_(history.duration('c.o', 500), 1.)
+    nose.tools.eq_(JobHistory().duration('c.o', 500), 500 * DEFAULT_SECONDS_PER_BYTE)
+  finally:
+    shutil.rmtree(temp_dir)
+
+
+def test_priority():
+  # the items with the highest priority start first
+  started = []
+  run_parallel(started.append, [1, 5, 3, 4], TokenPool(1), priority=lambda x: x)
+  nose.tools.eq_(started, [5, 4, 3, 1])
+
+  started = []
+  nose.tools.eq_(run_parallel(lambda x: started.append(x) or x, [1, 5, 3], TokenPool(2), priority=lambda x: x), [1, 5, 3])
+  nose.tools.eq_(started[0], 5)
+
+  started = []
+  run_graph(started.append, ['a', 'b', 'c', 'd'], lambda x: ['a'] if x == 'd' else [], 1, priority=lambda x: 'dcba'.index(x) if x != 'a' else 0)
+  nose.tools.eq_(started[:3], ['b', 'c', 'a'])
+
+  # waiting jobs of a shared pool are served by priority
+  pool = TokenPool(1)
+  token = pool.acquire()
+  order = []
+  def _wait(priority):
+    pool.release(pool.acquire(priority))
+    order.append(priority)
+  threads = []
+  for priority in (1, 3, 2):
+    threads.append(threading.Thread(target=_wait, args=(priority,)))
+    threads[-1].start()
+    time.sleep(0.05)
+  pool.release(token)
+  for thread in threads: thread.join()
+  nose.tools.eq_(order, [3, 2, 1])
@@ -46,3 +46,38 @@ def test_new_version():
 
   finally:
     sys.stdout, sys.stderr = _stdout, _stderr
+
+
+def test_pgo():
+  # Tests the bin/bob_pgo.py script
+
+  from bob.extension.scripts import pgo
+  import tempfile, shutil
+
+  _stdout, _stderr = sys.stdout, sys.stderr
+  old_dir = os.getcwd()
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    os.chdir(temp_dir)
+    # the script must be run next to the setup.py
+    nose.tools.assert_raises(IOError, pgo, ['--dry-run', '--steps', 'use'])
+    open('setup.py', 'w').close()
+
+    import io
+    output = io.StringIO() if sys.version_info[0] >= 3 else io.BytesIO()
+    sys.stdout = output
+    pgo(['--dry-run', '--train', 'nosetests -sv bob.example', '--python', 'python', '--build-options=-j4'])
+    commands = [line[3:] for line in output.getvalue().split('\n') if line.startswith(' - ')]
+    nose.tools.eq_(commands, [
+      'python setup.py build_ext --inplace --force --pgo=generate -j4',
+      'nosetests -sv bob.example',
+      'python setup.py build_ext --inplace --force --pgo=use -j4',
+    ])
+
+    # training requires a command
+    nose.tools.assert_raises(ValueError, pgo, ['--dry-run'])
+
+  finally:
+    sys.stdout, sys.stderr = _stdout, _stderr
+    os.chdir(old_dir)
+    shutil.rmtree(temp_dir)
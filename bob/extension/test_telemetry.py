@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tue 20 Oct 2026 11:02:57 CEST
+
+"""Tests for the build telemetry
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import nose.tools
+
+from .telemetry import Telemetry, run, classify, ninja_records, slowest, critical_path, totals, aggregate
+
+
+def test_classify():
+  nose.tools.eq_(classify(['gcc', '-fPIC', '-c', 'bob/example/main.cpp', '-o', 'build/main.o']), ('compile', 'bob/example/main.cpp'))
+  nose.tools.eq_(classify(['g++', '-shared', 'build/main.o', '-o', 'build/_library.so']), ('link', 'build/_library.so'))
+  nose.tools.eq_(classify(['gcc', '-c', '-x', 'c++-header', 'pch/key/header.h', '-o', 'pch/key/header.h.gch']), ('pch', 'pch/key/header.h.gch'))
+
+
+def test_run():
+  status, rss = run([sys.executable, '-c', 'import sys; sys.exit(3)'])
+  nose.tools.eq_(status, 3)
+  if hasattr(os, 'wait4'):
+    assert rss > 0
+
+
+def test_report():
+  telemetry = Telemetry()
+  telemetry.record('resolve', 'packages zlib', 100., 101.)
+  telemetry.record('compile', 'a.cpp', 101., 105., 1000, output='build/a.o')
+  telemetry.record('compile', 'b.cpp', 101., 102., 2000, output='build/b.o')
+  telemetry.record('link', 'build/_a.so', 105., 106., output='build/_a.so')
+  telemetry.record('link', 'build/_b.so', 102., 103., output='build/_b.so')
+  with telemetry.measure('extension', 'bob.example._a', 'bob.example._a'):
+    pass
+  telemetry.set_owner(['build/a.o', 'build/_a.so'], 'bob.example._a')
+
+  report = telemetry.report('bob.example', '1.0.0')
+  nose.tools.eq_(report['package'], 'bob.example')
+  nose.tools.eq_(report['start'], 100.)
+  nose.tools.eq_(report['records'][0]['name'], 'packages zlib')
+  nose.tools.eq_([k['extension'] for k in report['records'] if k['phase'] == 'compile'], ['bob.example._a', None])
+
+  nose.tools.eq_([k['name'] for k in slowest(report, 1)], ['a.cpp'])
+  nose.tools.eq_(totals(report)['compile'], 5.)
+  # the chain of steps that ended last
+  nose.tools.eq_([k['name'] for k in critical_path(report)], ['packages zlib', 'a.cpp', 'build/_a.so'])
+
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    telemetry.save(os.path.join(temp_dir, 'a', 'report.json'), 'bob.example', '1.0.0')
+    other = Telemetry()
+    other.record('compile', 'c.cpp', 90., 91.)
+    other.save(os.path.join(temp_dir, 'b', 'report.json'), 'bob.other', '2.0.0')
+    records = aggregate([os.path.join(temp_dir, k, 'report.json') for k in ('a', 'b')])
+    nose.tools.eq_([(k['package'], k['name'], k['start']) for k in records[:2]], [('bob.other', 'c.cpp', 0.), ('bob.example', 'packages zlib', 10.)])
+
+    # ninja appends the steps of each build to its log
+    log_file = os.path.join(temp_dir, '.ninja_log')
+    with open(log_file, 'w') as f:
+      f.write('# ninja log v5\n0\t100\t0\tCMakeFiles/old.dir/old.cpp.o\t1234\n')
+    offset = os.path.getsize(log_file)
+    with open(log_file, 'a') as f:
+      f.write('5\t1500\t0\tCMakeFiles/lib.dir/lib.cpp.o\t5678\n')
+    nose.tools.eq_(ninja_records(log_file, offset, 10.), [('CMakeFiles/lib.dir/lib.cpp.o', 10.005, 11.5)])
+  finally:
+    shutil.rmtree(temp_dir)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Sat 17 Oct 2026 15:02:44 CEST
+
+"""Tests for the unity (jumbo) builds
+"""
+
+import os
+import shutil
+import tempfile
+import nose.tools
+
+import bob.extension
+from .unity import batches_per_core, batch_count, internal_symbols, plan, write_batches
+
+
+def _write(filename, contents):
+  with open(filename, 'w') as f:
+    f.write(contents)
+
+
+def test_batches_per_core():
+  nose.tools.eq_(batches_per_core(False), None)
+  nose.tools.eq_(batches_per_core(True), 1.)
+  nose.tools.eq_(batches_per_core(0.5), 0.5)
+  nose.tools.eq_(batch_count(2, 4), 8)
+  nose.tools.eq_(batch_count(0.1, 4), 1)
+
+  old_unity = os.environ.get('BOB_BUILD_UNITY')
+  try:
+    os.environ['BOB_BUILD_UNITY'] = 'off'
+    nose.tools.eq_(batches_per_core(None), None)
+    os.environ['BOB_BUILD_UNITY'] = '2'
+    nose.tools.eq_(batches_per_core(None), 2.)
+    # the setting of the extension has priority
+    nose.tools.eq_(batches_per_core(False), None)
+  finally:
+    if old_unity is None: del os.environ['BOB_BUILD_UNITY']
+    else: os.environ['BOB_BUILD_UNITY'] = old_unity
+
+
+def test_plan():
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    sources = [os.path.join(temp_dir, k) for k in ('a.cpp', 'b.cpp', 'c.cpp', 'd.cpp', 'e.c', 'f.cpp')]
+    _write(sources[0], '#include <Python.h>\nstatic PyObject* answer(PyObject*, PyObject*) {\n  static int calls = 0;\n}\n')
+    _write(sources[1], 'static auto answer_doc = bob::extension::FunctionDoc("answer");\n')
+    # defines 'answer' as well
+    _write(sources[2], 'static int answer = 42;\n')
+    _write(sources[3], 'static std::map<int, int> cache;\nint function() { return 0; }\n')
+    _write(sources[4], 'int c_function() { return 0; }\n')
+    _write(sources[5], 'int other() { return 0; }\n')
+
+    nose.tools.eq_(internal_symbols(sources[0]), set(['answer']))
+    nose.tools.eq_(internal_symbols(sources[1]), set(['answer_doc']))
+    nose.tools.eq_(internal_symbols(sources[3]), set(['cache']))
+
+    # macros and using declarations would leak into the following sources
+    leaking = os.path.join(temp_dir, 'leaking.cpp')
+    for contents in ('#define NO_IMPORT_ARRAY\n', '  #  undef NDEBUG\n', 'using namespace std;\n', 'using std::vector;\n'):
+      _write(leaking, contents + 'int leaking() { return 0; }\n')
+      nose.tools.eq_(internal_symbols(leaking), None)
+    _write(leaking, '#include <vector>\nint leaking() {\n  using namespace std;\n  return 0;\n}\n')
+    nose.tools.eq_(internal_symbols(leaking), set())
+
+    batches, separate = plan(sources, 2)
+    # 'c.cpp' collides with 'a.cpp'; 'e.c' is C and 'f.cpp' would be alone in its batch
+    nose.tools.eq_(batches, [[sources[0], sources[1], sources[3]]])
+    nose.tools.eq_(separate, [sources[2], sources[4], sources[5]])
+
+    filenames = write_batches(os.path.join(temp_dir, 'unity'), 'test', batches)
+    nose.tools.eq_(filenames, [os.path.join(temp_dir, 'unity', 'test_unity_0.cpp')])
+    lines = [line.strip() for line in open(filenames[0]) if line.startswith('#include')]
+    nose.tools.eq_(lines, ['#include "%s"' % os.path.realpath(k) for k in batches[0]])
+
+    # unchanged batches are not written again
+    past = os.path.getmtime(filenames[0]) - 10
+    os.utime(filenames[0], (past, past))
+    write_batches(os.path.join(temp_dir, 'unity'), 'test', batches)
+    nose.tools.eq_(os.path.getmtime(filenames[0]), past)
+  finally:
+    shutil.rmtree(temp_dir)
+
+
+def test_cmake_unity():
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  try:
+    for name in ('a.cpp', 'b.cpp', 'c.cpp'):
+      _write(os.path.join(temp_dir, name), 'int %s() { return 0; }\n' % name[0])
+    generator = bob.extension.CMakeListsGenerator(
+      name = 'bob_unity_test',
+      sources = ['a.cpp', 'b.cpp', 'c.cpp'],
+      target_directory = "test_target",
+      unity_batches = 1
+    )
+    generator.generate(temp_dir, temp_dir)
+
+    contents = open(os.path.join(temp_dir, 'CMakeLists.txt')).read()
+    assert os.path.join(os.path.realpath(temp_dir), 'bob_unity_test_unity_0.cpp') in contents
+    assert os.path.join(os.path.realpath(temp_dir), 'a.cpp') not in contents
+  finally:
+    shutil.rmtree(temp_dir)
@@ -11,7 +11,8 @@ import sys
 import nose.tools
 from nose.plugins.skip import SkipTest
 from .utils import uniq, egrep, find_file, find_header, find_library, \
-    load_requirements, find_packages, link_documentation
+    load_requirements, find_packages, link_documentation, directory_index, \
+    ProbeCache, _probe_cache
 
 def test_uniq():
 
@@ -27,6 +28,99 @@ def test_find_file():
 
   nose.tools.eq_(os.path.basename(f[0]), 'array.h')
 
+def test_directory_index():
+
+  import shutil
+  import tempfile
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+
+  try:
+    os.makedirs(os.path.join(temp_dir, 'include', 'foo-1.0'))
+    open(os.path.join(temp_dir, 'include', 'foo-1.0', 'foo.h'), 'w').close()
+
+    f = find_header('foo.h', subpaths=['foo?*'], prefixes=[temp_dir])
+    nose.tools.eq_(f, [os.path.join(os.path.realpath(temp_dir), 'include', 'foo-1.0', 'foo.h')])
+    nose.tools.eq_(find_header('bar.h', prefixes=[temp_dir]), [])
+
+    # adding a file changes the directory mtime and invalidates the index
+    include_dir = os.path.join(temp_dir, 'include')
+    mtime = os.stat(include_dir).st_mtime
+    open(os.path.join(include_dir, 'bar.h'), 'w').close()
+    os.utime(include_dir, (mtime + 10, mtime + 10))
+    nose.tools.eq_(len(find_header('bar.h', prefixes=[temp_dir])), 1)
+
+    assert directory_index.exists(os.path.join(include_dir, 'bar.h'))
+    assert not directory_index.exists(os.path.join(include_dir, 'baz.h'))
+    nose.tools.eq_(directory_index.glob(os.path.join(include_dir, 'bar*')), [])
+
+  finally:
+    shutil.rmtree(temp_dir)
+
+def test_directory_index_stale_entries():
+
+  import shutil
+  import tempfile
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+
+  try:
+    # broken symbolic links do not exist
+    if hasattr(os, 'symlink'):
+      os.symlink(os.path.join(temp_dir, 'missing.h'), os.path.join(temp_dir, 'broken.h'))
+      assert not directory_index.exists(os.path.join(temp_dir, 'broken.h'))
+
+    # a file added within the same modification time tick is still seen
+    mtime = os.stat(temp_dir).st_mtime
+    assert not directory_index.exists(os.path.join(temp_dir, 'new.h'))
+    open(os.path.join(temp_dir, 'new.h'), 'w').close()
+    os.utime(temp_dir, (mtime, mtime))
+    assert directory_index.exists(os.path.join(temp_dir, 'new.h'))
+
+  finally:
+    shutil.rmtree(temp_dir)
+
+def test_probe_cache():
+
+  import shutil
+  import tempfile
+  temp_dir = tempfile.mkdtemp(prefix="bob_extension_test_")
+  _cache = os.environ.get('BOB_BUILD_CACHE')
+
+  try:
+    os.environ['BOB_BUILD_CACHE'] = os.path.join(temp_dir, 'cache')
+    prefix = os.path.join(temp_dir, 'prefix')
+    os.makedirs(os.path.join(prefix, 'include'))
+    open(os.path.join(prefix, 'include', 'foo.h'), 'w').close()
+
+    # results depending on directories that just changed are not stored
+    f = find_header('foo.h', prefixes=[prefix])
+    nose.tools.eq_(len(f), 1)
+    cache = _probe_cache()
+    assert not [k for k in cache._load() if 'foo.h' in k]
+
+    for k in (prefix, os.path.join(prefix, 'include')):
+      mtime = os.stat(k).st_mtime
+      os.utime(k, (mtime - 10, mtime - 10))
+    nose.tools.eq_(find_header('foo.h', prefixes=[prefix]), f)
+    cache.save()
+
+    # a fresh cache reads the results stored by the previous one
+    filename = os.path.join(temp_dir, 'cache', 'probes.json')
+    assert os.path.exists(filename)
+    other = ProbeCache(filename)
+    key = [k for k in other._load() if 'foo.h' in k][0]
+    nose.tools.eq_(other.get(key), f)
+
+    # modifying a searched directory invalidates the entry
+    include_dir = os.path.join(prefix, 'include')
+    mtime = os.stat(include_dir).st_mtime
+    os.utime(include_dir, (mtime + 10, mtime + 10))
+    nose.tools.eq_(other.get(key), None)
+
+  finally:
+    if _cache is None: del os.environ['BOB_BUILD_CACHE']
+    else: os.environ['BOB_BUILD_CACHE'] = _cache
+    shutil.rmtree(temp_dir)
+
 def test_find_header():
 
   f1 = find_file('array.h', subpaths=[os.path.join('include', 'blitz')])
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Sat 17 Oct 2026 15:02:44 CEST
+
+"""Merges the sources of an extension or library into a few unity (jumbo)
+batch files, so that the headers they include are parsed only once per batch
+
+A batch is a single translation unit: macros and ``using`` declarations of one
+source would apply to the sources after it. Sources that have any of those at
+file scope (e.g., ``NO_IMPORT_ARRAY`` or ``PY_ARRAY_UNIQUE_SYMBOL`` before
+including the NumPy headers) are therefore always compiled separately.
+"""
+
+import os
+import re
+import math
+
+#: The suffixes of the sources that can be merged, per language
+SOURCE_SUFFIXES = {
+    '.c': 'c',
+    '.cc': 'c++', '.cpp': 'c++', '.cxx': 'c++', '.c++': 'c++', '.C': 'c++',
+    }
+
+# definitions with internal linkage at file scope, e.g.,
+# ``static PyObject* function(...)`` or ``static auto doc = ...;``
+_static = re.compile(r'^static\s+[\w:<>,*&\s]+?[\s*&]+(\w+)\s*(?:\(|\[|=|;)', re.M)
+# preprocessor and using directives that would change the sources after them
+_leaking = re.compile(r'^(?:[ \t]*#[ \t]*(?:define|undef)\b|using\b)', re.M)
+
+
+def batches_per_core(unity):
+  """Returns the number of unity batches per core for the given ``unity``
+  setting of an extension, or ``None`` if unity builds are disabled
+
+  ``True`` means one batch per core, and a number gives the batches per core
+  directly. If ``unity`` is ``None``, the setting is taken from the
+  ``BOB_BUILD_UNITY`` environment variable, which can hold the same values.
+  """
+
+  if unity is None:
+    unity = os.environ.get('BOB_BUILD_UNITY', '').strip().lower()
+    if unity in ('', '0', 'false', 'no', 'off'): return None
+    if unity in ('true', 'yes', 'on'): return 1.
+    try:
+      unity = float(unity)
+    except ValueError:
+      raise ValueError("BOB_BUILD_UNITY should be a boolean or a number of batches per core, not `%s'" % unity)
+
+  if unity is True: return 1.
+  if not unity: return None
+  return float(unity)
+
+
+def batch_count(unity, jobs):
+  """Returns the number of unity batches for the given ``unity`` setting (see
+  :py:func:`batches_per_core`) when building with ``jobs`` parallel jobs, or
+  ``None`` if unity builds are disabled"""
+
+  per_core = batches_per_core(unity)
+  if per_core is None: return None
+  return max(1, int(round(per_core * jobs)))
+
+
+def internal_symbols(filename):
+  """Returns the names that the given source defines with internal linkage at
+  file scope
+
+  Those names cannot be defined twice in the same unity batch. The detection
+  is a heuristic: only ``static`` definitions starting at the beginning of a
+  line are found. Returns ``None`` if the file cannot be read, or if it
+  defines or undefines macros or has ``using`` declarations or directives at
+  file scope (i.e., at the beginning of a line), so that it cannot be merged
+  with other sources at all.
+  """
+
+  try:
+    with open(filename) as f:
+      contents = f.read()
+  except (IOError, OSError, UnicodeDecodeError):
+    return None
+  if _leaking.search(contents): return None
+  return set(_static.findall(contents))
+
+
+def plan(sources, batches):
+  """Distributes the given sources into at most ``batches`` unity batches
+
+  Each batch holds consecutive sources of the same language. A source that
+  defines a symbol with internal linkage (see :py:func:`internal_symbols`)
+  that a source already in its batch defines as well is sent back to separate
+  compilation, just like sources that define macros or have file-scope
+  ``using`` declarations, sources that are not C or C++ and batches that would
+  hold a single source.
+
+  Returns a list of batches (each of them a list of sources), and the list of
+  sources to be compiled separately.
+  """
+
+  mergeable = [s for s in sources if os.path.splitext(s)[1] in SOURCE_SUFFIXES]
+  size = max(1, int(math.ceil(len(mergeable) / float(max(1, batches)))))
+
+  retval = []
+  separate = [s for s in sources if s not in mergeable]
+  current, symbols, language = [], set(), None
+  for source in mergeable:
+    source_symbols = internal_symbols(source)
+    if source_symbols is None:
+      separate.append(source)
+      continue
+    if len(current) == size or SOURCE_SUFFIXES[os.path.splitext(source)[1]] != language:
+      if current: retval.append(current)
+      current, symbols, language = [], set(), SOURCE_SUFFIXES[os.path.splitext(source)[1]]
+    if source_symbols & symbols:
+      separate.append(source)
+      continue
+    current.append(source)
+    symbols |= source_symbols
+  if current: retval.append(current)
+
+  separate.extend(s for batch in retval if len(batch) == 1 for s in batch)
+  retval = [batch for batch in retval if len(batch) > 1]
+  # keeps the original order of the separate sources
+  separate = [s for s in sources if s in separate]
+  return retval, separate
+
+
+def write_batches(directory, name, batches):
+  """Writes one file per batch into the given directory, which includes all
+  sources of the batch, and returns the list of file names
+
+  The files are called ``<name>_unity_<index><suffix>``, and they are only
+  written when their contents change, so that they are not compiled again
+  unnecessarily.
+  """
+
+  if batches and not os.path.exists(directory):
+    os.makedirs(directory)
+
+  filenames = []
+  for index, batch in enumerate(batches):
+    filename = os.path.join(directory, '%s_unity_%d%s' % (name, index, os.path.splitext(batch[0])[1]))
+    contents = '// WARNING! This file is automatically generated. Do not change its contents.\n\n'
+    contents += ''.join('#include "%s"\n' % os.path.realpath(s).replace('\\', '/') for s in batch)
+
+    if os.path.exists(filename):
+      with open(filename) as f:
+        if f.read() == contents:
+          filenames.append(filename)
+          continue
+    with open(filename, 'w') as f:
+      f.write(contents)
+    filenames.append(filename)
+
+  return filenames
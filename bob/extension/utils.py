@@ -9,7 +9,17 @@ import os
 import re
 import sys
 import glob
+import json
+import atexit
+import fnmatch
 import platform
+import threading
+import time
+
+try:
+  from os import scandir as _scandir
+except ImportError: # python < 3.5
+  _scandir = None
 
 DEFAULT_PREFIXES = [
     "/opt/local",
@@ -17,6 +27,316 @@ DEFAULT_PREFIXES = [
     "/usr",
     ]
 
+class ProbeStatistics:
+  """Counts the operations issued to probe the system for dependencies
+
+  Each counter is an attribute of this object: ``stats`` counts calls to
+  :py:func:`os.stat` and directory listings, while ``subprocesses`` counts
+  external programs (such as ``pkg-config``) that were run. Counters are
+  thread-safe and may be reset with :py:meth:`clear`.
+  """
+
+  counters = ('subprocesses', 'stats')
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.clear()
+
+  def clear(self):
+    """Resets all counters to zero"""
+    with self._lock:
+      for k in self.counters: setattr(self, k, 0)
+
+  def count(self, counter, n=1):
+    """Increments the given counter by ``n``"""
+    with self._lock:
+      setattr(self, counter, getattr(self, counter) + n)
+
+  def snapshot(self):
+    """Returns a dictionary with the current value of all counters"""
+    with self._lock:
+      return dict((k, getattr(self, k)) for k in self.counters)
+
+
+#: Counts the work done by the ``find_*`` functions and pkg-config queries
+probe_statistics = ProbeStatistics()
+
+
+class DirectoryIndex:
+  """A process-wide index of directory listings used by the ``find_*`` functions
+
+  Each directory is listed once (using :py:func:`os.scandir` when available)
+  and its entries are kept in memory, so that all further queries on the same
+  directory are answered by set lookups. An entry is invalidated as soon as
+  the modification time of its directory changes, i.e., when a file is added
+  to or removed from it. Listings taken within the same second as the last
+  modification of their directory are never reused, since, on file systems
+  with coarse time stamps, a later change might not update the modification
+  time.
+  """
+
+  def __init__(self):
+    self._entries = {}
+
+  def clear(self):
+    """Forgets about all directories listed so far"""
+    self._entries = {}
+
+  def entries(self, directory, trace=None):
+    """Returns the set of names inside the given directory
+
+    Returns ``None`` if the given path does not exist or is not a directory.
+    If a ``trace`` dictionary is given, the modification time of the directory
+    (or ``None``, if it does not exist) is recorded into it.
+    """
+
+    probe_statistics.count('stats')
+    try:
+      mtime = os.stat(directory).st_mtime
+    except OSError:
+      self._entries.pop(directory, None)
+      if trace is not None: trace[directory] = None
+      return None
+
+    if trace is not None: trace[directory] = mtime
+
+    cached = self._entries.get(directory)
+    if cached is not None and cached[0] == mtime and cached[2] - mtime >= 1.0:
+      return cached[1]
+
+    probe_statistics.count('stats')
+    listed = time.time()
+    try:
+      if _scandir is not None:
+        names = frozenset(k.name for k in _scandir(directory))
+      else:
+        names = frozenset(os.listdir(directory))
+    except OSError: # not a directory or not readable
+      names = None
+
+    self._entries[directory] = (mtime, names, listed)
+    return names
+
+  def exists(self, path, trace=None):
+    """Checks if the given path exists, by looking it up in its parent
+
+    Names found in the listing are confirmed with :py:func:`os.path.exists`,
+    so that broken symbolic links are not reported as existing.
+    """
+
+    directory, name = os.path.split(os.path.normpath(path))
+    names = self.entries(directory or os.curdir, trace)
+    if names is None or name not in names: return False
+    probe_statistics.count('stats')
+    return os.path.exists(path)
+
+  def glob(self, pattern, trace=None):
+    """Resolves the given path pattern into existing directories
+
+    Globs are accepted in any component of the path and resolved with
+    :py:mod:`fnmatch`, the same way :py:func:`glob.glob` does.
+    """
+
+    pattern = os.path.normpath(pattern)
+    if not glob.has_magic(pattern):
+      return [pattern] if self.entries(pattern, trace) is not None else []
+
+    drive, rest = os.path.splitdrive(pattern)
+    if rest.startswith(os.sep):
+      current = [drive + os.sep]
+      rest = rest.lstrip(os.sep)
+    else:
+      current = [drive or os.curdir]
+
+    for component in rest.split(os.sep):
+      matches = []
+      for path in current:
+        names = self.entries(path, trace)
+        if names is None: continue
+        if glob.has_magic(component):
+          selected = sorted(fnmatch.filter([k for k in names if k[0] != '.'], component))
+        elif component in names:
+          selected = [component]
+        else:
+          selected = []
+        matches += [os.path.join(path, k) for k in selected]
+      current = matches
+
+    # only directories are of interest
+    return [k for k in current if self.entries(k, trace) is not None]
+
+
+#: The index used by all ``find_*`` functions of this module
+directory_index = DirectoryIndex()
+
+
+def cache_directory(*subdirs):
+  """Returns the directory for persistent build caches, or ``None``
+
+  Persistent caches are only used if the environment variable
+  ``BOB_BUILD_CACHE`` is set to a directory, e.g., ``~/.cache/bob.extension``.
+  The given ``subdirs`` are appended to it and the directory is created, if
+  required.
+  """
+
+  base = os.environ.get('BOB_BUILD_CACHE')
+  if not base: return None
+
+  directory = os.path.join(os.path.expanduser(base), *subdirs)
+  if not os.path.exists(directory):
+    try:
+      os.makedirs(directory)
+    except OSError: # created concurrently
+      if not os.path.isdir(directory): raise
+  return directory
+
+
+class ProbeCache:
+  """A persistent cache for the results of :py:func:`find_file`
+
+  Results are stored in a JSON file, keyed on the searched name, the subpaths,
+  the resolved prefixes and the environment. Each entry keeps the modification
+  times of all directories that were looked at, and it is only reused while
+  none of these directories have changed. Like for the
+  :py:class:`DirectoryIndex`, results depending on directories that changed
+  within a second before the probe are not stored.
+  """
+
+  def __init__(self, filename):
+    self.filename = filename
+    self._data = None
+    self._dirty = {}
+    self._registered = False
+
+  def _load(self):
+    if self._data is None:
+      self._data = {}
+      try:
+        with open(self.filename, 'rt') as f:
+          self._data = json.load(f)
+      except (IOError, OSError, ValueError):
+        pass
+    return self._data
+
+  def get(self, key):
+    """Returns the cached result for the given key, or ``None`` if it is not
+    cached or outdated"""
+
+    entry = self._load().get(key)
+    if entry is None: return None
+
+    probe_statistics.count('stats', len(entry['directories']))
+    for directory, mtime in entry['directories'].items():
+      try:
+        current = os.stat(directory).st_mtime
+      except OSError:
+        current = None
+      if current != mtime: return None
+
+    return list(entry['result'])
+
+  def set(self, key, result, directories, probed=None):
+    """Stores the result for the given key together with the modification
+    times of the ``directories`` it depends on
+
+    If given, ``probed`` is the time the directories were looked at; the
+    result is not stored if any of them changed less than a second before,
+    as later changes might not update their modification time.
+    """
+
+    if probed is not None and any(k is not None and k >= probed - 1.0 for k in directories.values()):
+      return
+
+    entry = {'result': result, 'directories': directories}
+    self._load()[key] = entry
+    if not self._registered:
+      atexit.register(self.save)
+      self._registered = True
+    self._dirty[key] = entry
+
+  def save(self):
+    """Writes new entries to disk, merging them with the current contents of
+    the cache file, which might have been updated by other processes"""
+
+    if not self._dirty: return
+    self._data = None
+    data = self._load()
+    data.update(self._dirty)
+    self._dirty = {}
+
+    tmp = '%s.%d' % (self.filename, os.getpid())
+    try:
+      with open(tmp, 'wt') as f:
+        json.dump(data, f)
+      os.rename(tmp, self.filename)
+    except (IOError, OSError):
+      pass # the cache is only an optimization
+
+
+_probe_caches = {}
+
+def _probe_cache():
+  """Returns the :py:class:`ProbeCache` in use, or ``None`` if disabled"""
+
+  directory = cache_directory()
+  if directory is None: return None
+  if directory not in _probe_caches:
+    _probe_caches[directory] = ProbeCache(os.path.join(directory, 'probes.json'))
+  return _probe_caches[directory]
+
+
+def search_prefixes(prefixes=None):
+  """Returns the list of prefixes searched by :py:func:`find_file`
+
+  The list is composed, by priority, of the paths in the environment variable
+  ``BOB_PREFIX_PATH``, the given ``prefixes``, the prefix of the current python
+  executable and the ``DEFAULT_PREFIXES`` defined in this module.
+  """
+
+  search = []
+
+  # Priority 1: the environment
+  if 'BOB_PREFIX_PATH' in os.environ:
+    search += os.environ['BOB_PREFIX_PATH'].split(os.pathsep)
+
+  # Priority 2: user passed paths
+  if prefixes:
+    search += prefixes
+
+  # Priority 3: the current system executable
+  search.append(os.path.dirname(os.path.dirname(sys.executable)))
+
+  # Priority 4: the default search prefixes
+  search += DEFAULT_PREFIXES
+
+  # Make unique to avoid searching twice
+  return uniq_paths(search)
+
+_architectures = []
+
+def _architecture():
+  """Returns (memoized) the bit architecture of the running interpreter
+
+  :py:func:`platform.architecture` may run the ``file`` program on each call,
+  so it is only called once per process.
+  """
+
+  if not _architectures:
+    probe_statistics.count('subprocesses')
+    _architectures.append(platform.architecture()[0])
+  return _architectures[0]
+
+def probe_environment():
+  """Returns the environment variables that influence dependency discovery
+
+  The result is a sorted tuple of ``(name, value)`` pairs, which is suitable
+  as part of the key of memoized lookups: ``BOB_PREFIX_PATH``,
+  ``BOB_DISABLE_NATIVE_PKGCONFIG`` and all ``PKG_CONFIG_*`` variables.
+  """
+
+  return tuple(sorted((k, v) for k, v in os.environ.items()
+    if k.startswith('PKG_CONFIG_') or k in ('BOB_PREFIX_PATH', 'BOB_DISABLE_NATIVE_PKGCONFIG')))
+
 def find_file(name, subpaths=None, prefixes=None):
   """Finds a generic file on the file system. Returns all candidates.
 
@@ -28,6 +348,11 @@ def find_file(name, subpaths=None, prefixes=None):
   search for. The environment variable has the highest priority on the search
   order. The order on the variable for each path is respected.
 
+  Directory contents are looked up in the :py:data:`directory_index`, so that
+  each searched directory is only listed once per process. If the environment
+  variable ``BOB_BUILD_CACHE`` is set, results are also stored in a
+  :py:class:`ProbeCache` and reused across processes.
+
   Parameters:
 
   name, str
@@ -48,24 +373,16 @@ def find_file(name, subpaths=None, prefixes=None):
   description.
   """
 
-  search = []
-
-  # Priority 1: the environment
-  if 'BOB_PREFIX_PATH' in os.environ:
-    search += os.environ['BOB_PREFIX_PATH'].split(os.pathsep)
-
-  # Priority 2: user passed paths
-  if prefixes:
-    search += prefixes
-
-  # Priority 3: the current system executable
-  search.append(os.path.dirname(os.path.dirname(sys.executable)))
-
-  # Priority 4: the default search prefixes
-  search += DEFAULT_PREFIXES
+  search = search_prefixes(prefixes)
 
-  # Make unique to avoid searching twice
-  search = uniq_paths(search)
+  cache = _probe_cache()
+  if cache is not None:
+    key = json.dumps([name, subpaths or [], search,
+      os.environ.get('BOB_PREFIX_PATH', ''), sys.executable])
+    retval = cache.get(key)
+    if retval is not None: return retval
+  trace = {}
+  probed = time.time()
 
   # Exhaustive combination of paths and subpaths
   if subpaths:
@@ -78,15 +395,16 @@ def find_file(name, subpaths=None, prefixes=None):
 
   # Before we do a filesystem check, filter out the unexisting paths
   tmp = []
-  for k in search: tmp += glob.glob(k)
+  for k in search: tmp += directory_index.glob(k, trace)
   search = tmp
 
   retval = []
-  candidates = []
   for path in search:
     candidate = os.path.join(path, name)
-    candidates.append(candidate)
-    if os.path.exists(candidate): retval.append(candidate)
+    if directory_index.exists(candidate, trace): retval.append(candidate)
+
+  if cache is not None:
+    cache.set(key, retval, trace, probed)
 
   return retval
 
@@ -122,7 +440,7 @@ def find_header(name, subpaths=None, prefixes=None):
 
   headerpaths = ['include']
 
-  if platform.architecture()[0] == '32bit':
+  if _architecture() == '32bit':
     headerpaths.append(os.path.join('include', 'i386-linux-gnu'))
   else:
     headerpaths.append(os.path.join('include', 'x86_64-linux-gnu'))
@@ -179,7 +497,7 @@ def find_library(name, version=None, subpaths=None, prefixes=None,
 
   libpaths = ['lib']
 
-  if platform.architecture()[0] == '32bit':
+  if _architecture() == '32bit':
     libpaths += [
         os.path.join('lib', 'i386-linux-gnu'),
         os.path.join('lib32'),
@@ -226,6 +544,17 @@ def find_library(name, version=None, subpaths=None, prefixes=None,
 
   return retval
 
+def find_program(name):
+  """Finds a program in the ``PATH``, like the shell does, or otherwise with
+  :py:func:`find_executable` (e.g., in ``BOB_PREFIX_PATH``)
+
+  Returns a list of filenames, which is empty if the program cannot be found.
+  """
+
+  from distutils.spawn import find_executable as which
+  found = which(name)
+  return [found] if found else find_executable(name)
+
 def find_executable(name, subpaths=None, prefixes=None):
   """Finds an executable on the file system. Returns all candidates.
 
@@ -258,7 +587,7 @@ def find_executable(name, subpaths=None, prefixes=None):
 
   binpaths = ['bin']
 
-  if platform.architecture()[0] == '32bit':
+  if _architecture() == '32bit':
     binpaths += [
         os.path.join('bin', 'i386-linux-gnu'),
         os.path.join('bin32'),
@@ -300,6 +629,7 @@ def uniq(seq, idfun=None):
 
 def uniq_paths(seq):
   """Uniq'fy a list of paths taking into consideration their real paths"""
+  probe_statistics.count('stats', len(seq))
   return uniq([os.path.realpath(k) for k in seq if os.path.exists(k)])
 
 def egrep(filename, expression):
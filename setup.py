@@ -39,6 +39,7 @@ setup(
       'console_scripts': [
         'bob_new_version.py = bob.extension.scripts:new_version',
         'bob_dependecy_graph.py = bob.extension.scripts:dependency_graph',
+        'bob_pgo.py = bob.extension.scripts:pgo',
       ],
     },
 